@@ -0,0 +1,44 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# Ruta de la base de datos local (se puede cambiar con la variable DB_PATH)
+RUTA_DB = os.getenv('DB_PATH', os.path.join('datos', 'bot.db'))
+
+_conexion = None
+
+
+def conectar(ruta=None):
+    """Abre una conexión SQLite en modo WAL con autocommit"""
+    ruta = ruta or RUTA_DB
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    con = sqlite3.connect(ruta, isolation_level=None, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.execute('PRAGMA busy_timeout=5000')
+    return con
+
+
+def conexion():
+    """Devuelve la conexión compartida del proceso, abriéndola si hace falta"""
+    global _conexion
+    if _conexion is None:
+        _conexion = conectar()
+    return _conexion
+
+
+@contextmanager
+def transaccion(con=None):
+    """Ejecuta un bloque dentro de una transacción (BEGIN IMMEDIATE ... COMMIT)"""
+    con = con or conexion()
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        yield con
+    except BaseException:
+        con.execute('ROLLBACK')
+        raise
+    else:
+        con.execute('COMMIT')
@@ -0,0 +1,226 @@
+import asyncio
+import csv
+import datetime
+import io
+
+import almacen
+
+# Emoji con el que se confirma la asistencia
+EMOJI_ASISTENCIA = '✅'
+# Días hacia atrás cuyos mensajes de actividad siguen aceptando reacciones
+DIAS_SEGUIMIENTO = 7
+# Cada cuánto se vuelcan a disco las reacciones recibidas
+INTERVALO_VOLCADO = 1.0
+# Días como máximo que abarca una consulta de historial
+MAX_DIAS_HISTORIAL = 366
+
+
+def dia_clave(fecha):
+    """Clave de día 'AAAA-MM-DD' de una fecha o datetime"""
+    return fecha.strftime('%Y-%m-%d')
+
+
+class RegistroAsistencia:
+    """Asistencia diaria leída en vivo de las reacciones al mensaje de actividad.
+
+    Los eventos de reacción en bruto (``on_raw_reaction_add/remove``) se
+    aplican sobre un conjunto en memoria por servidor y día y se vuelcan a
+    SQLite por lotes, sin volver a pedir la lista de reacciones a la API.
+    La tabla está indexada por (servidor, miembro, día), de modo que la
+    consulta de un miembro en un rango es una sola búsqueda por índice y
+    después cada día se comprueba en O(1).
+    """
+
+    def __init__(self, con=None):
+        self._con = con
+        self._mensajes = {}   # mensaje_id -> (guild_id, dia)
+        self._presentes = {}  # (guild_id, dia) -> set(miembro_id)
+        self._pendientes = []  # operaciones por volcar: (alta, guild_id, dia, miembro_id)
+        self._volcado = None
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        return self._con
+
+    def crear_tablas(self):
+        self.con.executescript(
+            'CREATE TABLE IF NOT EXISTS actividad_mensajes ('
+            ' mensaje_id INTEGER PRIMARY KEY,'
+            ' guild_id INTEGER NOT NULL,'
+            ' canal_id INTEGER NOT NULL,'
+            ' dia TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS actividad_mensajes_dia ON actividad_mensajes (guild_id, dia);'
+            'CREATE TABLE IF NOT EXISTS asistencia ('
+            ' guild_id INTEGER NOT NULL,'
+            ' miembro_id INTEGER NOT NULL,'
+            ' dia TEXT NOT NULL,'
+            ' PRIMARY KEY (guild_id, miembro_id, dia)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS asistencia_dia ON asistencia (guild_id, dia);'
+        )
+
+    def cargar(self, hoy):
+        """Crea las tablas y carga los mensajes de actividad recientes"""
+        self.crear_tablas()
+        desde = dia_clave(hoy - datetime.timedelta(days=DIAS_SEGUIMIENTO))
+        self._mensajes = {}
+        self._presentes = {}
+        for fila in self.con.execute('SELECT mensaje_id, guild_id, dia FROM actividad_mensajes WHERE dia >= ?', (desde,)):
+            self._mensajes[fila['mensaje_id']] = (fila['guild_id'], fila['dia'])
+            self._cargar_dia(fila['guild_id'], fila['dia'])
+
+    def _cargar_dia(self, guild_id, dia):
+        clave = (guild_id, dia)
+        if clave not in self._presentes:
+            self._presentes[clave] = {
+                fila[0] for fila in self.con.execute(
+                    'SELECT miembro_id FROM asistencia WHERE guild_id = ? AND dia = ?', (guild_id, dia)
+                )
+            }
+        return self._presentes[clave]
+
+    def guardar_mensaje(self, guild_id, canal_id, mensaje_id, dia):
+        """Guarda el mensaje de actividad de un día (sin seguirlo en este proceso)"""
+        self.con.execute(
+            'INSERT OR REPLACE INTO actividad_mensajes (mensaje_id, guild_id, canal_id, dia) VALUES (?, ?, ?, ?)',
+            (mensaje_id, guild_id, canal_id, dia),
+        )
+
+    def registrar_mensaje(self, guild_id, canal_id, mensaje_id, dia):
+        """Empieza a seguir las reacciones de un mensaje de actividad"""
+        self.guardar_mensaje(guild_id, canal_id, mensaje_id, dia)
+        self._mensajes[mensaje_id] = (guild_id, dia)
+        self._cargar_dia(guild_id, dia)
+
+    def olvidar_antiguos(self, hoy):
+        """Deja de seguir los mensajes de hace más de DIAS_SEGUIMIENTO días"""
+        limite = dia_clave(hoy - datetime.timedelta(days=DIAS_SEGUIMIENTO))
+        self._mensajes = {mensaje_id: dato for mensaje_id, dato in self._mensajes.items() if dato[1] >= limite}
+        self._presentes = {clave: presentes for clave, presentes in self._presentes.items() if clave[1] >= limite}
+
+    def mensaje_del_dia(self, guild_id, dia):
+        """(canal_id, mensaje_id) del último mensaje de actividad de ese día, o None"""
+        fila = self.con.execute(
+            'SELECT canal_id, mensaje_id FROM actividad_mensajes WHERE guild_id = ? AND dia = ? ORDER BY mensaje_id DESC LIMIT 1',
+            (guild_id, dia),
+        ).fetchone()
+        return (fila['canal_id'], fila['mensaje_id']) if fila else None
+
+    # --- Eventos de reacción ---
+
+    def reaccion(self, mensaje_id, miembro_id, emoji, alta):
+        """Aplica una reacción añadida (alta=True) o quitada; devuelve True si era de asistencia"""
+        dato = self._mensajes.get(mensaje_id)
+        if dato is None or emoji != EMOJI_ASISTENCIA:
+            return False
+        guild_id, dia = dato
+        presentes = self._cargar_dia(guild_id, dia)
+        if alta:
+            if miembro_id in presentes:
+                return True
+            presentes.add(miembro_id)
+        else:
+            if miembro_id not in presentes:
+                return True
+            presentes.discard(miembro_id)
+        self._pendientes.append((alta, guild_id, dia, miembro_id))
+        self._programar_volcado()
+        return True
+
+    def presentes(self, guild_id, dia):
+        """Conjunto de miembros que han reaccionado ese día"""
+        return set(self._cargar_dia(guild_id, dia))
+
+    # --- Volcado a disco ---
+
+    def _programar_volcado(self):
+        if self._volcado is None or self._volcado.done():
+            self._volcado = asyncio.create_task(self._volcar_tras_espera())
+
+    async def _volcar_tras_espera(self):
+        await asyncio.sleep(INTERVALO_VOLCADO)
+        self.volcar()
+
+    def volcar(self):
+        """Escribe las reacciones pendientes en una sola transacción"""
+        pendientes, self._pendientes = self._pendientes, []
+        if not pendientes:
+            return
+        with almacen.transaccion(self.con):
+            for alta, guild_id, dia, miembro_id in pendientes:
+                if alta:
+                    self.con.execute(
+                        'INSERT OR IGNORE INTO asistencia (guild_id, miembro_id, dia) VALUES (?, ?, ?)',
+                        (guild_id, miembro_id, dia),
+                    )
+                else:
+                    self.con.execute(
+                        'DELETE FROM asistencia WHERE guild_id = ? AND miembro_id = ? AND dia = ?',
+                        (guild_id, miembro_id, dia),
+                    )
+
+    # --- Consultas ---
+
+    def historial(self, guild_id, miembro_id, desde, hasta):
+        """Asistencia de un miembro entre dos fechas (incluidas).
+
+        Devuelve una lista de (fecha, estado) con estado 'presente', 'ausente'
+        o None si ese día no hubo mensaje de actividad. El rango se recorre
+        día a día, así que no puede superar ``MAX_DIAS_HISTORIAL`` días.
+        """
+        if (hasta - desde).days >= MAX_DIAS_HISTORIAL:
+            raise ValueError(f'El rango no puede superar {MAX_DIAS_HISTORIAL} días')
+        self.volcar()
+        rango = (dia_clave(desde), dia_clave(hasta))
+        dias_con_actividad = {
+            fila[0] for fila in self.con.execute(
+                'SELECT DISTINCT dia FROM actividad_mensajes WHERE guild_id = ? AND dia BETWEEN ? AND ?',
+                (guild_id, *rango),
+            )
+        }
+        dias_presente = {
+            fila[0] for fila in self.con.execute(
+                'SELECT dia FROM asistencia WHERE guild_id = ? AND miembro_id = ? AND dia BETWEEN ? AND ?',
+                (guild_id, miembro_id, *rango),
+            )
+        }
+        resultado = []
+        fecha = desde
+        while fecha <= hasta:
+            dia = dia_clave(fecha)
+            if dia not in dias_con_actividad:
+                estado = None
+            elif dia in dias_presente:
+                estado = 'presente'
+            else:
+                estado = 'ausente'
+            resultado.append((fecha, estado))
+            fecha += datetime.timedelta(days=1)
+        return resultado
+
+
+async def reactores(mensaje, emoji=EMOJI_ASISTENCIA):
+    """IDs de quienes han reaccionado con el emoji, pidiendo la lista por páginas de 100"""
+    for reaccion in mensaje.reactions:
+        if str(reaccion.emoji) == emoji:
+            return {usuario.id async for usuario in reaccion.users(limit=None)}
+    return set()
+
+
+def sin_reaccion(rol, reaccionaron):
+    """Miembros del rol (según la caché) que no están en ``reaccionaron``, ordenados por nombre"""
+    return sorted(
+        (miembro for miembro in rol.members if not miembro.bot and miembro.id not in reaccionaron),
+        key=lambda miembro: miembro.display_name.lower(),
+    )
+
+
+def csv_miembros(miembros):
+    """CSV (id, usuario, apodo) de una lista de miembros, en bytes UTF-8"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['id', 'usuario', 'apodo'])
+    for miembro in miembros:
+        escritor.writerow([miembro.id, miembro.name, miembro.nick or ''])
+    return salida.getvalue().encode('utf-8-sig')
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import datetime
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import simulador
+from simulador import ENTERO, ROL, TEXTO, USUARIO
+
+# Resultados de cada ejecución, para compararlos entre versiones
+RUTA_RESULTADOS = os.path.join('datos', 'benchmarks')
+COMANDOS = ['periodo-de-prueba', 'ascenso', 'despido', 'sancion', 'asignar-placa']
+# Rango al que se asciende en /ascenso (tiene prefijo de placa, así que también cambia el apodo)
+RANGO_ASCENSO = "🚧〴Auxiliar Vial〴"
+# Espera máxima a que la bandeja de salida publique los anuncios de una fase
+ESPERA_ANUNCIOS = 120.0
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return None
+    posicion = max(int(round(p / 100 * len(valores) + 0.5)) - 1, 0)
+    return valores[min(posicion, len(valores) - 1)]
+
+
+def opciones(sim, guild, comando, miembro_id, i):
+    """Opciones de cada comando para la petición ``i`` sobre ``miembro_id``"""
+    if comando == 'periodo-de-prueba':
+        return [('usuario', USUARIO, miembro_id), ('usuario_roblox', TEXTO, f'roblox_{i}')]
+    if comando == 'ascenso':
+        return [('usuario', USUARIO, miembro_id), ('rango', ROL, sim.rol_por_nombre(guild, RANGO_ASCENSO)['id']), ('motivo', TEXTO, 'Benchmark')]
+    if comando == 'despido':
+        return [('usuario', USUARIO, miembro_id), ('motivo', TEXTO, 'Benchmark')]
+    if comando == 'sancion':
+        return [
+            ('usuario', USUARIO, miembro_id), ('rol', ROL, sim.rol_por_nombre(guild, simulador.ROL_SANCION)['id']),
+            ('razon', TEXTO, 'Benchmark'), ('autorizado_por', USUARIO, guild['moderador']),
+        ]
+    if comando == 'asignar-placa':
+        # Un número distinto por petición (las placas van del 1 al 99)
+        return [('usuario', USUARIO, miembro_id), ('numero_placa', ENTERO, i % 99 + 1)]
+    raise ValueError(f'Comando sin opciones de benchmark: {comando}')
+
+
+def version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def esperar_anuncios(main, timeout):
+    """Espera a que la bandeja de salida quede vacía"""
+    limite = time.monotonic() + timeout
+    while main.buzon.pendientes() and time.monotonic() < limite:
+        await asyncio.sleep(0.05)
+
+
+async def fase(sim, main, guild, comando, peticiones, concurrencia):
+    """Lanza ``peticiones`` invocaciones de un comando y mide latencia, peticiones REST y 429"""
+    miembros = sim.socios(guild)
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    resultados = {'ok': 0, 'rechazado': 0, 'error': 0}
+    peticiones_antes = sim.peticiones.copy()
+    respuestas_429_antes = sim.respuestas_429
+
+    async def invocar(i):
+        async with semaforo:
+            try:
+                segundos, contenido = await sim.interaccion(guild['id'], comando, opciones(sim, guild, comando, miembros[i % len(miembros)], i))
+            except asyncio.TimeoutError:
+                resultados['error'] += 1
+                return
+            latencias.append(segundos)
+            if contenido.startswith('❌'):
+                resultados['rechazado' if 'Error' not in contenido else 'error'] += 1
+            else:
+                resultados['ok'] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(invocar(i) for i in range(peticiones)))
+    duracion = time.perf_counter() - inicio
+    # Los anuncios se publican después de responder: también cuentan como peticiones del comando
+    await esperar_anuncios(main, ESPERA_ANUNCIOS)
+
+    rutas = sim.peticiones - peticiones_antes
+    total = sum(rutas.values())
+    latencias.sort()
+    return {
+        'peticiones': peticiones,
+        **resultados,
+        'duracion_s': round(duracion, 3),
+        'por_segundo': round(peticiones / duracion, 2) if duracion else None,
+        'p50_ms': round(percentil(latencias, 50) * 1000, 1) if latencias else None,
+        'p95_ms': round(percentil(latencias, 95) * 1000, 1) if latencias else None,
+        'p99_ms': round(percentil(latencias, 99) * 1000, 1) if latencias else None,
+        'max_ms': round(latencias[-1] * 1000, 1) if latencias else None,
+        'rest_por_comando': round(total / peticiones, 2),
+        'respuestas_429': sim.respuestas_429 - respuestas_429_antes,
+        'rutas': dict(rutas.most_common()),
+    }
+
+
+async def ejecutar(args):
+    sim = simulador.Simulador(latencia=args.latencia, variacion=args.variacion, probabilidad_429=args.probabilidad_429)
+    guild = sim.crear_guild(miembros=max(args.peticiones, 1) + 10)
+    url = await sim.iniciar()
+
+    # El bot se importa con una base de datos vacía y apuntando al simulador
+    os.environ.update({
+        'DISCORD_API': url,
+        'DB_PATH': os.path.join(args.directorio_temporal, 'bot.db'),
+        'CONFIG_SERVIDORES': os.path.join(args.directorio_temporal, 'servidores.json'),
+        'SINCRONIZAR_COMANDOS': 'no',
+        'INTENT_MIEMBROS': args.intent_miembros,
+    })
+    os.environ.pop('PUERTO_METRICAS', None)
+    os.environ.pop('PORT', None)
+    import main
+
+    arranque = asyncio.create_task(main.bot.start('token-simulado'))
+    listo = asyncio.create_task(main.bot.wait_until_ready())
+    await asyncio.wait([arranque, listo], timeout=60, return_when=asyncio.FIRST_COMPLETED)
+    if not listo.done():
+        listo.cancel()
+        await sim.detener()
+        # Si el bot no llegó a conectar, su excepción explica por qué
+        raise arranque.exception() if arranque.done() and arranque.exception() else RuntimeError('El bot no se conectó al simulador')
+    while not main.buzon.activo or not main.planificador.activo:
+        await asyncio.sleep(0.05)
+
+    resultados = {}
+    try:
+        for comando in args.comandos:
+            print(f'▶ /{comando}: {args.peticiones} peticiones, concurrencia {args.concurrencia}', file=sys.stderr)
+            resultados[comando] = await fase(sim, main, guild, comando, args.peticiones, args.concurrencia)
+    finally:
+        await main.bot.close()
+        await asyncio.gather(arranque, return_exceptions=True)
+        await sim.detener()
+
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'version': version(),
+        'parametros': {
+            'peticiones': args.peticiones, 'concurrencia': args.concurrencia, 'latencia': args.latencia,
+            'variacion': args.variacion, 'probabilidad_429': args.probabilidad_429, 'intent_miembros': args.intent_miembros,
+        },
+        'no_implementadas': dict(sim.no_implementadas),
+        'comandos': resultados,
+    }
+
+
+def comparar(actual, anterior):
+    """Tabla con los resultados y la diferencia respecto a una ejecución anterior"""
+    columnas = ['p50_ms', 'p95_ms', 'p99_ms', 'rest_por_comando', 'respuestas_429']
+    lineas = [f"{'comando':<20}{'ok':>6}" + ''.join(f'{columna:>22}' for columna in columnas)]
+    for comando, datos in actual['comandos'].items():
+        previos = (anterior or {}).get('comandos', {}).get(comando, {})
+        celdas = []
+        for columna in columnas:
+            valor = datos.get(columna)
+            texto = '-' if valor is None else f'{valor:g}'
+            if previos.get(columna) is not None and valor is not None:
+                texto += f' ({valor - previos[columna]:+g})'
+            celdas.append(f'{texto:>22}')
+        lineas.append(f"{comando:<20}{datos['ok']:>6}" + ''.join(celdas))
+    return '\n'.join(lineas)
+
+
+def ultimo_resultado(directorio):
+    ficheros = sorted(glob.glob(os.path.join(directorio, 'benchmark-*.json')))
+    if not ficheros:
+        return None, None
+    with open(ficheros[-1], encoding='utf-8') as fichero:
+        return ficheros[-1], json.load(fichero)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de los comandos de RR. HH. contra el simulador local de Discord')
+    parser.add_argument('--comandos', default=','.join(COMANDOS), help='comandos separados por comas')
+    parser.add_argument('--peticiones', type=int, default=50, help='invocaciones de cada comando')
+    parser.add_argument('--concurrencia', type=int, default=10, help='invocaciones en vuelo a la vez')
+    parser.add_argument('--latencia', type=float, default=0.05, help='latencia media de cada petición REST (s)')
+    parser.add_argument('--variacion', type=float, default=0.02, help='variación máxima de la latencia (s)')
+    parser.add_argument('--probabilidad-429', type=float, default=0.0, help='probabilidad de un 429 compartido en cada petición')
+    parser.add_argument('--intent-miembros', default='no', help='estrategia INTENT_MIEMBROS del bot')
+    parser.add_argument('--salida', default=RUTA_RESULTADOS, help='directorio donde se guardan los resultados')
+    parser.add_argument('--comparar', help='fichero de resultados con el que comparar (por defecto, el último de --salida)')
+    args = parser.parse_args()
+    args.comandos = [comando.strip() for comando in args.comandos.split(',') if comando.strip()]
+
+    ruta_anterior, anterior = ultimo_resultado(args.salida)
+    if args.comparar:
+        ruta_anterior = args.comparar
+        with open(args.comparar, encoding='utf-8') as fichero:
+            anterior = json.load(fichero)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        args.directorio_temporal = directorio
+        actual = asyncio.run(ejecutar(args))
+
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(ruta, 'w', encoding='utf-8') as fichero:
+        json.dump(actual, fichero, ensure_ascii=False, indent=2)
+
+    print(comparar(actual, anterior))
+    if ruta_anterior:
+        print(f'\nDiferencias respecto a {ruta_anterior}')
+    if actual['no_implementadas']:
+        print(f"\n⚠️ Rutas que el simulador no implementa: {', '.join(actual['no_implementadas'])}")
+    print(f'Resultados guardados en {ruta}')
@@ -0,0 +1,142 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Campos estructurados que se pueden pasar con ``extra={...}``
+CAMPOS = ('guild', 'comando', 'miembro', 'latencia_ms', 'canal', 'tarea')
+
+# Como mucho LIMITE_REPETICIONES registros de la misma plantilla cada PERIODO_REPETICIONES segundos
+LIMITE_REPETICIONES = int(os.getenv('LOG_LIMITE_REPETICIONES', '10'))
+PERIODO_REPETICIONES = float(os.getenv('LOG_PERIODO_REPETICIONES', '60'))
+
+# Proceso del clúster que escribe el registro (lo fija cluster.py en cada proceso)
+PROCESO = os.getenv('CLUSTER_ID')
+
+_oyente = None
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'modulo': record.name,
+            'mensaje': record.getMessage(),
+        }
+        if PROCESO is not None:
+            datos['cluster'] = PROCESO
+        for campo in CAMPOS:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                datos[campo] = valor
+        descartados = getattr(record, 'descartados', 0)
+        if descartados:
+            datos['descartados'] = descartados
+        if record.exc_info:
+            datos['error'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class LimiteRepeticiones(logging.Filter):
+    """Limita los registros repetidos de una misma plantilla de mensaje.
+
+    Se agrupan por (módulo, plantilla sin formatear), de modo que un aviso
+    que se repite con distintos datos cuenta como el mismo. Los descartados
+    se cuentan y se informan en el siguiente registro que pase. Los errores
+    no se limitan.
+    """
+
+    def __init__(self, limite=LIMITE_REPETICIONES, periodo=PERIODO_REPETICIONES):
+        super().__init__()
+        self.limite = limite
+        self.periodo = periodo
+        self._ventanas = {}  # (modulo, plantilla) -> [inicio, emitidos, descartados]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or not self.limite:
+            return True
+        clave = (record.name, record.msg)
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self._ventanas.get(clave)
+            if ventana is None or ahora - ventana[0] >= self.periodo:
+                descartados = ventana[2] if ventana else 0
+                self._ventanas[clave] = [ahora, 1, 0]
+                if descartados:
+                    record.descartados = descartados
+                return True
+            if ventana[1] < self.limite:
+                ventana[1] += 1
+                return True
+            ventana[2] += 1
+            return False
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """Encola el registro sin formatearlo; el JSON se genera en el hilo escritor"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Se resuelve el mensaje ahora porque los argumentos pueden cambiar después
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _leer_niveles(texto):
+    """'discord=WARNING,buzon=DEBUG' -> {'discord': 'WARNING', 'buzon': 'DEBUG'}"""
+    niveles = {}
+    for parte in (texto or '').split(','):
+        if '=' in parte:
+            modulo, nivel = parte.split('=', 1)
+            niveles[modulo.strip()] = nivel.strip().upper()
+    return niveles
+
+
+def configurar(nivel=None, niveles=None):
+    """Envía todo el logging a una cola que escribe en stdout desde un hilo aparte.
+
+    ``nivel`` es el nivel raíz (por defecto LOG_NIVEL o INFO) y ``niveles`` un
+    diccionario módulo -> nivel (por defecto se lee de LOG_NIVELES).
+    """
+    global _oyente
+    if _oyente is not None:
+        return
+
+    cola = queue.SimpleQueue()
+    manejador = ManejadorCola(cola)
+    manejador.addFilter(LimiteRepeticiones())
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON())
+    _oyente = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _oyente.start()
+    atexit.register(detener)
+
+    raiz = logging.getLogger()
+    raiz.handlers = [manejador]
+    raiz.setLevel(nivel or os.getenv('LOG_NIVEL', 'INFO').upper())
+
+    # La librería de discord es muy verbosa en INFO
+    logging.getLogger('discord').setLevel(logging.WARNING)
+    for modulo, nivel_modulo in (niveles if niveles is not None else _leer_niveles(os.getenv('LOG_NIVELES'))).items():
+        logging.getLogger(modulo).setLevel(nivel_modulo)
+
+
+def detener():
+    """Vacía la cola y detiene el hilo escritor"""
+    global _oyente
+    if _oyente is not None:
+        _oyente.stop()
+        _oyente = None
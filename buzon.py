@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import discord
+
+import almacen
+
+log = logging.getLogger(__name__)
+
+PENDIENTE = 'pendiente'
+ENVIADO = 'enviado'
+FALLIDO = 'fallido'
+
+# Reintentos: espera base * 2^intentos (con jitter), hasta un máximo
+ESPERA_BASE = 2.0
+ESPERA_MAXIMA = 300.0
+MAX_INTENTOS = 10
+# Los anuncios ya enviados se conservan unos días para deduplicar
+RETENCION_ENVIADOS = 7 * 24 * 3600
+
+
+@dataclass
+class Anuncio:
+    """Mensaje pendiente de publicar en un canal"""
+    canal_id: int
+    contenido: str = None
+    embed: discord.Embed = None
+    clave: str = None
+    guild_id: int = None
+
+
+class Buzon:
+    """Bandeja de salida persistente para los anuncios en los canales.
+
+    Los anuncios se guardan en SQLite en cuanto se aplica el cambio sobre el
+    miembro y un grupo de trabajadores los publica después, reintentando con
+    espera exponencial y jitter. Lo que quede pendiente tras un reinicio se
+    vuelve a enviar al arrancar. Cada anuncio tiene una clave única, así que
+    encolar dos veces el mismo anuncio no lo duplica.
+    """
+
+    def __init__(self, bot, trabajadores=3, con=None, filtro=None, sondeo=None):
+        self.bot = bot
+        self.num_trabajadores = trabajadores
+        self._con = con
+        # filtro(guild_id) -> bool: anuncios que publica este proceso (en un clúster, los de sus shards)
+        self.filtro = filtro
+        # Espera máxima sin mirar la tabla: si otro proceso encola anuncios, este no recibe el aviso
+        self.sondeo = sondeo
+        self._tareas = []
+        self._hay_trabajo = asyncio.Event()
+        self._drenando = False
+        # Canales con un envío en vuelo: se publica en orden dentro de cada canal
+        self._canales_en_vuelo = set()
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        return self._con
+
+    def crear_tablas(self):
+        self.con.executescript(
+            'CREATE TABLE IF NOT EXISTS buzon_salida ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' clave TEXT NOT NULL UNIQUE,'
+            ' guild_id INTEGER,'
+            ' canal_id INTEGER NOT NULL,'
+            ' contenido TEXT,'
+            ' embed TEXT,'
+            ' estado TEXT NOT NULL,'
+            ' intentos INTEGER NOT NULL DEFAULT 0,'
+            ' proximo_intento REAL NOT NULL,'
+            ' error TEXT,'
+            ' mensaje_id INTEGER,'
+            ' creado REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS buzon_salida_pendientes'
+            ' ON buzon_salida (estado, canal_id, id);'
+        )
+
+    @property
+    def activo(self):
+        return any(not tarea.done() for tarea in self._tareas)
+
+    # --- Encolado ---
+
+    def encolar(self, *anuncios):
+        """Guarda los anuncios en una sola transacción; devuelve cuántos eran nuevos"""
+        ahora = time.time()
+        nuevos = 0
+        with almacen.transaccion(self.con):
+            for anuncio in anuncios:
+                cursor = self.con.execute(
+                    'INSERT OR IGNORE INTO buzon_salida'
+                    ' (clave, guild_id, canal_id, contenido, embed, estado, proximo_intento, creado)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        anuncio.clave or uuid.uuid4().hex,
+                        anuncio.guild_id,
+                        anuncio.canal_id,
+                        anuncio.contenido,
+                        json.dumps(anuncio.embed.to_dict()) if anuncio.embed else None,
+                        PENDIENTE,
+                        ahora,
+                        ahora,
+                    ),
+                )
+                nuevos += cursor.rowcount
+        if nuevos:
+            self._hay_trabajo.set()
+        return nuevos
+
+    def pendientes(self):
+        return self.con.execute('SELECT COUNT(*) FROM buzon_salida WHERE estado = ?', (PENDIENTE,)).fetchone()[0]
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        """Recupera lo pendiente de ejecuciones anteriores y arranca los trabajadores"""
+        if self.activo:
+            return
+        self.crear_tablas()
+        ahora = time.time()
+        self.con.execute('DELETE FROM buzon_salida WHERE estado != ? AND creado < ?', (PENDIENTE, ahora - RETENCION_ENVIADOS))
+        recuperados = self.con.execute(
+            'UPDATE buzon_salida SET proximo_intento = ? WHERE estado = ?', (ahora, PENDIENTE)
+        ).rowcount
+        if recuperados:
+            log.info("Recuperados %d anuncios pendientes de la bandeja de salida", recuperados)
+        self._canales_en_vuelo.clear()
+        self._drenando = False
+        self._hay_trabajo.set()
+        self._tareas = [
+            asyncio.create_task(self._trabajador(), name=f'buzon:{i}')
+            for i in range(self.num_trabajadores)
+        ]
+
+    def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        self._tareas = []
+
+    async def drenar(self, timeout):
+        """Deja de reclamar anuncios y espera a los envíos en vuelo; lo que quede sigue pendiente en la tabla"""
+        self._drenando = True
+        self._hay_trabajo.set()
+        if self._tareas:
+            await asyncio.wait(self._tareas, timeout=timeout)
+        self.detener()
+
+    # --- Trabajadores ---
+
+    def _reclamar(self):
+        """Devuelve el siguiente anuncio listo (el más antiguo de un canal libre)"""
+        ahora = time.time()
+        filas = self.con.execute(
+            'SELECT * FROM buzon_salida AS b WHERE estado = ? AND id = ('
+            ' SELECT MIN(id) FROM buzon_salida WHERE estado = ? AND canal_id = b.canal_id'
+            ') ORDER BY proximo_intento, id',
+            (PENDIENTE, PENDIENTE),
+        ).fetchall()
+        proximo = None
+        for fila in filas:
+            if fila['canal_id'] in self._canales_en_vuelo:
+                continue
+            if self.filtro is not None and not self.filtro(fila['guild_id']):
+                continue
+            if fila['proximo_intento'] <= ahora:
+                self._canales_en_vuelo.add(fila['canal_id'])
+                return fila, None
+            proximo = fila['proximo_intento'] if proximo is None else min(proximo, fila['proximo_intento'])
+        return None, proximo
+
+    async def _trabajador(self):
+        while not self._drenando:
+            try:
+                await self._siguiente()
+            except Exception as e:
+                # p. ej. "database is locked" con varios procesos sobre la misma base de datos:
+                # el anuncio sigue pendiente en la tabla y el trabajador continúa tras una pausa
+                log.exception("Error en el trabajador de la bandeja de salida: %s", e)
+                await asyncio.sleep(ESPERA_BASE)
+
+    async def _siguiente(self):
+        """Publica el siguiente anuncio listo o espera a que haya alguno"""
+        fila, proximo = self._reclamar()
+        if fila is None:
+            self._hay_trabajo.clear()
+            espera = None if proximo is None else max(proximo - time.time(), 0)
+            if self.sondeo is not None:
+                espera = self.sondeo if espera is None else min(espera, self.sondeo)
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+            return
+        try:
+            await self._publicar(fila)
+        finally:
+            self._canales_en_vuelo.discard(fila['canal_id'])
+            # Otro trabajador puede estar esperando a este canal
+            self._hay_trabajo.set()
+
+    async def _publicar(self, fila):
+        try:
+            # Sin caché de canales (proceso de trabajos) basta con el ID: no hace falta pedir el canal
+            canal = self.bot.get_channel(fila['canal_id']) or self.bot.get_partial_messageable(fila['canal_id'])
+            embed = discord.Embed.from_dict(json.loads(fila['embed'])) if fila['embed'] else None
+            mensaje = await canal.send(content=fila['contenido'], embed=embed)
+        except (discord.Forbidden, discord.NotFound) as e:
+            # Errores permanentes: reintentar no va a servir
+            self._marcar_fallido(fila, str(e))
+        except Exception as e:
+            self._reprogramar(fila, str(e))
+        else:
+            self.con.execute(
+                'UPDATE buzon_salida SET estado = ?, mensaje_id = ?, error = NULL WHERE id = ?',
+                (ENVIADO, mensaje.id, fila['id']),
+            )
+
+    def _reprogramar(self, fila, error):
+        intentos = fila['intentos'] + 1
+        if intentos >= MAX_INTENTOS:
+            self._marcar_fallido(fila, error)
+            return
+        espera = min(ESPERA_BASE * 2 ** intentos, ESPERA_MAXIMA) * random.uniform(0.5, 1.5)
+        self.con.execute(
+            'UPDATE buzon_salida SET intentos = ?, proximo_intento = ?, error = ? WHERE id = ?',
+            (intentos, time.time() + espera, error, fila['id']),
+        )
+        log.warning(
+            "Anuncio %s no enviado (intento %d), reintento en %.0fs: %s", fila['clave'], intentos, espera, error,
+            extra={'guild': fila['guild_id'], 'canal': fila['canal_id']},
+        )
+
+    def _marcar_fallido(self, fila, error):
+        self.con.execute(
+            'UPDATE buzon_salida SET estado = ?, intentos = intentos + 1, error = ? WHERE id = ?',
+            (FALLIDO, error, fila['id']),
+        )
+        log.error(
+            "Anuncio %s descartado tras %d intentos: %s", fila['clave'], fila['intentos'] + 1, error,
+            extra={'guild': fila['guild_id'], 'canal': fila['canal_id']},
+        )
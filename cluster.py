@@ -0,0 +1,456 @@
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import math
+import os
+import signal
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+import aiohttp
+import discord
+
+import metricas
+from planificador import Planificador, TareaDiaria
+
+log = logging.getLogger(__name__)
+
+# Socket Unix por el que el lanzador y los procesos del clúster se comunican
+RUTA_IPC = os.path.join('datos', 'cluster.sock')
+# Cada cuántos segundos informa cada proceso del estado de sus shards
+INTERVALO_SALUD = 10.0
+# Latidos seguidos sin noticias tras los que un proceso se da por caído
+LATIDOS_PERDIDOS = 3
+# Shards por proceso si no se indica CLUSTERS
+SHARDS_POR_CLUSTER = 4
+# Espera máxima (segundos) antes de relanzar un proceso que se ha caído
+ESPERA_REINICIO_MAXIMA = 60.0
+# Reclamación de la sincronización global de comandos (una vez por arranque del clúster)
+SINCRONIZAR_COMANDOS = 'sincronizar-comandos'
+
+_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def reparto(total, clusters):
+    """Reparte ``total`` shards en ``clusters`` rangos contiguos lo más iguales posible"""
+    clusters = max(1, min(clusters, total))
+    base, resto = divmod(total, clusters)
+    rangos = []
+    inicio = 0
+    for i in range(clusters):
+        tamano = base + (1 if i < resto else 0)
+        rangos.append(list(range(inicio, inicio + tamano)))
+        inicio += tamano
+    return rangos
+
+
+async def shards_recomendados(token):
+    """Número de shards que recomienda Discord para el bot (GET /gateway/bot)"""
+    async with aiohttp.ClientSession() as sesion:
+        async with sesion.get(f'{discord.http.Route.BASE}/gateway/bot', headers={'Authorization': f'Bot {token}'}) as respuesta:
+            respuesta.raise_for_status()
+            return (await respuesta.json())['shards']
+
+
+def _enviar(writer, mensaje):
+    writer.write(json.dumps(mensaje, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+def _segundos(valor):
+    return valor if valor is not None and math.isfinite(valor) else None
+
+
+def _describir_tarea(tarea):
+    return {
+        'nombre': tarea.nombre,
+        'hora': tarea.hora.isoformat(),
+        'zona': tarea.zona.key,
+        'recuperar': tarea.recuperar,
+        'tolerancia': tarea.tolerancia.total_seconds(),
+    }
+
+
+# --- Proceso del clúster ---
+
+class Nodo:
+    """Conexión de un proceso del clúster con su lanzador.
+
+    El proceso solo abre los shards que le tocan. En lugar de programar sus
+    tareas diarias, se las describe al lanzador, que es quien las programa
+    y le ordena ejecutarlas: así cada ocurrencia se ejecuta una sola vez en
+    cada proceso aunque este se reinicie. Las tareas que deben hacerse una
+    sola vez en todo el clúster se piden con ``reclamar``. Cada
+    ``INTERVALO_SALUD`` segundos envía la latencia y el estado de sus shards.
+    """
+
+    def __init__(self, cluster_id, shards, total, ruta_ipc=RUTA_IPC):
+        self.cluster_id = cluster_id
+        self.shards = shards
+        self.total = total
+        self.ruta_ipc = ruta_ipc
+        self._writer = None
+        self._conectado = None
+        self._respuestas = {}
+        self._secuencia = itertools.count()
+        self._ejecutadas = set()
+        self._tarea = None
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self, bot, planificador):
+        """Conecta con el lanzador en segundo plano (no hace nada si ya está conectando)"""
+        if self.activo:
+            return
+        self._conectado = asyncio.Event()
+        self._tarea = asyncio.create_task(self._mantener(bot, planificador), name='cluster')
+
+    async def reclamar(self, clave, espera=10.0):
+        """True si este proceso es el primero del clúster en reclamar ``clave``.
+
+        Si el lanzador no responde se devuelve False: es preferible no hacer
+        una tarea única a hacerla dos veces.
+        """
+        try:
+            await asyncio.wait_for(self._conectado.wait(), timeout=espera)
+            futuro = asyncio.get_running_loop().create_future()
+            peticion = next(self._secuencia)
+            self._respuestas[peticion] = futuro
+            _enviar(self._writer, {'tipo': 'reclamar', 'id': peticion, 'clave': clave})
+            return await asyncio.wait_for(futuro, timeout=espera)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            log.warning("No se pudo reclamar '%s' al lanzador: %r", clave, e)
+            return False
+
+    def posee(self, guild_id):
+        """Indica si el servidor está en uno de los shards de este proceso (los sin servidor, el proceso 0)"""
+        if guild_id is None:
+            return self.cluster_id == 0
+        return (guild_id >> 22) % self.total in self.shards
+
+    def salud(self, bot):
+        shards = {}
+        for shard_id, shard in getattr(bot, 'shards', {}).items():
+            shards[str(shard_id)] = {
+                'conectado': not shard.is_closed(),
+                'latencia': _segundos(shard.latency),
+            }
+        return {'shards': shards, 'servidores': len(bot.guilds)}
+
+    async def _mantener(self, bot, planificador):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.ruta_ipc)
+            except OSError as e:
+                log.warning('Sin conexión con el lanzador (%s), reintentando', e)
+                await asyncio.sleep(1)
+                continue
+            _enviar(self._writer, {
+                'tipo': 'hola',
+                'cluster': self.cluster_id,
+                'tareas': [_describir_tarea(tarea) for tarea in planificador.tareas()],
+            })
+            self._conectado.set()
+            latido = asyncio.create_task(self._latir(bot))
+            try:
+                while linea := await reader.readline():
+                    self._atender(json.loads(linea), planificador)
+            except ConnectionError:
+                pass
+            finally:
+                latido.cancel()
+                self._conectado.clear()
+                for futuro in self._respuestas.values():
+                    if not futuro.done():
+                        futuro.set_exception(ConnectionError('conexión con el lanzador perdida'))
+                self._respuestas.clear()
+                self._writer.close()
+            log.warning('Conexión con el lanzador perdida, reconectando')
+            await asyncio.sleep(1)
+
+    async def _latir(self, bot):
+        while True:
+            _enviar(self._writer, {'tipo': 'salud', 'cluster': self.cluster_id, **self.salud(bot)})
+            await asyncio.sleep(INTERVALO_SALUD)
+
+    def _atender(self, mensaje, planificador):
+        if mensaje['tipo'] == 'respuesta':
+            futuro = self._respuestas.pop(mensaje['id'], None)
+            if futuro is not None and not futuro.done():
+                futuro.set_result(mensaje['concedido'])
+        elif mensaje['tipo'] == 'ejecutar':
+            # Una orden sin confirmar se reenvía al reconectar: no se repite si ya se lanzó
+            clave = (mensaje['tarea'], mensaje['ocurrencia'])
+            if clave not in self._ejecutadas:
+                self._ejecutadas.add(clave)
+                ocurrencia = datetime.datetime.fromisoformat(mensaje['ocurrencia'])
+                if not planificador.ejecutar(mensaje['tarea'], ocurrencia):
+                    log.warning("El lanzador ordenó una tarea desconocida: '%s'", mensaje['tarea'], extra={'tarea': mensaje['tarea']})
+            # Se confirma al empezar: si el proceso cae a medias no se repite la ocurrencia
+            _enviar(self._writer, {'tipo': 'hecho', 'tarea': mensaje['tarea'], 'ocurrencia': mensaje['ocurrencia']})
+
+
+def nodo_desde_entorno():
+    """Nodo del proceso si lo lanzó ``cluster.py`` (CLUSTER_ID, CLUSTER_SHARDS y SHARD_COUNT), o None"""
+    cluster_id = os.getenv('CLUSTER_ID')
+    if cluster_id is None:
+        return None
+    shards = [int(shard) for shard in os.environ['CLUSTER_SHARDS'].split(',')]
+    return Nodo(int(cluster_id), shards, int(os.environ['SHARD_COUNT']), os.getenv('CLUSTER_IPC', RUTA_IPC))
+
+
+# --- Lanzador ---
+
+class Coordinador:
+    """Lado del lanzador del canal IPC.
+
+    Programa las tareas diarias que describen los procesos con un único
+    ``Planificador`` (cuyas marcas en SQLite evitan repetir ocurrencias) y,
+    al llegar la hora, ordena a cada proceso ejecutarlas para sus
+    servidores. Las órdenes quedan pendientes hasta que el proceso las
+    confirma, así que un proceso caído las recibe al volver a conectar,
+    siempre que no haya pasado la tolerancia de la tarea (la misma ventana
+    con la que el planificador recupera una ejecución perdida).
+    """
+
+    def __init__(self, rangos, ruta_ipc=RUTA_IPC, con=None):
+        self.rangos = rangos
+        self.ruta_ipc = ruta_ipc
+        self.planificador = Planificador(con)
+        self._conexiones = {}   # cluster -> writer
+        self._pendientes = {cluster: {} for cluster in range(len(rangos))}  # cluster -> {(tarea, ocurrencia): mensaje}
+        self._reclamadas = set()
+        self._salud = {}        # cluster -> (instante, informe)
+        self._servidor = None
+
+    async def iniciar(self):
+        directorio = os.path.dirname(self.ruta_ipc)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        if os.path.exists(self.ruta_ipc):
+            os.unlink(self.ruta_ipc)
+        self._servidor = await asyncio.start_unix_server(self._atender, path=self.ruta_ipc)
+        self.planificador.iniciar()
+
+    async def detener(self):
+        self.planificador.detener()
+        for writer in list(self._conexiones.values()):
+            writer.close()
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+
+    async def _atender(self, reader, writer):
+        cluster = None
+        try:
+            while linea := await reader.readline():
+                mensaje = json.loads(linea)
+                tipo = mensaje['tipo']
+                if tipo == 'hola':
+                    cluster = mensaje['cluster']
+                    self._conexiones[cluster] = writer
+                    self._programar(mensaje['tareas'])
+                    self._reenviar(cluster, writer)
+                elif tipo == 'salud':
+                    self._salud[mensaje['cluster']] = (time.monotonic(), mensaje)
+                elif tipo == 'reclamar':
+                    concedido = mensaje['clave'] not in self._reclamadas
+                    self._reclamadas.add(mensaje['clave'])
+                    _enviar(writer, {'tipo': 'respuesta', 'id': mensaje['id'], 'concedido': concedido})
+                elif tipo == 'hecho' and cluster is not None:
+                    self._pendientes[cluster].pop((mensaje['tarea'], mensaje['ocurrencia']), None)
+        except ConnectionError:
+            pass
+        finally:
+            if cluster is not None and self._conexiones.get(cluster) is writer:
+                del self._conexiones[cluster]
+            writer.close()
+
+    def _programar(self, tareas):
+        programadas = {tarea.nombre for tarea in self.planificador.tareas()}
+        for datos in tareas:
+            if datos['nombre'] in programadas:
+                continue
+            self.planificador.agregar(TareaDiaria(
+                datos['nombre'],
+                datetime.time.fromisoformat(datos['hora']),
+                ZoneInfo(datos['zona']),
+                self._ordenar(datos['nombre'], datos['tolerancia']),
+                recuperar=datos['recuperar'],
+                tolerancia=datetime.timedelta(seconds=datos['tolerancia']),
+            ))
+
+    def _reenviar(self, cluster, writer):
+        """Reenvía las órdenes pendientes a un proceso que (re)conecta; descarta las que ya no están a tiempo"""
+        ahora = time.time()
+        pendientes = self._pendientes[cluster]
+        for clave, orden in list(pendientes.items()):
+            if orden['caduca'] < ahora:
+                del pendientes[clave]
+                log.warning(
+                    "Orden '%s' (%s) descartada para el proceso %d: ha pasado su tolerancia", orden['tarea'], orden['ocurrencia'], cluster,
+                    extra={'tarea': orden['tarea']},
+                )
+                continue
+            _enviar(writer, orden)
+
+    def _ordenar(self, nombre, tolerancia):
+        async def ordenar(fecha):
+            orden = {'tipo': 'ejecutar', 'tarea': nombre, 'ocurrencia': fecha.isoformat(), 'caduca': fecha.timestamp() + tolerancia}
+            for cluster, pendientes in self._pendientes.items():
+                pendientes[(nombre, orden['ocurrencia'])] = orden
+                writer = self._conexiones.get(cluster)
+                if writer is not None:
+                    _enviar(writer, orden)
+            log.info("Tarea '%s' ordenada a %d procesos", nombre, len(self._pendientes), extra={'tarea': nombre})
+        return ordenar
+
+    # --- Salud ---
+
+    def estado_shards(self):
+        """{shard_id: {'cluster', 'conectado', 'latencia'}} según el último latido de cada proceso"""
+        limite = time.monotonic() - INTERVALO_SALUD * LATIDOS_PERDIDOS
+        estado = {}
+        for cluster, shards in enumerate(self.rangos):
+            visto, informe = self._salud.get(cluster, (None, {}))
+            vivo = visto is not None and visto >= limite
+            for shard in shards:
+                datos = informe.get('shards', {}).get(str(shard), {}) if vivo else {}
+                estado[shard] = {
+                    'cluster': cluster,
+                    'conectado': bool(datos.get('conectado')),
+                    'latencia': datos.get('latencia'),
+                }
+        return estado
+
+    def salud(self):
+        shards = self.estado_shards()
+        ok = all(shard['conectado'] for shard in shards.values())
+        return ok, {
+            'shards': {str(shard_id): datos for shard_id, datos in shards.items()},
+            'servidores': sum(informe.get('servidores', 0) for _, informe in self._salud.values()),
+            'procesos_conectados': len(self._conexiones),
+        }
+
+
+class Lanzador:
+    """Lanza un proceso de ``main.py`` por cada rango de shards y los relanza si caen"""
+
+    def __init__(self, total, rangos, ruta_ipc=RUTA_IPC, puerto_metricas=None):
+        self.total = total
+        self.rangos = rangos
+        self.ruta_ipc = ruta_ipc
+        self.puerto_metricas = puerto_metricas
+        self.coordinador = Coordinador(rangos, ruta_ipc)
+        self.reinicios = {cluster: 0 for cluster in range(len(rangos))}
+        self._procesos = {}
+        self._parando = asyncio.Event()
+        metricas.indicador(
+            'cluster_shard_conectado', 'Shard conectado al gateway (1) o no (0)',
+            lambda: {(str(datos['cluster']), str(shard)): int(datos['conectado']) for shard, datos in self.coordinador.estado_shards().items()},
+            ('cluster', 'shard'),
+        )
+        metricas.indicador(
+            'cluster_shard_latencia_segundos', 'Latencia del heartbeat de cada shard',
+            lambda: {
+                (str(datos['cluster']), str(shard)): datos['latencia']
+                for shard, datos in self.coordinador.estado_shards().items() if datos['latencia'] is not None
+            },
+            ('cluster', 'shard'),
+        )
+        metricas.indicador(
+            'cluster_reinicios', 'Veces que se ha relanzado cada proceso',
+            lambda: {(str(cluster),): total for cluster, total in self.reinicios.items()},
+            ('cluster',),
+        )
+
+    def _entorno(self, cluster, shards):
+        entorno = dict(os.environ)
+        entorno.update({
+            'CLUSTER_ID': str(cluster),
+            'CLUSTER_SHARDS': ','.join(map(str, shards)),
+            'SHARD_COUNT': str(self.total),
+            'CLUSTER_IPC': self.ruta_ipc,
+        })
+        entorno.pop('PORT', None)
+        if self.puerto_metricas:
+            # El lanzador usa el puerto indicado y cada proceso los siguientes
+            entorno['PUERTO_METRICAS'] = str(self.puerto_metricas + 1 + cluster)
+        else:
+            entorno.pop('PUERTO_METRICAS', None)
+        return entorno
+
+    async def _vigilar(self, cluster, shards):
+        fallos = 0
+        while not self._parando.is_set():
+            proceso = await asyncio.create_subprocess_exec(sys.executable, _MAIN, env=self._entorno(cluster, shards))
+            self._procesos[cluster] = proceso
+            log.info('Proceso %d lanzado (shards %d-%d de %d, pid %d)', cluster, shards[0], shards[-1], self.total, proceso.pid)
+            inicio = time.monotonic()
+            codigo = await proceso.wait()
+            if self._parando.is_set():
+                return
+            # Un proceso que aguantó un rato no cuenta como fallo seguido
+            fallos = fallos + 1 if time.monotonic() - inicio < ESPERA_REINICIO_MAXIMA else 1
+            espera = min(ESPERA_REINICIO_MAXIMA, 2 ** fallos)
+            self.reinicios[cluster] += 1
+            log.error('Proceso %d terminado con código %s, se relanza en %.0f s', cluster, codigo, espera)
+            try:
+                await asyncio.wait_for(self._parando.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def ejecutar(self):
+        bucle = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            bucle.add_signal_handler(senal, self._parando.set)
+
+        await self.coordinador.iniciar()
+        servidor = None
+        if self.puerto_metricas:
+            servidor = metricas.ServidorMetricas(self.coordinador.salud, self.puerto_metricas)
+            await servidor.iniciar()
+
+        vigilantes = [asyncio.create_task(self._vigilar(cluster, shards)) for cluster, shards in enumerate(self.rangos)]
+        await self._parando.wait()
+
+        log.info('Deteniendo el clúster')
+        for proceso in self._procesos.values():
+            if proceso.returncode is None:
+                proceso.terminate()
+        await asyncio.gather(*vigilantes, return_exceptions=True)
+        await asyncio.gather(*(proceso.wait() for proceso in self._procesos.values()))
+        if servidor is not None:
+            await servidor.detener()
+        await self.coordinador.detener()
+
+
+async def _lanzar():
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        log.critical('No se encontró el token de Discord en las variables de entorno')
+        return 1
+    total = int(os.getenv('SHARDS', '0')) or await shards_recomendados(token)
+    clusters = int(os.getenv('CLUSTERS', '0')) or math.ceil(total / SHARDS_POR_CLUSTER)
+    rangos = reparto(total, clusters)
+    puerto = os.getenv('PUERTO_METRICAS') or os.getenv('PORT')
+    log.info('Iniciando clúster: %d shards en %d procesos', total, len(rangos))
+    await Lanzador(total, rangos, os.getenv('CLUSTER_IPC', RUTA_IPC), int(puerto) if puerto else None).ejecutar()
+    return 0
+
+
+if __name__ == '__main__':
+    import bitacora
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    bitacora.configurar()
+    try:
+        codigo = asyncio.run(_lanzar())
+    finally:
+        bitacora.detener()
+    sys.exit(codigo)
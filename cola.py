@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+
+import discord
+
+import almacen
+import metricas
+
+log = logging.getLogger(__name__)
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+HECHO = 'hecho'
+FALLIDO = 'fallido'
+
+# Un trabajo reclamado se reserva este tiempo; el trabajador la renueva mientras sigue con él.
+# Si el proceso muere, al caducar la reserva otro trabajador lo retoma
+DURACION_RESERVA = 60.0
+# Cada cuánto se mira la cola cuando no hay trabajo (y cada cuánto se consulta un resultado)
+INTERVALO_SONDEO = 0.5
+# Reintentos: espera base * 2^intentos (con jitter), hasta un máximo
+ESPERA_BASE = 2.0
+ESPERA_MAXIMA = 300.0
+MAX_INTENTOS = 5
+# Los trabajos terminados se conservan un día para consultar su resultado
+RETENCION_TERMINADOS = 24 * 3600
+
+
+class ErrorTrabajo(Exception):
+    """Error de un trabajo; con ``reintentable`` se vuelve a intentar más tarde"""
+
+    def __init__(self, mensaje, reintentable=False):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+class ColaTrabajos:
+    """Cola de trabajos en SQLite compartida entre procesos.
+
+    El proceso del gateway encola trabajos (tipo + datos JSON) y uno o más
+    procesos de trabajos los reclaman con un único ``UPDATE ... RETURNING``,
+    que SQLite ejecuta de forma atómica, así que cada trabajo lo toma un
+    solo proceso. La reserva caduca a los ``DURACION_RESERVA`` segundos si
+    nadie la renueva. Quien encola puede esperar el resultado con
+    ``esperar`` o ``ejecutar``.
+    """
+
+    def __init__(self, con=None):
+        self._con = con
+        self._tabla_creada = False
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.executescript(
+                'CREATE TABLE IF NOT EXISTS cola_trabajos ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' tipo TEXT NOT NULL,'
+                ' datos TEXT NOT NULL,'
+                ' clave TEXT UNIQUE,'
+                ' estado TEXT NOT NULL,'
+                ' intentos INTEGER NOT NULL DEFAULT 0,'
+                ' proximo_intento REAL NOT NULL,'
+                ' propietario TEXT,'
+                ' reserva_hasta REAL,'
+                ' resultado TEXT,'
+                ' error TEXT,'
+                ' creado REAL NOT NULL);'
+                'CREATE INDEX IF NOT EXISTS cola_trabajos_listos ON cola_trabajos (estado, proximo_intento);'
+            )
+        return self._con
+
+    # --- Productor ---
+
+    def encolar(self, tipo, datos, clave=None):
+        """Encola un trabajo y devuelve su ID; con ``clave``, encolar dos veces devuelve el mismo trabajo"""
+        ahora = time.time()
+        cursor = self.con.execute(
+            'INSERT OR IGNORE INTO cola_trabajos (tipo, datos, clave, estado, proximo_intento, creado) VALUES (?, ?, ?, ?, ?, ?)',
+            (tipo, json.dumps(datos, ensure_ascii=False), clave, PENDIENTE, ahora, ahora),
+        )
+        if cursor.rowcount:
+            return cursor.lastrowid
+        return self.con.execute('SELECT id FROM cola_trabajos WHERE clave = ?', (clave,)).fetchone()['id']
+
+    def consultar(self, trabajo_id):
+        """(estado, resultado, error) de un trabajo"""
+        fila = self.con.execute('SELECT estado, resultado, error FROM cola_trabajos WHERE id = ?', (trabajo_id,)).fetchone()
+        if fila is None:
+            return None, None, None
+        return fila['estado'], json.loads(fila['resultado']) if fila['resultado'] else None, fila['error']
+
+    def cancelar(self, trabajo_id, error):
+        """Marca como fallido un trabajo que aún no ha empezado (o cuyo trabajador murió); devuelve False si está en marcha o ya terminó"""
+        cursor = self.con.execute(
+            'UPDATE cola_trabajos SET estado = ?, error = ?, reserva_hasta = NULL'
+            ' WHERE id = ? AND (estado = ? OR (estado = ? AND reserva_hasta < ?))',
+            (FALLIDO, error, trabajo_id, PENDIENTE, EN_CURSO, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    async def esperar(self, trabajo_id, timeout=None, cancelar=False):
+        """Espera a que termine un trabajo y devuelve su resultado (lanza ErrorTrabajo si falló).
+
+        Con ``cancelar``, al pasar ``timeout`` el trabajo se cancela para que
+        ningún trabajador lo ejecute más tarde; si en ese momento ya está en
+        marcha se sigue esperando a que termine.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            estado, resultado, error = self.consultar(trabajo_id)
+            if estado == HECHO:
+                return resultado
+            if estado in (FALLIDO, None):
+                raise ErrorTrabajo(error or 'Trabajo no encontrado')
+            if limite is not None and time.monotonic() >= limite:
+                if not cancelar or self.cancelar(trabajo_id, 'Cancelado: no empezó a tiempo'):
+                    raise asyncio.TimeoutError()
+            await asyncio.sleep(INTERVALO_SONDEO)
+
+    async def ejecutar(self, tipo, datos, clave=None, timeout=None, cancelar=False):
+        """Encola un trabajo y espera su resultado"""
+        return await self.esperar(self.encolar(tipo, datos, clave), timeout=timeout, cancelar=cancelar)
+
+    def en_marcha(self, tipo):
+        """Trabajos de ``tipo`` pendientes o en curso"""
+        return self.con.execute(
+            'SELECT COUNT(*) FROM cola_trabajos WHERE tipo = ? AND estado IN (?, ?)', (tipo, PENDIENTE, EN_CURSO)
+        ).fetchone()[0]
+
+    def pendientes(self):
+        return self.con.execute(
+            'SELECT COUNT(*) FROM cola_trabajos WHERE estado IN (?, ?)', (PENDIENTE, EN_CURSO)
+        ).fetchone()[0]
+
+    # --- Consumidor ---
+
+    def reclamar(self, propietario, tipos):
+        """Reserva el trabajo listo más antiguo de ``tipos`` (o uno cuya reserva caducó); None si no hay"""
+        ahora = time.time()
+        marcas = ', '.join('?' for _ in tipos)
+        return self.con.execute(
+            'UPDATE cola_trabajos SET estado = ?, propietario = ?, reserva_hasta = ?'
+            ' WHERE id = ('
+            f'  SELECT id FROM cola_trabajos WHERE tipo IN ({marcas}) AND ('
+            '   (estado = ? AND proximo_intento <= ?) OR (estado = ? AND reserva_hasta < ?)'
+            '  ) ORDER BY id LIMIT 1'
+            ' ) RETURNING id, tipo, datos, intentos',
+            (EN_CURSO, propietario, ahora + DURACION_RESERVA, *tipos, PENDIENTE, ahora, EN_CURSO, ahora),
+        ).fetchone()
+
+    def renovar(self, ids, propietario):
+        if not ids:
+            return
+        marcas = ', '.join('?' for _ in ids)
+        self.con.execute(
+            f'UPDATE cola_trabajos SET reserva_hasta = ? WHERE propietario = ? AND estado = ? AND id IN ({marcas})',
+            (time.time() + DURACION_RESERVA, propietario, EN_CURSO, *ids),
+        )
+
+    def completar(self, trabajo_id, resultado):
+        self.con.execute(
+            'UPDATE cola_trabajos SET estado = ?, resultado = ?, error = NULL, reserva_hasta = NULL WHERE id = ?',
+            (HECHO, json.dumps(resultado, ensure_ascii=False), trabajo_id),
+        )
+
+    def fallar(self, fila, error, reintentable):
+        """Reprograma el trabajo con espera exponencial o lo marca como fallido; devuelve la espera o None"""
+        intentos = fila['intentos'] + 1
+        if not reintentable or intentos >= MAX_INTENTOS:
+            self.con.execute(
+                'UPDATE cola_trabajos SET estado = ?, intentos = ?, error = ?, reserva_hasta = NULL WHERE id = ?',
+                (FALLIDO, intentos, error, fila['id']),
+            )
+            return None
+        espera = min(ESPERA_BASE * 2 ** intentos, ESPERA_MAXIMA) * random.uniform(0.5, 1.5)
+        self.con.execute(
+            'UPDATE cola_trabajos SET estado = ?, intentos = ?, error = ?, proximo_intento = ?, reserva_hasta = NULL WHERE id = ?',
+            (PENDIENTE, intentos, error, time.time() + espera, fila['id']),
+        )
+        return espera
+
+    def liberar(self, trabajo_id):
+        """Devuelve a la cola un trabajo sin terminar (sin contar intento), p. ej. al drenar"""
+        self.con.execute(
+            'UPDATE cola_trabajos SET estado = ?, propietario = NULL, reserva_hasta = NULL, proximo_intento = ? WHERE id = ? AND estado = ?',
+            (PENDIENTE, time.time(), trabajo_id, EN_CURSO),
+        )
+
+    def limpiar(self):
+        self.con.execute(
+            'DELETE FROM cola_trabajos WHERE estado IN (?, ?) AND creado < ?',
+            (HECHO, FALLIDO, time.time() - RETENCION_TERMINADOS),
+        )
+
+
+class Trabajador:
+    """Consume la cola de trabajos con concurrencia acotada.
+
+    ``manejadores`` asocia cada tipo de trabajo a una corrutina que recibe los
+    datos y devuelve un resultado serializable en JSON. ``drenar`` deja de
+    reclamar trabajos nuevos y espera a los que están en curso; los que no
+    terminan a tiempo se cancelan y vuelven a la cola para otro proceso.
+    """
+
+    def __init__(self, cola, manejadores, concurrencia=4, propietario=None):
+        self.cola = cola
+        self.manejadores = manejadores
+        self.concurrencia = concurrencia
+        self.propietario = propietario or f'{socket.gethostname()}:{os.getpid()}'
+        self._en_curso = {}  # task -> id del trabajo
+        self._drenando = asyncio.Event()
+        self._bucle_tarea = None
+        self._renovacion = None
+
+    @property
+    def activo(self):
+        return self._bucle_tarea is not None and not self._bucle_tarea.done()
+
+    def iniciar(self):
+        if self.activo:
+            return
+        self.cola.limpiar()
+        self._drenando.clear()
+        self._bucle_tarea = asyncio.create_task(self._bucle(), name='trabajador')
+        self._renovacion = asyncio.create_task(self._renovar(), name='trabajador:reservas')
+
+    async def drenar(self, timeout):
+        """Deja de aceptar trabajos y espera a los que están en curso hasta ``timeout`` segundos"""
+        self._drenando.set()
+        if self._bucle_tarea is not None:
+            await self._bucle_tarea
+        pendientes = list(self._en_curso)
+        if pendientes:
+            log.info('Drenando: esperando a %d trabajos en curso', len(pendientes))
+            _, sin_terminar = await asyncio.wait(pendientes, timeout=timeout)
+            for task in sin_terminar:
+                task.cancel()
+            if sin_terminar:
+                await asyncio.wait(sin_terminar)
+                log.warning('Drenaje: %d trabajos sin terminar vuelven a la cola', len(sin_terminar))
+        if self._renovacion is not None:
+            self._renovacion.cancel()
+
+    async def _bucle(self):
+        tipos = list(self.manejadores)
+        while not self._drenando.is_set():
+            fila = None
+            if len(self._en_curso) < self.concurrencia:
+                fila = self.cola.reclamar(self.propietario, tipos)
+            if fila is None:
+                try:
+                    await asyncio.wait_for(self._drenando.wait(), timeout=INTERVALO_SONDEO)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._ejecutar(fila), name=f"trabajo:{fila['tipo']}")
+            self._en_curso[task] = fila['id']
+            task.add_done_callback(self._en_curso.pop)
+
+    async def _renovar(self):
+        while True:
+            await asyncio.sleep(DURACION_RESERVA / 3)
+            self.cola.renovar(list(self._en_curso.values()), self.propietario)
+
+    async def _ejecutar(self, fila):
+        inicio = time.perf_counter()
+        extra = {'tarea': fila['tipo']}
+        try:
+            resultado = await self.manejadores[fila['tipo']](json.loads(fila['datos']))
+        except asyncio.CancelledError:
+            self.cola.liberar(fila['id'])
+            raise
+        except ErrorTrabajo as e:
+            self._fallar(fila, str(e), e.reintentable, extra)
+        except (discord.Forbidden, discord.NotFound) as e:
+            # Errores permanentes: reintentar no va a servir
+            self._fallar(fila, str(e), False, extra)
+        except Exception as e:
+            log.exception("Error en el trabajo %s (%s): %s", fila['id'], fila['tipo'], e, extra=extra)
+            self._fallar(fila, str(e), True, extra)
+        else:
+            self.cola.completar(fila['id'], resultado)
+            metricas.trabajo(fila['tipo'], 'ok', time.perf_counter() - inicio)
+            return
+        metricas.trabajo(fila['tipo'], 'error', time.perf_counter() - inicio)
+
+    def _fallar(self, fila, error, reintentable, extra):
+        espera = self.cola.fallar(fila, error, reintentable)
+        if espera is None:
+            log.error("Trabajo %s (%s) fallido: %s", fila['id'], fila['tipo'], error, extra=extra)
+        else:
+            log.warning("Trabajo %s (%s) fallido, reintento en %.0fs: %s", fila['id'], fila['tipo'], espera, error, extra=extra)
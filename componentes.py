@@ -0,0 +1,107 @@
+import logging
+
+import discord
+
+log = logging.getLogger(__name__)
+
+SEPARADOR = ':'
+# Discord no admite custom_id de más de 100 caracteres
+LONGITUD_MAXIMA = 100
+
+# Acción -> manejador(interaction, *ids)
+_manejadores = {}
+# Acción -> posiciones de los IDs de usuario en el custom_id
+_usuarios = {}
+_comprobar = None
+
+
+def accion(nombre, usuarios=()):
+    """Registra el manejador de los botones de una acción.
+
+    El manejador recibe la interacción y los IDs codificados en el
+    ``custom_id`` (como enteros) y resuelve los objetos al hacer clic.
+    ``usuarios`` son las posiciones de los IDs que son de usuarios, para
+    que las grabaciones anonimizadas los sustituyan.
+    """
+    if SEPARADOR in nombre:
+        raise ValueError(f"El nombre de la acción no puede contener '{SEPARADOR}': {nombre}")
+
+    def decorador(manejador):
+        _manejadores[nombre] = manejador
+        _usuarios[nombre] = tuple(usuarios)
+        return manejador
+    return decorador
+
+
+def custom_id(nombre, *ids):
+    """``custom_id`` de un botón: la acción seguida de los IDs, p. ej. ``rol:123:456``"""
+    valor = SEPARADOR.join([nombre, *(str(int(id)) for id in ids)])
+    if len(valor) > LONGITUD_MAXIMA:
+        raise ValueError(f'custom_id demasiado largo ({len(valor)} caracteres): {valor}')
+    return valor
+
+
+def boton(nombre, *ids, **opciones):
+    """Botón sin callback propio: el clic lo resuelve el manejador de ``nombre``"""
+    return discord.ui.Button(custom_id=custom_id(nombre, *ids), **opciones)
+
+
+def vista(botones):
+    """Vista para enviar con un mensaje.
+
+    Se detiene antes de enviarla: discord.py solo guarda las vistas activas,
+    así que no queda ningún objeto por mensaje y los botones siguen
+    funcionando tras un reinicio, porque el ``custom_id`` lleva todo lo
+    necesario.
+    """
+    vista = discord.ui.View(timeout=None)
+    for elemento in botones:
+        vista.add_item(elemento)
+    vista.stop()
+    return vista
+
+
+def posiciones_usuario(nombre):
+    """Posiciones de los IDs de usuario de una acción, o None si la acción no está registrada"""
+    return _usuarios.get(nombre)
+
+
+def _descodificar(valor):
+    nombre, *ids = valor.split(SEPARADOR)
+    try:
+        return nombre, [int(id) for id in ids]
+    except ValueError:
+        return nombre, None
+
+
+async def enrutar(interaction):
+    """Resuelve un clic en un botón con el manejador de su acción"""
+    if interaction.type != discord.InteractionType.component:
+        return
+    nombre, ids = _descodificar(interaction.data.get('custom_id', ''))
+    manejador = _manejadores.get(nombre)
+    if manejador is None or ids is None:
+        # Botones de vistas con estado o de otras versiones: no son de este enrutador
+        return
+    if _comprobar is not None and not await _comprobar(interaction):
+        return
+    try:
+        await manejador(interaction, *ids)
+    except Exception as e:
+        log.exception('Error en el botón %s: %s', interaction.data.get('custom_id'), e, extra={'guild': interaction.guild_id, 'miembro': interaction.user.id})
+        mensaje = f"❌ Error: {str(e)}"
+        if interaction.response.is_done():
+            await interaction.followup.send(mensaje, ephemeral=True)
+        else:
+            await interaction.response.send_message(mensaje, ephemeral=True)
+
+
+def registrar(bot, comprobar=None):
+    """Enruta los clics en botones a los manejadores registrados con :func:`accion`.
+
+    ``comprobar(interaction)`` se llama antes de cada manejador; si devuelve
+    False (y ya ha respondido) el clic no se procesa.
+    """
+    global _comprobar
+    _comprobar = comprobar
+    bot.add_listener(enrutar, 'on_interaction')
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import os
+
+import indice
+
+log = logging.getLogger(__name__)
+
+# Fichero con la configuración por servidor
+RUTA_CONFIG = os.path.join('datos', 'servidores.json')
+# Cada cuántos segundos se comprueba si el fichero ha cambiado
+INTERVALO_VIGILANCIA = 5.0
+
+# Configuración que se aplica a todos los servidores si el fichero no dice otra cosa
+PREDETERMINADA = {
+    # Rol que reacciona al mensaje de actividad
+    'rol_personal': "👷〴Personal MTMS〴",
+    # Roles que se asignan al iniciar el período de prueba
+    'roles_periodo_prueba': [
+        "═══════Medallas═══════",
+        "═══════Personal═══════",
+        "🔖〴Nuevo Ingreso〴",
+        "👷〴Personal MTMS〴",
+        "═══════Departamento de Obras═══════",
+        "👷〴 Obrero en Pruebas",
+        "═══════Sanciones═══════",
+        "═══════Otros═══════",
+        "Curso Aprendiz",
+    ],
+    # Días que dura el período de prueba y qué se hace cuando termina
+    # ('recordatorio', 'quitar_roles', 'revision' o 'ninguna')
+    'dias_periodo_prueba': 7,
+    'accion_periodo_prueba': 'recordatorio',
+    # Roles de sanción que se asignan en un despido
+    'roles_despido': [
+        "═══════Sanciones═══════",
+        "❌| Despedido",
+        "🎟️〴Civil〴",
+    ],
+    # Prefijo de placa según el rango
+    'prefijos_placa': {
+        "🚐〴Secretario De Infraestructura General〴": "SEC",
+        "🚐〴Sub. Secretario De Infraestructura General〴": "SBC",
+        "⛏️〴Director General〴": "DIR",
+        "🎩〴Sub. Director General〴": "SDR",
+        "🔧〴Director General En Pruebas〴": "DGP",
+        "🔎🧰〴Supervisor General〴": "SPG",
+        "💼🔧〴Inspector〴": "INS",
+        "💼🚧〴Sub Inspector〴": "SBI",
+        "🧰〴Jefe De Area Técnica〴": "JAT",
+        "🚗〴Jefe De Incautaciones〴": "JIC",
+        "🦺〴Jefe De Carreteras〴": "JCT",
+        "🛑〴Tecnico Superior〴": "TCS",
+        "⛔〴Operador Vial〴": "OPV",
+        "🚧〴Auxiliar Vial〴": "AXV",
+        "🚦〴Mecanico Experimentado〴": "MEC",
+        "🔖〴Nuevo Ingreso〴": "NVI",
+    },
+    # Nombre de cada canal que usa el bot (None = no se usa)
+    'canales': {
+        'actividad': "↪⏰》𝗔ctividad",
+        'periodo_prueba': "↪📰》𝗣eriodo-de-𝗣rueba",
+        'placas': "↪🆔》𝗣lacas-𝗔signadas",
+        'empleados': "↪🧥》𝗖hat-𝗘mpleados",
+        'licencias': "↪💳》𝗟icencias",
+        'tutoriales': "↪🥏》𝗧utoriales-𝗦ugerencias",
+        'guia': "↪📚》𝙂uía",
+        'rangos': "↪📣》𝗦ubir-𝗕ajar-𝗥ango",
+        'despidos': "↪🚫》𝗗espidos",
+        'sanciones': "↪📛》𝗦anciones",
+        'informe_actividad': None,
+    },
+}
+
+# Acciones al terminar un período de prueba ('accion_periodo_prueba')
+RECORDATORIO = 'recordatorio'  # Aviso en el canal de períodos de prueba
+QUITAR_ROLES = 'quitar_roles'  # Quita los roles del período de prueba y lo avisa
+REVISAR = 'revision'           # Aviso y queda pendiente de revisión en /periodos-activos
+NINGUNA = 'ninguna'
+ACCIONES_PERIODO = (RECORDATORIO, QUITAR_ROLES, REVISAR, NINGUNA)
+
+# Canales que pueden faltar sin que la configuración se rechace (solo se enlazan en la bienvenida)
+CANALES_OPCIONALES = {'licencias', 'tutoriales', 'guia'}
+
+
+class ErrorConfiguracion(Exception):
+    """La configuración no tiene el formato esperado"""
+
+
+class ConfigGuild:
+    """Configuración ya compilada de un servidor (solo lectura)"""
+
+    __slots__ = (
+        'rol_personal', 'roles_periodo_prueba', 'dias_periodo_prueba', 'accion_periodo_prueba', 'roles_despido', 'prefijos_placa',
+        'canales', 'huella',
+    )
+
+    def __init__(self, datos):
+        self.rol_personal = datos['rol_personal']
+        self.roles_periodo_prueba = tuple(datos['roles_periodo_prueba'])
+        self.dias_periodo_prueba = datos['dias_periodo_prueba']
+        self.accion_periodo_prueba = datos['accion_periodo_prueba']
+        self.roles_despido = tuple(datos['roles_despido'])
+        self.prefijos_placa = dict(datos['prefijos_placa'])
+        self.canales = dict(datos['canales'])
+        # Sirve para saber qué servidores cambian al recargar
+        self.huella = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+
+    def nombre_canal(self, clave):
+        return self.canales.get(clave)
+
+    def roles(self):
+        """Todos los nombres de rol que aparecen en la configuración"""
+        return {self.rol_personal, *self.roles_periodo_prueba, *self.roles_despido, *self.prefijos_placa}
+
+
+def _lista_textos(valor, campo):
+    if not isinstance(valor, list) or not all(isinstance(nombre, str) and nombre for nombre in valor):
+        raise ErrorConfiguracion(f"'{campo}' debe ser una lista de nombres")
+    return valor
+
+
+def _combinar(base, cambios, origen):
+    """Aplica sobre ``base`` las claves de ``cambios`` validando su formato"""
+    if not isinstance(cambios, dict):
+        raise ErrorConfiguracion(f"{origen}: se esperaba un objeto")
+    datos = dict(base)
+    for campo, valor in cambios.items():
+        if campo not in PREDETERMINADA:
+            raise ErrorConfiguracion(f"{origen}: campo desconocido '{campo}'")
+        if campo == 'rol_personal':
+            if not isinstance(valor, str) or not valor:
+                raise ErrorConfiguracion(f"{origen}: 'rol_personal' debe ser un nombre de rol")
+        elif campo in ('roles_periodo_prueba', 'roles_despido'):
+            _lista_textos(valor, f"{origen}: {campo}")
+        elif campo == 'dias_periodo_prueba':
+            if not isinstance(valor, (int, float)) or isinstance(valor, bool) or valor <= 0:
+                raise ErrorConfiguracion(f"{origen}: 'dias_periodo_prueba' debe ser un número de días positivo")
+        elif campo == 'accion_periodo_prueba':
+            if valor not in ACCIONES_PERIODO:
+                raise ErrorConfiguracion(f"{origen}: 'accion_periodo_prueba' debe ser una de {', '.join(ACCIONES_PERIODO)}")
+        elif campo == 'prefijos_placa':
+            if not isinstance(valor, dict) or not all(
+                isinstance(prefijo, str) and len(prefijo) == 3 and prefijo.isupper() for prefijo in valor.values()
+            ):
+                raise ErrorConfiguracion(f"{origen}: 'prefijos_placa' debe asociar cada rango a un prefijo de 3 mayúsculas")
+        elif campo == 'canales':
+            if not isinstance(valor, dict):
+                raise ErrorConfiguracion(f"{origen}: 'canales' debe ser un objeto")
+            for clave, nombre in valor.items():
+                if clave not in PREDETERMINADA['canales']:
+                    raise ErrorConfiguracion(f"{origen}: canal desconocido '{clave}'")
+                if nombre is not None and (not isinstance(nombre, str) or not nombre):
+                    raise ErrorConfiguracion(f"{origen}: el canal '{clave}' debe ser un nombre o null")
+            # Los canales se combinan uno a uno; el resto de campos se sustituye entero
+            valor = {**datos['canales'], **valor}
+        datos[campo] = valor
+    return datos
+
+
+def compilar(contenido):
+    """Compila el contenido del fichero en (predeterminada, {guild_id: ConfigGuild}).
+
+    El fichero tiene la forma ``{"predeterminada": {...}, "servidores": {"<id>": {...}}}``;
+    ambas partes son opcionales y solo contienen los campos que cambian.
+    """
+    if not isinstance(contenido, dict):
+        raise ErrorConfiguracion("El fichero debe contener un objeto JSON")
+    desconocidas = set(contenido) - {'predeterminada', 'servidores'}
+    if desconocidas:
+        raise ErrorConfiguracion(f"Claves desconocidas: {', '.join(sorted(desconocidas))}")
+    base = _combinar(PREDETERMINADA, contenido.get('predeterminada', {}), 'predeterminada')
+    servidores = contenido.get('servidores', {})
+    if not isinstance(servidores, dict):
+        raise ErrorConfiguracion("'servidores' debe ser un objeto {id: configuración}")
+    por_guild = {}
+    for guild_id, cambios in servidores.items():
+        if not str(guild_id).isdigit():
+            raise ErrorConfiguracion(f"'{guild_id}' no es un ID de servidor")
+        por_guild[int(guild_id)] = ConfigGuild(_combinar(base, cambios, f"servidor {guild_id}"))
+    return ConfigGuild(base), por_guild
+
+
+def validar(guild, config):
+    """Nombres de roles y canales de la configuración que no existen en el servidor"""
+    faltan = []
+    for nombre in sorted(config.roles()):
+        if indice.rol(guild, nombre) is None:
+            faltan.append(f"rol '{nombre}'")
+    for clave, nombre in config.canales.items():
+        if nombre and clave not in CANALES_OPCIONALES and indice.canal(guild, nombre) is None:
+            faltan.append(f"canal '{nombre}' ({clave})")
+    return faltan
+
+
+class AlmacenConfiguracion:
+    """Configuración por servidor que se recarga sin reiniciar el bot.
+
+    Se lee de un fichero JSON y se compila en un ``ConfigGuild`` por
+    servidor. Los comandos leen siempre la versión compilada con ``de()``.
+    Al recargar (porque el fichero cambió o con ``/recargar-config``) se
+    compila la versión nueva aparte, se comprueba con el índice que los
+    roles y canales de los servidores afectados existen y solo entonces se
+    sustituye de una vez la referencia, así que un comando nunca ve una
+    mezcla de las dos versiones.
+    """
+
+    def __init__(self, ruta=RUTA_CONFIG):
+        self.ruta = ruta
+        # (predeterminada, {guild_id: ConfigGuild}) - se sustituye entero al recargar
+        self._estado = (ConfigGuild(PREDETERMINADA), {})
+        self._modificado = None
+        self._tarea = None
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done()
+
+    def de(self, guild):
+        """Configuración vigente de un servidor"""
+        predeterminada, por_guild = self._estado
+        return por_guild.get(guild.id, predeterminada)
+
+    def _fecha_fichero(self):
+        try:
+            return os.stat(self.ruta).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _leer(self):
+        """Compila el fichero (o la configuración predeterminada si no existe)"""
+        modificado = self._fecha_fichero()
+        if modificado is None:
+            return compilar({}), None
+        try:
+            with open(self.ruta, encoding='utf-8') as fichero:
+                contenido = json.load(fichero)
+        except json.JSONDecodeError as e:
+            raise ErrorConfiguracion(f"JSON no válido: {e}")
+        except ValueError as e:
+            # p. ej. UnicodeDecodeError: guardado como UTF-16 en lugar de UTF-8
+            raise ErrorConfiguracion(f"Fichero no válido (debe ser JSON en UTF-8): {e}")
+        return compilar(contenido), modificado
+
+    def cargar(self):
+        """Carga inicial; si el fichero no es válido se sigue con la configuración predeterminada"""
+        try:
+            self._estado, self._modificado = self._leer()
+        except (ErrorConfiguracion, OSError) as e:
+            self._modificado = self._fecha_fichero()
+            log.error("Configuración de servidores no válida, se usa la predeterminada: %s", e)
+            return False
+        return True
+
+    def recargar(self, guilds, forzar=False):
+        """Recarga el fichero y sustituye la configuración si es válida.
+
+        Solo se validan los servidores cuya configuración cambia. Con
+        ``forzar`` se aplica aunque falten roles o canales. Devuelve
+        (aplicada, lista de errores).
+        """
+        try:
+            nuevo, modificado = self._leer()
+        except (ErrorConfiguracion, OSError) as e:
+            self._modificado = self._fecha_fichero()
+            return False, [str(e)]
+
+        errores = []
+        for guild in guilds:
+            config = nuevo[1].get(guild.id, nuevo[0])
+            if config.huella == self.de(guild).huella:
+                continue
+            errores.extend(f"{guild.name}: falta el {falta}" for falta in validar(guild, config))
+
+        self._modificado = modificado
+        if errores and not forzar:
+            return False, errores
+        self._estado = nuevo
+        return True, errores
+
+    def iniciar(self, guilds):
+        """Vigila el fichero en segundo plano y recarga cuando cambia"""
+        if self.activo:
+            return
+        self._tarea = asyncio.create_task(self._vigilar(guilds), name='configuracion')
+
+    async def _vigilar(self, guilds):
+        while True:
+            await asyncio.sleep(INTERVALO_VIGILANCIA)
+            if self._fecha_fichero() == self._modificado:
+                continue
+            try:
+                aplicada, errores = self.recargar(guilds())
+            except Exception as e:
+                # Una recarga fallida no detiene la vigilancia: se vuelve a intentar cuando cambie el fichero
+                self._modificado = self._fecha_fichero()
+                log.exception("Error al recargar la configuración de servidores: %s", e)
+                continue
+            if aplicada:
+                log.info("Configuración de servidores recargada desde %s", self.ruta)
+                for error in errores:
+                    log.warning("Configuración recargada con referencias que faltan: %s", error)
+            else:
+                log.error("Configuración de servidores no recargada: %s", '; '.join(errores))
+
+
+_almacen = AlmacenConfiguracion()
+
+
+def configurar(ruta):
+    global _almacen
+    _almacen = AlmacenConfiguracion(ruta)
+    return _almacen
+
+
+def almacen():
+    return _almacen
+
+
+def de(guild):
+    return _almacen.de(guild)
+
+
+def canal(guild, clave):
+    """Canal configurado para ``clave`` en el servidor, o None"""
+    nombre = _almacen.de(guild).nombre_canal(clave)
+    return indice.canal(guild, nombre) if nombre else None
@@ -0,0 +1,85 @@
+import asyncio
+from dataclasses import dataclass
+
+import discord
+
+# Estados posibles del envío en cada servidor
+ENVIADO = 'enviado'
+SIN_CANAL = 'sin_canal'
+SIN_ROL = 'sin_rol'
+FALLIDO = 'fallido'
+
+ICONOS = {
+    ENVIADO: '✅',
+    SIN_CANAL: '⚠️',
+    SIN_ROL: '⚠️',
+    FALLIDO: '❌',
+}
+
+
+@dataclass
+class ResultadoGuild:
+    """Resultado de una difusión en un servidor"""
+    guild_id: int
+    guild_nombre: str
+    estado: str
+    detalle: str = ''
+    mensaje_id: int = None
+
+
+class Omitido(Exception):
+    """Lanzada por la función de envío para omitir un servidor con un estado concreto"""
+
+    def __init__(self, estado, detalle=''):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+
+
+async def difundir(guilds, enviar, concurrencia=5):
+    """Ejecuta ``enviar(guild)`` en todos los servidores en paralelo.
+
+    Cada servidor publica en su propio canal, así que sus peticiones caen en
+    buckets de rate limit distintos (el cliente HTTP de discord.py ya espera
+    por bucket); el semáforo acota cuántas hay en vuelo a la vez para no
+    acercarse al límite global. Un fallo en un servidor no afecta al resto.
+
+    ``enviar`` devuelve el mensaje enviado o lanza ``Omitido``.
+    Devuelve una lista de ``ResultadoGuild`` en el mismo orden que ``guilds``.
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def procesar(guild):
+        async with semaforo:
+            try:
+                mensaje = await enviar(guild)
+            except Omitido as e:
+                return ResultadoGuild(guild.id, guild.name, e.estado, e.detalle)
+            except discord.HTTPException as e:
+                return ResultadoGuild(guild.id, guild.name, FALLIDO, f'HTTP {e.status}: {e.text}')
+            except asyncio.TimeoutError:
+                return ResultadoGuild(guild.id, guild.name, FALLIDO, 'tiempo de espera agotado')
+            except Exception as e:
+                # Hay excepciones sin mensaje: el resumen mostraría un fallo sin motivo
+                return ResultadoGuild(guild.id, guild.name, FALLIDO, str(e) or type(e).__name__)
+            return ResultadoGuild(guild.id, guild.name, ENVIADO, mensaje_id=getattr(mensaje, 'id', None))
+
+    return await asyncio.gather(*(procesar(guild) for guild in guilds))
+
+
+def resumen(resultados, limite=1900):
+    """Texto con el recuento por estado y una línea por servidor"""
+    recuento = {}
+    for resultado in resultados:
+        recuento[resultado.estado] = recuento.get(resultado.estado, 0) + 1
+    cabecera = ' · '.join(f'{ICONOS[estado]} {estado}: {total}' for estado, total in recuento.items())
+    lineas = [cabecera or 'Sin servidores']
+    for resultado in resultados:
+        linea = f'{ICONOS[resultado.estado]} **{resultado.guild_nombre}** — {resultado.estado}'
+        if resultado.detalle:
+            linea += f' ({resultado.detalle})'
+        if sum(len(l) + 1 for l in lineas) + len(linea) > limite:
+            lineas.append(f'… y {len(resultados) - len(lineas) + 1} servidores más')
+            break
+        lineas.append(linea)
+    return '\n'.join(lineas)
@@ -0,0 +1,238 @@
+import atexit
+import datetime
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import componentes
+
+log = logging.getLogger(__name__)
+
+VERSION = 1
+# Cada cuánto el hilo escritor vuelca el fichero a disco
+INTERVALO_VOLCADO = 1.0
+# Eventos que no se graban: no los procesa el bot o solo aportan ruido
+EVENTOS_IGNORADOS = {'PRESENCE_UPDATE', 'TYPING_START'}
+
+# Campos con datos personales y cómo se sustituyen
+_NOMBRES = {'username', 'global_name', 'nick', 'display_name'}
+_BORRAR = {'avatar', 'banner', 'email', 'avatar_decoration', 'avatar_decoration_data', 'bio'}
+_TEXTOS = {'content', 'topic'}
+_IDS_USUARIO = {'user_id', 'owner_id', 'author_id', 'target_user_id'}
+_USUARIO = 6
+# En los embeds y adjuntos se sustituye todo el texto salvo estos campos, y se quitan las URL
+_CONSERVAR = {'id', 'type', 'timestamp', 'content_type'}
+_URLS = {'url', 'proxy_url', 'icon_url', 'proxy_icon_url'}
+_MENCION = re.compile(r'<@!?(\d+)>')
+
+
+class Anonimizador:
+    """Sustituye los datos personales de un evento por seudónimos estables.
+
+    Los IDs de usuario se sustituyen por un HMAC con una sal de la
+    grabación (el mismo usuario da siempre el mismo ID, así que la
+    repetición sigue siendo coherente) y los nombres por un seudónimo
+    derivado de él. Los textos de los mensajes, los embeds (los anuncios
+    del propio bot llegan como MESSAGE_CREATE con embeds) y los nombres de
+    los adjuntos se sustituyen por uno de la misma longitud, y las menciones
+    ``<@id>`` que queden en otros textos y los IDs de usuario del
+    ``custom_id`` de los botones llevan el ID seudónimo. Los IDs de
+    servidores, canales y roles no se tocan.
+    """
+
+    def __init__(self, sal=None):
+        self.sal = (sal or os.urandom(16).hex()).encode('utf-8')
+
+    def id(self, valor):
+        if valor is None:
+            return None
+        resumen = hmac.new(self.sal, str(valor).encode('utf-8'), hashlib.sha256).digest()
+        # Se conserva el formato de snowflake (entero positivo de 63 bits)
+        return str(int.from_bytes(resumen[:8], 'big') >> 1)
+
+    def nombre(self, valor):
+        return f"usuario-{hashlib.sha256(self.sal + str(valor).encode('utf-8')).hexdigest()[:8]}" if valor else valor
+
+    def _usuario(self, datos):
+        """Un objeto de usuario: tiene 'id' y 'username'"""
+        return isinstance(datos, dict) and 'id' in datos and 'username' in datos
+
+    def limpiar(self, datos):
+        if isinstance(datos, list):
+            return [self.limpiar(valor) for valor in datos]
+        if not isinstance(datos, dict):
+            return datos
+        limpio = {}
+        for clave, valor in datos.items():
+            if clave in _NOMBRES and isinstance(valor, str):
+                limpio[clave] = self.nombre(valor)
+            elif clave in _BORRAR:
+                limpio[clave] = None
+            elif clave in _TEXTOS and isinstance(valor, str):
+                limpio[clave] = '·' * len(valor)
+            elif clave == 'token' and isinstance(valor, str):
+                limpio[clave] = 'token'
+            elif clave in _IDS_USUARIO:
+                limpio[clave] = self.id(valor)
+            elif clave == 'id' and self._usuario(datos):
+                limpio[clave] = self.id(valor)
+            elif clave in ('users', 'members') and isinstance(valor, dict):
+                # Datos resueltos de una interacción: el índice es el ID del usuario
+                limpio[clave] = {self.id(usuario_id): self.limpiar(dato) for usuario_id, dato in valor.items()}
+            elif clave == 'options' and isinstance(valor, list):
+                limpio[clave] = [self._opcion(opcion) for opcion in valor]
+            elif clave == 'custom_id' and isinstance(valor, str):
+                limpio[clave] = self._custom_id(valor)
+            elif clave in ('embeds', 'attachments'):
+                limpio[clave] = self._textos(valor)
+            elif isinstance(valor, str):
+                limpio[clave] = self._menciones(valor)
+            else:
+                limpio[clave] = self.limpiar(valor)
+        return limpio
+
+    def _menciones(self, texto):
+        return _MENCION.sub(lambda mencion: f'<@{self.id(mencion.group(1))}>', texto)
+
+    def _custom_id(self, valor):
+        """IDs de usuario de un ``custom_id`` de :mod:`componentes` (todos, si la acción no está registrada)"""
+        nombre, ids = componentes._descodificar(valor)
+        if ids is None:
+            return self._menciones(valor)
+        posiciones = componentes.posiciones_usuario(nombre)
+        ids = [self.id(id) if posiciones is None or posicion in posiciones else str(id) for posicion, id in enumerate(ids)]
+        return componentes.SEPARADOR.join([nombre, *ids])
+
+    def _textos(self, datos, clave=None):
+        """Embeds y adjuntos: se sustituyen todos los textos y se quitan las URL"""
+        if isinstance(datos, list):
+            return [self._textos(valor) for valor in datos]
+        if isinstance(datos, dict):
+            return {clave: None if clave in _URLS else self._textos(valor, clave) for clave, valor in datos.items()}
+        if isinstance(datos, str) and clave not in _CONSERVAR:
+            return '·' * len(datos)
+        return datos
+
+    def _opcion(self, opcion):
+        opcion = self.limpiar(opcion)
+        if opcion.get('type') == _USUARIO:
+            opcion['value'] = self.id(opcion.get('value'))
+        elif isinstance(opcion.get('value'), str):
+            opcion['value'] = '·' * len(opcion['value'])
+        return opcion
+
+
+class GrabadorEventos:
+    """Graba los eventos que llegan del gateway en un fichero de solo añadir.
+
+    Se envuelven los parsers de discord.py (los mismos que llama el
+    websocket con cada evento), así que se graba exactamente lo que procesa
+    el bot. En el bucle de eventos solo se serializa el evento; anonimizar
+    y comprimir se hace en un hilo aparte. El fichero es JSON por líneas
+    comprimido con gzip: una cabecera ``{"version", "inicio", "anonimizado"}``
+    al empezar cada grabación y después ``[milisegundos, evento, datos]``.
+    Como gzip admite varios miembros seguidos, se puede seguir añadiendo
+    tras un reinicio.
+    """
+
+    def __init__(self, ruta, anonimizar=True, sal=None):
+        self.ruta = ruta
+        self.anonimizador = Anonimizador(sal) if anonimizar else None
+        self.eventos = 0
+        self._cola = queue.SimpleQueue()
+        self._inicio = None
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def instalar(self, bot):
+        """Empieza a grabar los eventos que procesa ``bot``"""
+        if self.activo:
+            return
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._inicio = time.monotonic()
+        self._cola.put({
+            'version': VERSION,
+            'inicio': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'anonimizado': self.anonimizador is not None,
+        })
+        self._hilo = threading.Thread(target=self._escribir, name='grabacion', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+        parsers = bot._connection.parsers
+        for evento, parser in list(parsers.items()):
+            if evento not in EVENTOS_IGNORADOS:
+                parsers[evento] = self._envolver(evento, parser)
+        log.info('Grabando los eventos del gateway en %s', self.ruta)
+
+    def _envolver(self, evento, parser):
+        def grabar(datos):
+            # Se serializa antes de procesarlo: algunos parsers modifican los datos
+            self._cola.put((round((time.monotonic() - self._inicio) * 1000), evento, json.dumps(datos, ensure_ascii=False)))
+            self.eventos += 1
+            return parser(datos)
+        return grabar
+
+    def _escribir(self):
+        with gzip.open(self.ruta, 'at', encoding='utf-8') as fichero:
+            ultimo_volcado = time.monotonic()
+            while True:
+                try:
+                    entrada = self._cola.get(timeout=INTERVALO_VOLCADO)
+                except queue.Empty:
+                    entrada = False
+                if entrada is None:
+                    break
+                if isinstance(entrada, dict):
+                    fichero.write(json.dumps(entrada) + '\n')
+                elif entrada:
+                    milisegundos, evento, texto = entrada
+                    datos = json.loads(texto)
+                    if self.anonimizador is not None:
+                        datos = self.anonimizador.limpiar(datos)
+                    fichero.write(json.dumps([milisegundos, evento, datos], ensure_ascii=False, separators=(',', ':')) + '\n')
+                if time.monotonic() - ultimo_volcado >= INTERVALO_VOLCADO:
+                    fichero.flush()
+                    ultimo_volcado = time.monotonic()
+
+    def detener(self):
+        """Escribe lo pendiente y cierra el fichero"""
+        if self.activo:
+            self._cola.put(None)
+            self._hilo.join()
+        self._hilo = None
+
+
+def leer(ruta):
+    """Recorre una grabación y devuelve (milisegundos, evento, datos).
+
+    Si el fichero contiene varias grabaciones seguidas, los tiempos de cada
+    una continúan donde terminó la anterior.
+    """
+    desfase = 0
+    ultimo = 0
+    with gzip.open(ruta, 'rt', encoding='utf-8') as fichero:
+        try:
+            for linea in fichero:
+                entrada = json.loads(linea)
+                if isinstance(entrada, dict):
+                    desfase = ultimo
+                    continue
+                milisegundos, evento, datos = entrada
+                ultimo = desfase + milisegundos
+                yield ultimo, evento, datos
+        except (EOFError, json.JSONDecodeError):
+            # El proceso que grababa terminó sin cerrar el fichero: se llega hasta el último volcado
+            log.warning('La grabación %s está cortada; se usa hasta el último evento completo', ruta)
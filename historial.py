@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+
+import discord
+
+import almacen
+import sanciones
+
+log = logging.getLogger(__name__)
+
+# Mensajes guardados por transacción
+TAMANO_LOTE = 100
+# Pausa entre lotes para ceder el bucle de eventos y la cuota de la API a los comandos
+PAUSA_LOTE = 0.5
+
+PERIODO_PRUEBA = 'periodo_prueba'
+PLACA = 'placa'
+ASCENSO = 'ascenso'
+DESCENSO = 'descenso'
+DESPIDO = 'despido'
+SANCION = 'sancion'
+
+_ID_MIEMBRO = re.compile(r"ID: `(\d+)`")
+_MENCION_USUARIO = re.compile(r"<@!?(\d+)>")
+_MENCION_ROL = re.compile(r"<@&(\d+)>")
+_ROBLOX = re.compile(r"\*\*Usuario de Roblox:\*\* `([^`]*)`")
+_PLACA = re.compile(r"\*\*([A-Z]{3}-\d{1,2})\*\*")
+_STRIKES = re.compile(r"\*\*(\d+)\*\* strikes")
+
+
+@dataclass
+class Registro:
+    """Anuncio de RR. HH. reconstruido a partir de su embed"""
+    tipo: str
+    miembro_id: int = None
+    dato: str = None
+    motivo: str = None
+    autorizado_por: int = None
+    ejecuta: str = None
+    strikes: int = None
+
+
+def _buscar(patron, texto):
+    match = patron.search(texto or '')
+    return match.group(1) if match else None
+
+
+def _entero(valor):
+    return int(valor) if valor is not None else None
+
+
+def _pie(embed, prefijo):
+    texto = embed.footer.text or ''
+    return texto[len(prefijo):] if texto.startswith(prefijo) else None
+
+
+def parsear(mensaje):
+    """Convierte un mensaje con el embed de un ``enviar_mensaje_*`` en un Registro, o None"""
+    for embed in mensaje.embeds:
+        campos = {campo.name: campo.value for campo in embed.fields}
+        titulo = embed.title
+
+        if titulo == "🔄 Período de Pruebas":
+            obrero = campos.get("👷 Obrero en pruebas:")
+            return Registro(
+                PERIODO_PRUEBA,
+                miembro_id=_entero(_buscar(_ID_MIEMBRO, obrero)),
+                dato=_buscar(_ROBLOX, obrero),
+                ejecuta=_pie(embed, "Período iniciado por "),
+            )
+        if titulo == "🛡️ Asignación de Placa":
+            return Registro(
+                PLACA,
+                miembro_id=_entero(_buscar(_MENCION_USUARIO, embed.description) or _buscar(_MENCION_USUARIO, mensaje.content)),
+                dato=_buscar(_PLACA, campos.get("🆔 Número de Placa")),
+                ejecuta=_pie(embed, "Placa asignada por "),
+            )
+        if titulo == "🎉 ¡Enhorabuena por tu ascenso!":
+            return Registro(
+                ASCENSO,
+                miembro_id=_entero(_buscar(_ID_MIEMBRO, campos.get("👷 Obrero ascendido:"))),
+                dato=_buscar(_MENCION_ROL, campos.get("🥇 Rango ascendido:")),
+                motivo=campos.get("💬 Motivo:"),
+                ejecuta=_pie(embed, "Ejecuta: "),
+            )
+        if titulo == "🙁 Lo sentimos por tu descenso...":
+            return Registro(
+                DESCENSO,
+                miembro_id=_entero(_buscar(_ID_MIEMBRO, campos.get("👷 Obrero descendido:"))),
+                dato=_buscar(_MENCION_ROL, campos.get("📉 Rango descendido:")),
+                motivo=campos.get("💬 Motivo:"),
+                ejecuta=_pie(embed, "Ejecuta: "),
+            )
+        if titulo == "💔 ¡Lamentamos tu despido!":
+            return Registro(
+                DESPIDO,
+                miembro_id=_entero(_buscar(_ID_MIEMBRO, campos.get("👷 Obrero despedido:"))),
+                motivo=campos.get("💬 Motivo:"),
+                ejecuta=_pie(embed, "Ejecuta: "),
+            )
+        if titulo == "📛 Sanción Aplicada":
+            return Registro(
+                SANCION,
+                miembro_id=_entero(_buscar(_ID_MIEMBRO, campos.get("👷 Empleado sancionado:"))),
+                dato=_buscar(_MENCION_ROL, embed.description),
+                motivo=campos.get("💬 Razón:"),
+                autorizado_por=_entero(_buscar(_MENCION_USUARIO, campos.get("✅ Autorizado por:"))),
+                ejecuta=_pie(embed, "Ejecuta: "),
+                strikes=_entero(_buscar(_STRIKES, campos.get("⚠️ Acumulación de strike:"))),
+            )
+    return None
+
+
+class ImportadorHistorial:
+    """Importa el historial de RR. HH. ya publicado en los canales de anuncios.
+
+    Recorre cada canal del mensaje más antiguo al más reciente con
+    ``channel.history`` (que pide páginas de 100 según se consumen), guarda
+    los registros por lotes en una transacción junto con el ID del último
+    mensaje procesado y, si se interrumpe, continúa desde ese punto. Los
+    canales se procesan de uno en uno en una tarea de fondo con una pausa
+    entre lotes, para no quitar cuota de la API a los comandos.
+
+    Con ``registro_sanciones``, las sanciones anteriores al registro se
+    añaden también a él (una vez por mensaje), para que el total de strikes
+    y su caducidad cuenten las sanciones ya publicadas.
+    """
+
+    def __init__(self, con=None, registro_sanciones=None):
+        self._con = con
+        self.registro_sanciones = registro_sanciones
+        self._tabla_creada = False
+        self._tarea = None
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.executescript(
+                'CREATE TABLE IF NOT EXISTS historial_rrhh ('
+                ' mensaje_id INTEGER PRIMARY KEY,'
+                ' guild_id INTEGER NOT NULL,'
+                ' canal_id INTEGER NOT NULL,'
+                ' tipo TEXT NOT NULL,'
+                ' miembro_id INTEGER,'
+                ' dato TEXT,'
+                ' motivo TEXT,'
+                ' autorizado_por INTEGER,'
+                ' ejecuta TEXT,'
+                ' strikes INTEGER,'
+                ' creado REAL NOT NULL);'
+                'CREATE INDEX IF NOT EXISTS historial_rrhh_miembro ON historial_rrhh (guild_id, miembro_id, creado);'
+                'CREATE TABLE IF NOT EXISTS historial_progreso ('
+                ' canal_id INTEGER PRIMARY KEY,'
+                ' guild_id INTEGER NOT NULL,'
+                ' ultimo_mensaje_id INTEGER,'
+                ' importados INTEGER NOT NULL DEFAULT 0,'
+                ' completado INTEGER NOT NULL DEFAULT 0);'
+            )
+        return self._con
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done()
+
+    # --- Progreso ---
+
+    def progreso(self, guild_id):
+        """Lista de (canal_id, importados, completado) de un servidor"""
+        return [
+            (fila['canal_id'], fila['importados'], bool(fila['completado']))
+            for fila in self.con.execute(
+                'SELECT canal_id, importados, completado FROM historial_progreso WHERE guild_id = ?', (guild_id,)
+            )
+        ]
+
+    def completado(self, canal_id):
+        """Indica si el canal se ha importado entero al menos una vez"""
+        fila = self.con.execute('SELECT completado FROM historial_progreso WHERE canal_id = ?', (canal_id,)).fetchone()
+        return fila is not None and bool(fila['completado'])
+
+    def placas(self, guild_id):
+        """(miembro_id, número) de la última placa anunciada de cada miembro, de la más reciente a la más antigua"""
+        return [
+            (fila['miembro_id'], int(fila['dato'].split('-')[1]))
+            for fila in self.con.execute(
+                'SELECT miembro_id, dato, MAX(mensaje_id) AS mensaje_id FROM historial_rrhh'
+                ' WHERE guild_id = ? AND tipo = ? AND miembro_id IS NOT NULL AND dato IS NOT NULL'
+                ' GROUP BY miembro_id ORDER BY mensaje_id DESC',
+                (guild_id, PLACA),
+            )
+        ]
+
+    def pendientes(self):
+        """IDs de los canales con una importación empezada y sin terminar"""
+        return [fila[0] for fila in self.con.execute('SELECT canal_id FROM historial_progreso WHERE completado = 0')]
+
+    def _punto_control(self, canal):
+        fila = self.con.execute(
+            'SELECT ultimo_mensaje_id, completado FROM historial_progreso WHERE canal_id = ?', (canal.id,)
+        ).fetchone()
+        if fila is None:
+            self.con.execute(
+                'INSERT INTO historial_progreso (canal_id, guild_id) VALUES (?, ?)', (canal.id, canal.guild.id)
+            )
+            return None, False
+        return fila['ultimo_mensaje_id'], bool(fila['completado'])
+
+    def reiniciar(self, canal_id):
+        """Olvida el punto de control de un canal para volver a importarlo entero"""
+        self.con.execute('DELETE FROM historial_progreso WHERE canal_id = ?', (canal_id,))
+
+    # --- Importación ---
+
+    def _guardar(self, canal, lote, ultimo_mensaje_id):
+        if self.registro_sanciones is not None:
+            # Crea la tabla de sanciones antes de abrir la transacción (executescript hace COMMIT)
+            self.registro_sanciones.con
+            inicio = self.registro_sanciones.inicio(canal.guild.id)
+        with almacen.transaccion(self.con):
+            for mensaje_id, creado, registro in lote:
+                self.con.execute(
+                    'INSERT OR REPLACE INTO historial_rrhh'
+                    ' (mensaje_id, guild_id, canal_id, tipo, miembro_id, dato, motivo, autorizado_por, ejecuta, strikes, creado)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        mensaje_id, canal.guild.id, canal.id, registro.tipo, registro.miembro_id, registro.dato,
+                        registro.motivo, registro.autorizado_por, registro.ejecuta, registro.strikes, creado,
+                    ),
+                )
+                if registro.tipo == SANCION and self.registro_sanciones is not None and (inicio is None or creado < inicio):
+                    self._sembrar_sancion(canal.guild, mensaje_id, creado, registro)
+            self.con.execute(
+                'UPDATE historial_progreso SET ultimo_mensaje_id = ?, importados = importados + ? WHERE canal_id = ?',
+                (ultimo_mensaje_id, len(lote), canal.id),
+            )
+
+    def _sembrar_sancion(self, guild, mensaje_id, creado, registro):
+        """Añade una sanción importada al registro de sanciones.
+
+        Los anuncios muestran el total acumulado, así que la sanción suma la
+        diferencia con el anuncio anterior del mismo miembro (o 0 si el total
+        bajó). Las posteriores a la primera sanción registrada con un comando
+        no se añaden: ya están en el registro.
+        """
+        if registro.miembro_id is None:
+            return
+        anterior = self.con.execute(
+            'SELECT strikes FROM historial_rrhh WHERE guild_id = ? AND miembro_id = ? AND tipo = ? AND strikes IS NOT NULL AND mensaje_id < ?'
+            ' ORDER BY mensaje_id DESC LIMIT 1',
+            (guild.id, registro.miembro_id, SANCION, mensaje_id),
+        ).fetchone()
+        strikes = max((registro.strikes or 0) - (anterior['strikes'] if anterior else 0), 0)
+        rol = guild.get_role(int(registro.dato)) if registro.dato else None
+        self.registro_sanciones.registrar(
+            guild.id, registro.miembro_id, rol or 'Rol desconocido', strikes, registro.motivo,
+            autorizado_por=registro.autorizado_por, clave=f"{sanciones.CLAVE_HISTORIAL}{mensaje_id}", creado=creado,
+        )
+
+    async def importar_canal(self, canal):
+        """Importa un canal desde su punto de control; devuelve cuántos registros se guardaron.
+
+        Un canal ya completado se sigue leyendo desde su último mensaje, así
+        que volver a importarlo recoge los anuncios publicados después.
+        """
+        ultimo, _ = self._punto_control(canal)
+        despues = discord.Object(id=ultimo) if ultimo else None
+        lote = []
+        total = 0
+        leidos = 0
+        async for mensaje in canal.history(limit=None, after=despues, oldest_first=True):
+            ultimo = mensaje.id
+            leidos += 1
+            registro = parsear(mensaje)
+            if registro is not None:
+                lote.append((mensaje.id, mensaje.created_at.timestamp(), registro))
+            # El punto de control avanza también con los mensajes que no son anuncios
+            if leidos % TAMANO_LOTE == 0:
+                self._guardar(canal, lote, ultimo)
+                total += len(lote)
+                lote = []
+                await asyncio.sleep(PAUSA_LOTE)
+        self._guardar(canal, lote, ultimo)
+        total += len(lote)
+        self.con.execute('UPDATE historial_progreso SET completado = 1 WHERE canal_id = ?', (canal.id,))
+        return total
+
+    def iniciar(self, canales):
+        """Importa los canales de uno en uno en una tarea de fondo (no hace nada si ya hay una en marcha)"""
+        if self.activo:
+            return False
+        self._tarea = asyncio.create_task(self._importar(list(canales)), name='historial')
+        return True
+
+    async def _importar(self, canales):
+        for canal in canales:
+            try:
+                total = await self.importar_canal(canal)
+                log.info("Historial de '%s' importado: %d registros nuevos", canal.name, total, extra={'guild': canal.guild.id, 'canal': canal.id})
+            except discord.HTTPException as e:
+                log.error("Error al importar el historial de '%s': %s", canal.name, e, extra={'guild': canal.guild.id, 'canal': canal.id})
+            except Exception as e:
+                # Un anuncio que no se puede leer o un fallo de la base de datos: el resto de canales sigue
+                log.exception("Error al importar el historial de '%s': %s", canal.name, e, extra={'guild': canal.guild.id, 'canal': canal.id})
@@ -0,0 +1,180 @@
+# Índices por servidor: ID del servidor -> IndiceGuild
+_indices = {}
+
+
+class IndiceGuild:
+    """Índice nombre -> objeto de los roles y canales de un servidor.
+
+    Se construye una sola vez y se mantiene al día con los eventos del gateway,
+    de modo que los comandos resuelven roles y canales por nombre en O(1) en
+    lugar de recorrer ``guild.roles`` / ``guild.channels`` en cada búsqueda.
+    """
+
+    def __init__(self, guild):
+        self.guild = guild
+        # Nombre -> lista de IDs (puede haber nombres repetidos)
+        self._roles = {}
+        self._canales = {}
+        # IDs de los roles que el bot puede asignar
+        self._asignables = set()
+        self.reconstruir()
+
+    def reconstruir(self):
+        """Reconstruye el índice completo a partir del estado del servidor"""
+        self._roles = {}
+        self._canales = {}
+        # guild.roles está ordenado por posición, igual que discord.utils.get
+        for rol in self.guild.roles:
+            self._roles.setdefault(rol.name, []).append(rol.id)
+        for canal in self.guild.channels:
+            self._canales.setdefault(canal.name, []).append(canal.id)
+        self.recalcular_asignables()
+
+    def recalcular_asignables(self):
+        """Recalcula qué roles quedan por debajo del rol más alto del bot"""
+        self._asignables = {rol.id for rol in self.guild.roles if self._es_asignable(rol)}
+
+    def _es_asignable(self, rol):
+        me = self.guild.me
+        if me is None:
+            return False
+        return rol.position < me.top_role.position and not rol.managed and not rol.is_default()
+
+    # --- Consultas ---
+
+    def rol(self, nombre):
+        """Devuelve el rol con ese nombre o None"""
+        ids = self._roles.get(nombre)
+        return self.guild.get_role(ids[0]) if ids else None
+
+    def canal(self, nombre):
+        """Devuelve el canal con ese nombre o None"""
+        ids = self._canales.get(nombre)
+        return self.guild.get_channel(ids[0]) if ids else None
+
+    def asignable(self, rol):
+        """Indica si el bot puede asignar o quitar el rol"""
+        return rol.id in self._asignables
+
+    # --- Actualizaciones incrementales ---
+
+    def _quitar_id(self, tabla, nombre, objeto_id):
+        ids = tabla.get(nombre)
+        if not ids:
+            return
+        try:
+            ids.remove(objeto_id)
+        except ValueError:
+            return
+        if not ids:
+            del tabla[nombre]
+
+    def rol_creado(self, rol):
+        ids = self._roles.setdefault(rol.name, [])
+        ids.append(rol.id)
+        if len(ids) > 1:
+            ids.sort(key=lambda rol_id: self._posicion_rol(rol_id))
+        if self._es_asignable(rol):
+            self._asignables.add(rol.id)
+
+    def rol_actualizado(self, antes, despues):
+        if antes.name != despues.name or antes.position != despues.position:
+            self._quitar_id(self._roles, antes.name, antes.id)
+            self.rol_creado(despues)
+        # Si se movió uno de los roles del bot cambia la jerarquía entera
+        me = self.guild.me
+        if me is not None and despues in me.roles:
+            self.recalcular_asignables()
+        elif self._es_asignable(despues):
+            self._asignables.add(despues.id)
+        else:
+            self._asignables.discard(despues.id)
+
+    def rol_eliminado(self, rol):
+        self._quitar_id(self._roles, rol.name, rol.id)
+        self._asignables.discard(rol.id)
+
+    def canal_creado(self, canal):
+        self._canales.setdefault(canal.name, []).append(canal.id)
+
+    def canal_actualizado(self, antes, despues):
+        if antes.name != despues.name:
+            self._quitar_id(self._canales, antes.name, antes.id)
+            self.canal_creado(despues)
+
+    def canal_eliminado(self, canal):
+        self._quitar_id(self._canales, canal.name, canal.id)
+
+    def _posicion_rol(self, rol_id):
+        rol = self.guild.get_role(rol_id)
+        return rol.position if rol else 0
+
+
+def construir(guilds):
+    """Construye los índices de todos los servidores (se llama en on_ready)"""
+    for guild in guilds:
+        _indices[guild.id] = IndiceGuild(guild)
+
+
+def indice(guild):
+    """Devuelve el índice de un servidor, construyéndolo si aún no existe"""
+    idx = _indices.get(guild.id)
+    if idx is None or idx.guild is not guild:
+        idx = _indices[guild.id] = IndiceGuild(guild)
+    return idx
+
+
+def rol(guild, nombre):
+    return indice(guild).rol(nombre)
+
+
+def canal(guild, nombre):
+    return indice(guild).canal(nombre)
+
+
+def asignable(guild, rol):
+    return indice(guild).asignable(rol)
+
+
+def registrar(bot):
+    """Registra los listeners que mantienen los índices al día"""
+
+    async def on_guild_join(guild):
+        _indices[guild.id] = IndiceGuild(guild)
+
+    async def on_guild_available(guild):
+        _indices[guild.id] = IndiceGuild(guild)
+
+    async def on_guild_remove(guild):
+        _indices.pop(guild.id, None)
+
+    async def on_guild_role_create(rol):
+        indice(rol.guild).rol_creado(rol)
+
+    async def on_guild_role_update(antes, despues):
+        indice(despues.guild).rol_actualizado(antes, despues)
+
+    async def on_guild_role_delete(rol):
+        indice(rol.guild).rol_eliminado(rol)
+
+    async def on_guild_channel_create(canal):
+        indice(canal.guild).canal_creado(canal)
+
+    async def on_guild_channel_update(antes, despues):
+        indice(despues.guild).canal_actualizado(antes, despues)
+
+    async def on_guild_channel_delete(canal):
+        indice(canal.guild).canal_eliminado(canal)
+
+    async def on_member_update(antes, despues):
+        # Solo interesa el propio bot: sus roles definen qué puede asignar
+        if despues.id == bot.user.id and antes.roles != despues.roles:
+            indice(despues.guild).recalcular_asignables()
+
+    for listener in (
+        on_guild_join, on_guild_available, on_guild_remove,
+        on_guild_role_create, on_guild_role_update, on_guild_role_delete,
+        on_guild_channel_create, on_guild_channel_update, on_guild_channel_delete,
+        on_member_update,
+    ):
+        bot.add_listener(listener)
@@ -1,135 +1,506 @@
+import asyncio
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
+import io
+import logging
 import os
+from typing import Optional
 from dotenv import load_dotenv
 import datetime
 import time
 import re
+import signal
+from zoneinfo import ZoneInfo
+
+import asistencia
+import bitacora
+import cluster
+import componentes
+import configuracion
+import difusion
+import grabacion
+import indice
+import masivo
+import periodos
+import metricas
+import miembros
+import mutaciones
+import placas
+import sincronizacion
+import prioridad
+import simulador
+import trabajador
+import tuberia
+from cola import ColaTrabajos, ErrorTrabajo
+from mutaciones import PlanMiembro
+from buzon import Anuncio, Buzon
+from asistencia import RegistroAsistencia
+from historial import ImportadorHistorial
+from periodos import RegistroPeriodos, VigilantePeriodos
+from placas import RegistroPlacas
+from sanciones import RegistroSanciones
+from planificador import Planificador, TareaDiaria
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Servidor alternativo a Discord, p. ej. el simulador local (DISCORD_API=http://127.0.0.1:8765)
+if os.getenv('DISCORD_API'):
+    simulador.apuntar(os.getenv('DISCORD_API'))
+
+log = logging.getLogger('main')
+
+# Intent de miembros y su estrategia de descarga: 'no', 'perezoso', 'inicio' o 'demanda'
+ESTRATEGIA_MIEMBROS = os.getenv('INTENT_MIEMBROS', miembros.SIN_INTENT)
+miembros.configurar(
+    tamano=int(os.getenv('CACHE_MIEMBROS_TAMANO', '5000')),
+    ttl=float(os.getenv('CACHE_MIEMBROS_TTL', '300')),
+    estrategia=ESTRATEGIA_MIEMBROS
+)
+
 # Configuración del bot
 intents = discord.Intents.default()
 intents.message_content = True
+miembros.aplicar_intents(intents, ESTRATEGIA_MIEMBROS)
 
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Configuración de roles predefinidos para período de prueba
-ROLES_PERIODO_PRUEBA = [
-    "═══════Medallas═══════",  # Rol principal de período de prueba
-    "═══════Personal═══════",  # Rol adicional
-    "🔖〴Nuevo Ingreso〴", # Otro rol que se puede asignar
-    "👷〴Personal MTMS〴",  # Rol principal de período de prueba
-    "═══════Departamento de Obras═══════",  # Rol adicional
-    "👷〴 Obrero en Pruebas",
-    "═══════Sanciones═══════",  # Rol principal de período de prueba
-    "═══════Otros═══════",  # Rol adicional
-    "Curso Aprendiz"
-]
-
-# Diccionario de prefijos de placa según el rol
-PREFIJOS_PLACA = {
-    "🚐〴Secretario De Infraestructura General〴": "SEC",
-    "🚐〴Sub. Secretario De Infraestructura General〴": "SBC",
-    "⛏️〴Director General〴": "DIR",
-    "🎩〴Sub. Director General〴": "SDR",
-    "🔧〴Director General En Pruebas〴": "DGP",
-    "🔎🧰〴Supervisor General〴": "SPG",
-    "💼🔧〴Inspector〴": "INS",
-    "💼🚧〴Sub Inspector〴": "SBI",
-    "🧰〴Jefe De Area Técnica〴": "JAT",
-    "🚗〴Jefe De Incautaciones〴": "JIC",
-    "🦺〴Jefe De Carreteras〴": "JCT",
-    "🛑〴Tecnico Superior〴": "TCS",
-    "⛔〴Operador Vial〴": "OPV",
-    "🚧〴Auxiliar Vial〴": "AXV",
-    "🚦〴Mecanico Experimentado〴": "MEC",
-    "🔖〴Nuevo Ingreso〴": "NVI"
-}
+# Modo clúster: si este proceso lo lanzó cluster.py, solo abre su rango de shards
+nodo = cluster.nodo_desde_entorno()
+if nodo is not None:
+    bot = commands.AutoShardedBot(
+        command_prefix='!',
+        intents=intents,
+        shard_ids=nodo.shards,
+        shard_count=nodo.total,
+        chunk_guilds_at_startup=ESTRATEGIA_MIEMBROS == miembros.INICIO,
+        http_trace=metricas.traza_http()
+    )
+else:
+    bot = commands.Bot(
+        command_prefix='!',
+        intents=intents,
+        chunk_guilds_at_startup=ESTRATEGIA_MIEMBROS == miembros.INICIO,
+        http_trace=metricas.traza_http()
+    )
+indice.registrar(bot)
+miembros.registrar(bot)
+metricas.registrar(bot)
+
+# Cola con prioridad para las peticiones REST: respuestas, luego miembros, luego anuncios
+planificador_rest = prioridad.PlanificadorREST(bot.http)
+planificador_rest.instalar()
+
+class ContextoPrefijo(commands.Context):
+    """Contexto de los comandos de prefijo: sus respuestas van por delante de los anuncios.
+
+    La prioridad se fija solo alrededor de cada respuesta; los cambios de
+    miembros y los anuncios que haga el comando se clasifican por su ruta.
+    """
+
+    async def send(self, *args, **kwargs):
+        with prioridad.con_prioridad(prioridad.INTERACCION):
+            return await super().send(*args, **kwargs)
+
+_obtener_contexto = bot.get_context
+
+async def contexto_prefijo(origen, *, cls=ContextoPrefijo):
+    return await _obtener_contexto(origen, cls=cls)
+
+bot.get_context = contexto_prefijo
+
+# Zona horaria y hora del mensaje de actividad diaria
+ZONA_HORARIA = ZoneInfo(os.getenv('ZONA_HORARIA', 'Europe/Madrid'))
+HORA_ACTIVIDAD = datetime.time(15, 10)
+
+# Informe de quién no ha reaccionado, unas horas después del mensaje de actividad
+# (solo se programa si se indican las horas y hay intent de miembros; se publica en el canal
+# 'informe_actividad' de cada servidor o en CANAL_INFORME_ACTIVIDAD, y los servidores sin canal se omiten)
+HORAS_INFORME_ACTIVIDAD = float(os.getenv('HORAS_INFORME_ACTIVIDAD', '0'))
+CANAL_INFORME_ACTIVIDAD = os.getenv('CANAL_INFORME_ACTIVIDAD')
+
+# Número máximo de servidores a los que se envía a la vez
+CONCURRENCIA_DIFUSION = int(os.getenv('CONCURRENCIA_DIFUSION', '5'))
+
+planificador = Planificador()
+
+# Modo del proceso: 'completo' o 'gateway' (el trabajo REST pesado lo hacen los procesos de trabajador.py)
+MODO_PROCESO = os.getenv('MODO_PROCESO', trabajador.COMPLETO)
+# Cola de trabajos compartida con los procesos de trabajos (solo se usa en modo gateway)
+cola_trabajos = ColaTrabajos()
+# Espera máxima por un trabajo delegado
+ESPERA_TRABAJO = float(os.getenv('ESPERA_TRABAJO', '120'))
+# Al apagar (SIGTERM) se dejan de aceptar comandos y se espera a los que están en curso
+drenando = False
+
+# Bandeja de salida persistente para los anuncios en los canales
+buzon = Buzon(bot, trabajadores=int(os.getenv('TRABAJADORES_BUZON', '3')), filtro=nodo.posee if nodo is not None else None)
+
+# Registro de números de placa por servidor
+registro_placas = RegistroPlacas()
+
+# Configuración por servidor (roles, prefijos de placa y nombres de canal), recargable en caliente
+configuracion.configurar(os.getenv('CONFIG_SERVIDORES', configuracion.RUTA_CONFIG)).cargar()
+
+# Registro de sanciones y strikes (DIAS_CADUCIDAD_STRIKES=0: los strikes no caducan)
+registro_sanciones = RegistroSanciones(dias_caducidad=int(os.getenv('DIAS_CADUCIDAD_STRIKES', '0')))
+
+# Registro de períodos de prueba (inicio, caducidad y estado de cada miembro)
+registro_periodos = RegistroPeriodos()
+
+# Servidor de métricas (/metrics y /healthz); solo si se indica un puerto
+PUERTO_METRICAS = os.getenv('PUERTO_METRICAS') or os.getenv('PORT')
+
+def estado_salud():
+    """(ok, detalle) para /healthz: conectado al gateway y con latencia conocida"""
+    conectado = bot.is_ready() and not bot.is_closed()
+    latencia = bot.latency
+    ok = conectado and latencia == latencia and latencia != float('inf')
+    return ok, {
+        'conectado': conectado,
+        'latencia_gateway': latencia if ok else None,
+        'servidores': len(bot.guilds),
+        'trabajos_activos': len(tuberia.trabajos_activos),
+        'modo': MODO_PROCESO,
+        'drenando': drenando,
+        **({'cluster': nodo.cluster_id, 'shards': nodo.salud(bot)['shards']} if nodo is not None else {}),
+    }
+
+servidor_metricas = metricas.ServidorMetricas(estado_salud, int(PUERTO_METRICAS)) if PUERTO_METRICAS else None
+metricas.indicador('bot_latencia_gateway_segundos', 'Latencia del heartbeat del gateway', lambda: bot.latency)
+metricas.indicador('bot_trabajos_activos', 'Trabajos de comandos en segundo plano', lambda: len(tuberia.trabajos_activos))
+metricas.indicador('bot_buzon_pendientes', 'Anuncios pendientes en la bandeja de salida', lambda: buzon.pendientes())
+metricas.indicador('bot_cache_miembros_aciertos', 'Consultas de miembros resueltas desde la caché', lambda: miembros.cache().aciertos)
+metricas.indicador('bot_cache_miembros_fallos', 'Consultas de miembros que requirieron pedirlos a Discord', lambda: miembros.cache().fallos)
+
+# Sincronización automática del árbol de comandos: 'global', 'servidor' o 'no'
+MODO_SINCRONIZACION = os.getenv('SINCRONIZAR_COMANDOS', sincronizacion.GLOBAL)
+sincronizador = sincronizacion.SincronizadorComandos(bot.tree)
+
+# Importación del historial ya publicado en los canales de anuncios
+importador_historial = ImportadorHistorial(registro_sanciones=registro_sanciones)
+CANALES_HISTORIAL = ['sanciones', 'despidos', 'rangos', 'placas', 'periodo_prueba']
+
+def importacion_en_marcha():
+    if MODO_PROCESO == trabajador.GATEWAY:
+        return cola_trabajos.en_marcha(trabajador.HISTORIAL) > 0
+    return importador_historial.activo
+
+def iniciar_importacion(canales):
+    """Importa el historial en una tarea de fondo o, en modo gateway, en un proceso de trabajos"""
+    if MODO_PROCESO == trabajador.GATEWAY:
+        cola_trabajos.encolar(trabajador.HISTORIAL, {'canales': [canal.id for canal in canales]})
+    else:
+        importador_historial.iniciar(canales)
+
+async def editar_miembro_remoto(miembro, cambios, reason):
+    """Delega en un proceso de trabajos la edición de un miembro de un comando masivo"""
+    datos = {'guild_id': miembro.guild.id, 'miembro_id': miembro.id, 'reason': reason}
+    if 'roles' in cambios:
+        datos['roles'] = [rol.id for rol in cambios['roles']]
+    if 'nick' in cambios:
+        datos['nick'] = cambios['nick']
+    # Si no empieza a tiempo se cancela: más tarde la lista de roles ya no sería la actual
+    await cola_trabajos.ejecutar(trabajador.EDITAR_MIEMBRO, datos, timeout=ESPERA_TRABAJO, cancelar=True)
+
+if MODO_PROCESO == trabajador.GATEWAY:
+    mutaciones.delegar(editar_miembro_remoto)
+
+# Asistencia diaria a partir de las reacciones al mensaje de actividad
+registro_asistencia = RegistroAsistencia()
+
+# Número máximo de miembros que procesan a la vez los comandos masivos
+CONCURRENCIA_MASIVA = int(os.getenv('CONCURRENCIA_MASIVA', '3'))
+
+def numero_placa_de(nickname):
+    """Extrae el número de placa de un nickname con el formato 'ABC-12 | Nombre' (None si no tiene)"""
+    if not nickname:
+        return None
+    match = placas.PATRON_PLACA.match(nickname)
+    return match.group(1) if match else None
+
+def nick_con_placa(prefijo, numero_placa, nombre):
+    """Construye 'PRE-NN | nombre', truncando el nombre al límite de 32 caracteres de Discord"""
+    placa = f"{prefijo}-{numero_placa} | "
+    return placa + nombre[:32 - len(placa)]
+
+def buscar_roles(guild, nombres):
+    """Busca roles por nombre; devuelve (roles asignables, nombres no encontrados o sin permisos)"""
+    roles_a_asignar = []
+    roles_no_encontrados = []
+    
+    for nombre_rol in nombres:
+        rol = indice.rol(guild, nombre_rol)
+        # Verificar que el bot puede asignar este rol
+        if rol and indice.asignable(guild, rol):
+            roles_a_asignar.append(rol)
+        else:
+            roles_no_encontrados.append(nombre_rol)
+    
+    return roles_a_asignar, roles_no_encontrados
+
+def nick_periodo_prueba(usuario, usuario_roblox):
+    """Nickname con el usuario de Roblox, manteniendo la placa si ya tiene una"""
+    nickname_actual = usuario.nick or usuario.name
+    match = re.match(r"^([A-Z]{3}-\d{1,2}) \| .+$", nickname_actual)
+    if match:
+        return f"{match.group(1)} | {usuario_roblox}"[:32]
+    return usuario_roblox[:32]
 
 @bot.event
 async def on_ready():
-    print(f'✅ {bot.user} se ha conectado a Discord!')
-    print(f'📊 ID del bot: {bot.user.id}')
-    print(f'🏠 Servidores conectados: {len(bot.guilds)}')
+    log.info('%s se ha conectado a Discord (ID %s, %d servidores)', bot.user, bot.user.id, len(bot.guilds))
+    
+    # Listar servidores (solo en DEBUG: con muchos servidores es mucho texto)
+    if log.isEnabledFor(logging.DEBUG):
+        for guild in bot.guilds:
+            log.debug('Servidor %s, permisos %s', guild.name, guild.me.guild_permissions.value, extra={'guild': guild.id})
+    
+    # Construir los índices de roles y canales por nombre
+    indice.construir(bot.guilds)
+    log.info('Índices de roles y canales construidos')
     
-    # Listar servidores
+    # Avisar de los roles y canales configurados que no existen y vigilar el fichero de configuración
     for guild in bot.guilds:
-        print(f'   - {guild.name} (ID: {guild.id})')
-        print(f'     Permisos: {guild.me.guild_permissions}')
-    
-    print('✅ Bot listo para usar comandos de prefijo:')
-    print('   - !quitar-rol <usuario> <rol>')
-    print('   - !roles-usuario <usuario>')
-    print('   - !sync (solo administradores)')
-    print('✅ Comandos slash disponibles:')
-    print('   - /periodo-de-prueba <usuario>')
-    print(f'   - Roles predefinidos: {", ".join(ROLES_PERIODO_PRUEBA)}')
-    print('✅ Nuevo comando: /asignar-placa <usuario> <número_placa>')
-    
-    # Iniciar la tarea de mensaje diario
-    enviar_mensaje_actividad_diaria.start()
-    print('✅ Tarea de mensaje diario iniciada')
-
-@tasks.loop(minutes=1)
-async def enviar_mensaje_actividad_diaria():
-    """Envía el mensaje de actividad diaria todos los días a las 15:10 GMT+2"""
-    # Obtener hora actual en UTC
-    ahora_utc = datetime.datetime.utcnow()
-    
-    # Convertir a GMT+2 (UTC+2)
-    ahora_gmt2 = ahora_utc + datetime.timedelta(hours=2)
-    
-    # Verificar si es la hora correcta (15:10)
-    if ahora_gmt2.hour == 15 and ahora_gmt2.minute == 10:
-        await enviar_mensaje_actividad()
-        print(f"✅ Verificando hora: {ahora_gmt2.strftime('%H:%M')} - Enviando mensaje de actividad")
-    else:
-        # Solo imprimir cada 10 minutos para no saturar los logs
-        if ahora_gmt2.minute % 10 == 0:
-            print(f"⏰ Hora actual GMT+2: {ahora_gmt2.strftime('%H:%M')} - Esperando a las 15:10")
+        for falta in configuracion.validar(guild, configuracion.de(guild)):
+            log.warning('Configuración: falta el %s', falta, extra={'guild': guild.id})
+    configuracion.almacen().iniciar(lambda: bot.guilds)
+    
+    # Cargar el registro de placas y contrastarlo con los nicknames actuales
+    registro_placas.cargar()
+    for guild in bot.guilds:
+        for miembro, titular_id in registro_placas.escanear(guild):
+            log.warning(
+                'Placa repetida: %s (%s) coincide con el miembro %s', miembro.display_name, miembro.nick, titular_id,
+                extra={'guild': guild.id, 'miembro': miembro.id}
+            )
+    if not intents.members:
+        log.warning("Sin el intent de miembros (INTENT_MIEMBROS=no) el registro de placas solo conoce las asignadas por el bot y las del historial importado (/importar-historial)")
+        for guild in bot.guilds:
+            sembrar_placas(guild.id)
+    log.info('Registro de placas cargado')
+    
+    # Cargar los mensajes de actividad recientes cuyas reacciones se siguen
+    registro_asistencia.cargar(datetime.datetime.now(ZONA_HORARIA))
+    log.info('Registro de asistencia cargado')
+    
+    # Servidor de métricas
+    if servidor_metricas and not servidor_metricas.activo:
+        await servidor_metricas.iniciar()
+    
+    # Iniciar la bandeja de salida (reenvía lo que quedara pendiente).
+    # En modo gateway la publican los procesos de trabajos
+    if MODO_PROCESO == trabajador.GATEWAY:
+        buzon.crear_tablas()
+    elif not buzon.activo:
+        buzon.iniciar()
+        log.info('Bandeja de salida iniciada (%d anuncios pendientes)', buzon.pendientes())
+    
+    # Reanudar las importaciones de historial que quedaron a medias
+    if not importacion_en_marcha():
+        canales_pendientes = [canal for canal in map(bot.get_channel, importador_historial.pendientes()) if canal]
+        if canales_pendientes:
+            iniciar_importacion(canales_pendientes)
+            log.info('Reanudando la importación del historial de %d canales', len(canales_pendientes))
+    
+    # Temporizador de caducidad de los períodos de prueba (se cargan del registro, no del canal)
+    if not vigilante_periodos.activo:
+        vigilante_periodos.iniciar()
+        proxima = vigilante_periodos.proxima()
+        if proxima:
+            log.info("Próxima caducidad de un período de prueba: %s", proxima.astimezone(ZONA_HORARIA).strftime("%d/%m/%Y %H:%M %Z"))
+    
+    # Iniciar el planificador de tareas (on_ready puede repetirse tras reconectar).
+    # En modo clúster las tareas las programa el lanzador y las ordena a cada proceso
+    if nodo is not None:
+        nodo.iniciar(bot, planificador)
+    elif not planificador.activo:
+        planificador.iniciar()
+        for nombre, instante in planificador.proximas():
+            log.info("Tarea programada '%s': próxima ejecución %s", nombre, instante.astimezone(ZONA_HORARIA).strftime("%d/%m/%Y %H:%M %Z"), extra={'tarea': nombre})
+    
+    # Sincronizar los comandos solo si han cambiado desde la última vez
+    # (los comandos globales, en un solo proceso del clúster)
+    if nodo is None or MODO_SINCRONIZACION != sincronizacion.GLOBAL or await nodo.reclamar(cluster.SINCRONIZAR_COMANDOS):
+        await sincronizador.sincronizar_inicio(MODO_SINCRONIZACION, bot.guilds)
 
-async def enviar_mensaje_actividad():
-    """Envía el mensaje de actividad diaria al canal correspondiente"""
-    try:
-        # Obtener la fecha actual en formato español (GMT+2)
-        fecha_actual = datetime.datetime.utcnow() + datetime.timedelta(hours=2)
-        fecha_formateada = fecha_actual.strftime('%d/%m/%Y')
-        
+MENSAJE_DRENANDO = "⏳ El bot se está reiniciando, vuelve a intentarlo en unos segundos"
+
+async def rechazar_si_drena(interaction: discord.Interaction):
+    """No se aceptan comandos nuevos mientras se drena el proceso"""
+    if drenando:
+        await interaction.response.send_message(MENSAJE_DRENANDO, ephemeral=True)
+        return False
+    return True
+
+bot.tree.interaction_check = rechazar_si_drena
+# Los botones no pasan por el árbol de comandos: el enrutador hace la misma comprobación
+componentes.registrar(bot, comprobar=rechazar_si_drena)
+
+@bot.check
+async def rechazar_prefijo_si_drena(ctx):
+    if drenando:
+        raise commands.CheckFailure(MENSAJE_DRENANDO)
+    return True
+
+async def drenar():
+    """Apagado ordenado (SIGTERM en un despliegue): rechaza comandos nuevos, espera a los trabajos en curso y cierra"""
+    global drenando
+    if drenando:
+        return
+    drenando = True
+    log.info('Drenando: %d trabajos en curso (hasta %.0fs)', len(tuberia.trabajos_activos), trabajador.ESPERA_DRENAJE)
+    await tuberia.esperar_trabajos(trabajador.ESPERA_DRENAJE)
+    if buzon.activo:
+        await buzon.drenar(trabajador.ESPERA_DRENAJE)
+    registro_asistencia.volcar()
+    await bot.close()
+
+tareas_drenaje = set()
+
+async def instalar_drenaje():
+    bucle = asyncio.get_running_loop()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        bucle.add_signal_handler(senal, lambda: tareas_drenaje.add(asyncio.create_task(drenar(), name='drenaje')))
+
+bot.setup_hook = instalar_drenaje
+
+@bot.listen('on_guild_join')
+async def sincronizar_guild_nuevo(guild):
+    """En modo por servidor, los servidores nuevos reciben los comandos al unirse"""
+    if MODO_SINCRONIZACION == sincronizacion.SERVIDOR:
+        await sincronizador.sincronizar_inicio(MODO_SINCRONIZACION, [guild])
+
+@bot.listen('on_member_update')
+async def actualizar_placa_miembro(antes, despues):
+    """Mantiene el registro de placas al día cuando cambia un nickname"""
+    if antes.nick != despues.nick:
+        titular_id = registro_placas.actualizar_miembro(despues)
+        if titular_id is not None:
+            log.warning(
+                '%s usa la placa de %s que ya pertenece al miembro %s', despues.display_name, despues.nick, titular_id,
+                extra={'guild': despues.guild.id, 'miembro': despues.id}
+            )
+
+@bot.listen('on_member_remove')
+async def liberar_placa_miembro(miembro):
+    """Libera la placa de quien abandona el servidor"""
+    registro_placas.liberar(miembro.guild.id, miembro.id)
+
+@bot.listen('on_member_remove')
+async def terminar_periodo_miembro(miembro):
+    """Quien abandona el servidor deja de estar en período de prueba"""
+    terminar_periodo_prueba(miembro)
+
+@bot.listen('on_raw_reaction_add')
+async def registrar_asistencia(payload):
+    """Apunta la asistencia de quien reacciona al mensaje de actividad"""
+    if payload.user_id != bot.user.id:
+        registro_asistencia.reaccion(payload.message_id, payload.user_id, str(payload.emoji), alta=True)
+
+@bot.listen('on_raw_reaction_remove')
+async def anular_asistencia(payload):
+    """Quita la asistencia de quien retira su reacción al mensaje de actividad"""
+    if payload.user_id != bot.user.id:
+        registro_asistencia.reaccion(payload.message_id, payload.user_id, str(payload.emoji), alta=False)
+
+# Esperas de mensajes de actividad que el proceso de trabajos publicó tarde
+actividad_tardia = set()
+
+def seguir_actividad_tardia(trabajo_id, guild_id, canal_id, dia):
+    """Registra el mensaje de actividad cuando el trabajo que lo publica termine por fin"""
+    async def esperar():
+        try:
+            resultado = await cola_trabajos.esperar(trabajo_id)
+        except ErrorTrabajo as e:
+            log.error("El mensaje de actividad no se publicó: %s", e, extra={'guild': guild_id})
+            return
+        registro_asistencia.registrar_mensaje(guild_id, canal_id, resultado['mensaje_id'], dia)
+        log.info("Mensaje de actividad publicado con retraso", extra={'guild': guild_id})
+    
+    task = asyncio.create_task(esperar(), name=f'actividad-tardia:{guild_id}')
+    actividad_tardia.add(task)
+    task.add_done_callback(actividad_tardia.discard)
+
+@planificador.diaria('actividad-diaria', HORA_ACTIVIDAD, ZONA_HORARIA)
+async def enviar_mensaje_actividad_diaria(fecha):
+    """Envía el mensaje de actividad diaria todos los días a las 15:10 (hora de ZONA_HORARIA)"""
+    log.info("Enviando mensaje de actividad del %s", fecha.strftime('%d/%m/%Y %H:%M %Z'), extra={'tarea': 'actividad-diaria'})
+    registro_asistencia.olvidar_antiguos(fecha)
+    await enviar_mensaje_actividad(fecha)
+
+async def enviar_mensaje_actividad(fecha=None):
+    """Envía el mensaje de actividad diaria a todos los servidores en paralelo.
+
+    Devuelve una lista de ``difusion.ResultadoGuild`` con el resultado de cada servidor.
+    """
+    # Obtener la fecha en formato español (hora local de ZONA_HORARIA)
+    fecha_actual = fecha or datetime.datetime.now(ZONA_HORARIA)
+    fecha_formateada = fecha_actual.strftime('%d/%m/%Y')
+    
+    async def enviar_en_guild(guild):
         # Buscar el canal de actividad
-        for guild in bot.guilds:
-            canal_actividad = discord.utils.get(guild.channels, name="↪⏰》𝗔ctividad")
-            
-            if not canal_actividad:
-                print(f"⚠️ Canal '↪⏰》𝗔ctividad' no encontrado en {guild.name}")
-                continue
-            
-            # Buscar el rol de Personal MTMS
-            rol_personal = discord.utils.get(guild.roles, name="👷〴Personal MTMS〴")
-            
-            if not rol_personal:
-                print(f"⚠️ Rol '👷〴Personal MTMS〴' no encontrado en {guild.name}")
-                continue
-            
-            # Crear el mensaje de actividad diaria
-            mensaje_actividad = f"""**ACTIVIDAD DIARIA**
+        config = configuracion.de(guild)
+        canal_actividad = configuracion.canal(guild, 'actividad')
+        
+        if not canal_actividad:
+            raise difusion.Omitido(difusion.SIN_CANAL, f"Canal '{config.nombre_canal('actividad')}' no encontrado")
+        
+        # Buscar el rol de Personal MTMS
+        rol_personal = indice.rol(guild, config.rol_personal)
+        
+        if not rol_personal:
+            raise difusion.Omitido(difusion.SIN_ROL, f"Rol '{config.rol_personal}' no encontrado")
+        
+        # Crear el mensaje de actividad diaria
+        mensaje_actividad = f"""**ACTIVIDAD DIARIA**
 
 El {rol_personal.mention} debe reaccionar a este mensaje para saber su actividad en MTMS. Es forma obligatoria para todos los rangos y así saber la actividad del servidor. El no reaccionar podría llevar a cabo una llamada de atención, un strike o un despido.
 
 **FECHA DEL DÍA DE HOY:** {fecha_formateada}"""
-            
-            # Enviar el mensaje
+        
+        # En modo gateway el envío lo hace un proceso de trabajos; la tarea diaria usa una
+        # clave por servidor y fecha para que un reintento no publique dos mensajes
+        dia = asistencia.dia_clave(fecha_actual)
+        if MODO_PROCESO == trabajador.GATEWAY:
+            trabajo_id = cola_trabajos.encolar(
+                trabajador.ACTIVIDAD,
+                {'guild_id': guild.id, 'canal_id': canal_actividad.id, 'contenido': mensaje_actividad, 'dia': dia},
+                clave=f"actividad:{guild.id}:{fecha.isoformat()}" if fecha else None
+            )
+            try:
+                resultado = await cola_trabajos.esperar(trabajo_id, timeout=ESPERA_TRABAJO)
+            except asyncio.TimeoutError:
+                # El mensaje se publicará más tarde: se sigue esperando para registrar sus reacciones
+                seguir_actividad_tardia(trabajo_id, guild.id, canal_actividad.id, dia)
+                raise
+            mensaje_enviado = discord.Object(id=resultado['mensaje_id'])
+        else:
             mensaje_enviado = await canal_actividad.send(content=mensaje_actividad)
-            
-            # Agregar reacción automática para facilitar la respuesta
+        
+        # Seguir las reacciones del mensaje para registrar la asistencia del día
+        registro_asistencia.registrar_mensaje(guild.id, canal_actividad.id, mensaje_enviado.id, dia)
+        
+        if MODO_PROCESO == trabajador.GATEWAY:
+            return mensaje_enviado
+        
+        # Agregar reacción automática para facilitar la respuesta
+        try:
             await mensaje_enviado.add_reaction('✅')
-            
-            print(f"✅ Mensaje de actividad diaria enviado en {guild.name} - {fecha_formateada}")
-            
-    except Exception as e:
-        print(f"❌ Error al enviar mensaje de actividad diaria: {str(e)}")
+        except discord.HTTPException as e:
+            log.warning("No se pudo añadir la reacción: %s", e, extra={'guild': guild.id})
+        
+        return mensaje_enviado
+    
+    resultados = await difusion.difundir(bot.guilds, enviar_en_guild, concurrencia=CONCURRENCIA_DIFUSION)
+    
+    for resultado in resultados:
+        log.log(
+            logging.INFO if resultado.estado == difusion.ENVIADO else logging.WARNING,
+            "Actividad diaria %s en %s: %s %s", fecha_formateada, resultado.guild_nombre, resultado.estado, resultado.detalle,
+            extra={'guild': resultado.guild_id}
+        )
+    
+    return resultados
 
 # Comando manual para enviar mensaje de actividad (para pruebas)
 @bot.tree.command(name="enviar-actividad", description="Envía manualmente el mensaje de actividad diaria")
@@ -142,14 +513,18 @@ async def enviar_actividad_manual(interaction: discord.Interaction):
         )
         return
     
+    # La difusión puede tardar más de 3 segundos con muchos servidores
+    await interaction.response.defer(ephemeral=True)
+    
     try:
-        await enviar_mensaje_actividad()
-        await interaction.response.send_message(
-            "✅ Mensaje de actividad diaria enviado manualmente",
+        resultados = await enviar_mensaje_actividad()
+        await interaction.followup.send(
+            f"📨 Mensaje de actividad diaria enviado manualmente\n{difusion.resumen(resultados)}",
             ephemeral=True
         )
     except Exception as e:
-        await interaction.response.send_message(
+        metricas.fallo(interaction, e)
+        await interaction.followup.send(
             f"❌ Error al enviar mensaje: {str(e)}",
             ephemeral=True
         )
@@ -163,67 +538,124 @@ async def enviar_actividad_manual_prefix(ctx):
         return
     
     try:
-        await enviar_mensaje_actividad()
-        await ctx.send("✅ Mensaje de actividad diaria enviado manualmente")
+        resultados = await enviar_mensaje_actividad()
+        await ctx.send(f"📨 Mensaje de actividad diaria enviado manualmente\n{difusion.resumen(resultados)}")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error al enviar mensaje: {str(e)}")
 
-class RolView(discord.ui.View):
-    def __init__(self, usuario, roles_disponibles):
-        super().__init__(timeout=60)
-        self.usuario = usuario
-        self.roles_disponibles = roles_disponibles
-        
-        # Crear botones para cada rol disponible
-        for rol in roles_disponibles:
-            self.add_item(RolButton(rol))
+# Máximo de botones en un mensaje (5 filas de 5)
+MAX_BOTONES = 25
+
+def vista_roles(usuario, roles):
+    """Botones para asignar cada rol a ``usuario``; el clic lo resuelve ``asignar_rol_boton``"""
+    return componentes.vista(
+        componentes.boton('rol', usuario.id, rol.id, label=f"📋 {rol.name}", style=discord.ButtonStyle.primary)
+        for rol in roles
+    )
+
+@componentes.accion('rol', usuarios=(0,))
+async def asignar_rol_boton(interaction: discord.Interaction, usuario_id: int, rol_id: int):
+    # El botón puede ser de un mensaje antiguo: se comprueba todo al hacer clic
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message("❌ No tienes permisos para gestionar roles", ephemeral=True)
+        return
+    
+    rol = interaction.guild.get_role(rol_id)
+    if rol is None:
+        await interaction.response.send_message("❌ El rol ya no existe", ephemeral=True)
+        return
+    
+    usuario = await miembros.obtener_para_editar(interaction.guild, usuario_id)
+    if usuario is None:
+        await interaction.response.send_message(f"❌ <@{usuario_id}> ya no está en el servidor", ephemeral=True)
+        return
+    
+    # Verificar si el usuario ya tiene el rol
+    if rol in usuario.roles:
+        await interaction.response.send_message(
+            f"❌ **{usuario.display_name}** ya tiene el rol **{rol.name}**",
+            ephemeral=True
+        )
+        return
+    
+    try:
+        # Asignar el rol
+        await PlanMiembro(usuario).agregar(rol).aplicar()
+    except discord.Forbidden:
+        await interaction.response.send_message(
+            "❌ No tengo permisos para asignar este rol",
+            ephemeral=True
+        )
+        return
+    
+    embed = discord.Embed(
+        title="✅ Rol Asignado Exitosamente",
+        description=f"Se ha asignado el rol **{rol.name}** a **{usuario.display_name}**",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Usuario", value=usuario.mention, inline=True)
+    embed.add_field(name="Rol", value=rol.mention, inline=True)
+    embed.add_field(name="Asignado por", value=interaction.user.mention, inline=True)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=False)
 
-class RolButton(discord.ui.Button):
-    def __init__(self, rol):
-        super().__init__(
-            label=f"📋 {rol.name}",
-            style=discord.ButtonStyle.primary,
-            custom_id=f"rol_{rol.id}"
+@bot.tree.command(name="selector-roles", description="Publica botones para asignar a un usuario los rangos configurados")
+@app_commands.describe(usuario="Usuario al que asignar el rango")
+async def selector_roles(interaction: discord.Interaction, usuario: discord.Member):
+    # Verificar permisos
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message(
+            "❌ No tienes permisos para gestionar roles",
+            ephemeral=True
         )
-        self.rol = rol
+        return
+    
+    roles, _ = buscar_roles(interaction.guild, configuracion.de(interaction.guild).prefijos_placa)
+    roles = [rol for rol in roles if rol not in usuario.roles][:MAX_BOTONES]
+    if not roles:
+        await interaction.response.send_message(f"ℹ️ No hay rangos que asignar a {usuario.mention}", ephemeral=True)
+        return
+    
+    await interaction.response.send_message(f"📋 Selecciona el rango para {usuario.mention}:", view=vista_roles(usuario, roles))
 
-    async def callback(self, interaction: discord.Interaction):
-        try:
-            # Obtener el usuario del view
-            usuario = self.view.usuario
-            
-            # Verificar si el usuario ya tiene el rol
-            if self.rol in usuario.roles:
-                await interaction.response.send_message(
-                    f"❌ **{usuario.display_name}** ya tiene el rol **{self.rol.name}**",
-                    ephemeral=True
-                )
-                return
-            
-            # Asignar el rol
-            await usuario.add_roles(self.rol)
-            
-            embed = discord.Embed(
-                title="✅ Rol Asignado Exitosamente",
-                description=f"Se ha asignado el rol **{self.rol.name}** a **{usuario.display_name}**",
-                color=discord.Color.green()
-            )
-            embed.add_field(name="Usuario", value=usuario.mention, inline=True)
-            embed.add_field(name="Rol", value=self.rol.mention, inline=True)
-            embed.add_field(name="Asignado por", value=interaction.user.mention, inline=True)
-            
-            await interaction.response.send_message(embed=embed, ephemeral=False)
-            
-        except discord.Forbidden:
-            await interaction.response.send_message(
-                "❌ No tengo permisos para asignar este rol",
-                ephemeral=True
-            )
-        except Exception as e:
-            await interaction.response.send_message(
-                f"❌ Error al asignar el rol: {str(e)}",
-                ephemeral=True
-            )
+def iniciar_periodo_prueba(usuario, usuario_roblox, iniciado_por=None, clave=None):
+    """Registra el período de prueba del miembro y lo añade al temporizador de caducidades"""
+    periodo = registro_periodos.iniciar(
+        usuario.guild.id, usuario.id, configuracion.de(usuario.guild).dias_periodo_prueba,
+        usuario_roblox=usuario_roblox, iniciado_por=getattr(iniciado_por, 'id', None), clave=f"periodo:{clave}" if clave else None
+    )
+    vigilante_periodos.programar(periodo)
+    return periodo
+
+def con_avisos(mensaje, plan):
+    """Añade al mensaje de confirmación los cambios que no se pudieron aplicar"""
+    return "\n".join([mensaje, *(f"⚠️ {aviso}" for aviso in plan.avisos)])
+
+def terminar_periodo_prueba(usuario):
+    """Cierra el período de prueba del miembro si lo tenía (ascenso, despido o salida del servidor)"""
+    if registro_periodos.finalizar(usuario.guild.id, usuario.id):
+        log.info("Período de prueba de %s finalizado", usuario.display_name, extra={'guild': usuario.guild.id, 'miembro': usuario.id})
+
+async def aplicar_periodo_prueba(usuario, roles_a_asignar, usuario_roblox, iniciado_por=None, clave=None):
+    """Asigna los roles de período de prueba, pone el usuario de Roblox como nickname y registra el período"""
+    # Roles nuevos y nickname con el usuario de Roblox, en un solo cambio
+    plan = PlanMiembro(usuario).agregar(*roles_a_asignar)
+    # El nickname es secundario: si no se puede cambiar se asignan los roles igualmente y se avisa
+    plan.apodo(nick_periodo_prueba(usuario, usuario_roblox), opcional=True)
+    roles_nuevos = plan.roles_agregados
+    await plan.aplicar()
+    for aviso in plan.avisos:
+        log.warning("%s", aviso, extra={'guild': usuario.guild.id, 'miembro': usuario.id})
+    iniciar_periodo_prueba(usuario, usuario_roblox, iniciado_por, clave)
+
+    # Preparar mensaje de confirmación
+    if roles_nuevos:
+        roles_asignados_texto = ", ".join([rol.mention for rol in roles_nuevos])
+        mensaje = f"✅ Se han asignado los roles: {roles_asignados_texto} a {usuario.mention}"
+    else:
+        mensaje = f"ℹ️ {usuario.mention} ya tenía todos los roles configurados"
+    return con_avisos(mensaje, plan)
 
 @bot.tree.command(name="periodo-de-prueba", description="Asigna roles predefinidos de período de prueba a un usuario")
 @app_commands.describe(
@@ -247,101 +679,44 @@ async def periodo_prueba(interaction: discord.Interaction, usuario: discord.Memb
         )
         return
     
-    try:
-        # Buscar los roles predefinidos en el servidor
-        roles_a_asignar = []
-        roles_no_encontrados = []
-        
-        for nombre_rol in ROLES_PERIODO_PRUEBA:
-            rol = discord.utils.get(interaction.guild.roles, name=nombre_rol)
-            if rol:
-                # Verificar que el bot puede asignar este rol
-                if rol.position < interaction.guild.me.top_role.position and not rol.managed:
-                    roles_a_asignar.append(rol)
-                else:
-                    roles_no_encontrados.append(nombre_rol)
-            else:
-                roles_no_encontrados.append(nombre_rol)
-        
-        if not roles_a_asignar:
-            mensaje_error = f"❌ No se encontraron roles válidos para asignar. Roles configurados: {', '.join(ROLES_PERIODO_PRUEBA)}"
-            if roles_no_encontrados:
-                mensaje_error += f"\n⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}"
-            
-            await interaction.response.send_message(mensaje_error, ephemeral=True)
-            return
-        
-        # Verificar roles que ya tiene el usuario
-        roles_ya_asignados = []
-        roles_nuevos = []
-        
-        for rol in roles_a_asignar:
-            if rol in usuario.roles:
-                roles_ya_asignados.append(rol)
-            else:
-                roles_nuevos.append(rol)
-        
-        # Asignar roles nuevos
-        if roles_nuevos:
-            await usuario.add_roles(*roles_nuevos)
-        
-        # Cambiar el nickname por el usuario de Roblox, manteniendo la placa si existe
-        try:
-            nickname_actual = usuario.nick or usuario.name
-            match = re.match(r"^([A-Z]{3}-\d{1,2}) \| .+$", nickname_actual)
-            if match:
-                placa = match.group(1)
-                nuevo_nick = f"{placa} | {usuario_roblox}"
-            else:
-                nuevo_nick = usuario_roblox
-
-            if len(nuevo_nick) > 32:
-                nuevo_nick = nuevo_nick[:32]
-
-            await usuario.edit(nick=nuevo_nick)
-        except Exception as e:
-            print(f"❌ Error al cambiar el nickname: {str(e)}")
-
-        # Preparar mensaje de confirmación
-        if roles_nuevos:
-            roles_asignados_texto = ", ".join([rol.mention for rol in roles_nuevos])
-            mensaje_confirmacion = f"✅ Se han asignado los roles: {roles_asignados_texto} a {usuario.mention}"
-        else:
-            mensaje_confirmacion = f"ℹ️ {usuario.mention} ya tenía todos los roles configurados"
-        
-        # Enviar confirmación ephemeral al usuario que ejecutó el comando
-        await interaction.response.send_message(mensaje_confirmacion, ephemeral=True)
-        
-        # Enviar mensaje al canal después de la respuesta
-        try:
-            await enviar_mensaje_periodo_prueba(interaction.guild, usuario, interaction.user, usuario_roblox)
-        except Exception as e:
-            print(f"❌ Error al enviar mensaje al canal: {str(e)}")
+    # Buscar los roles predefinidos en el servidor
+    roles_configurados = configuracion.de(interaction.guild).roles_periodo_prueba
+    roles_a_asignar, roles_no_encontrados = buscar_roles(interaction.guild, roles_configurados)
+    
+    if not roles_a_asignar:
+        mensaje_error = f"❌ No se encontraron roles válidos para asignar. Roles configurados: {', '.join(roles_configurados)}"
+        if roles_no_encontrados:
+            mensaje_error += f"\n⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}"
         
-    except discord.Forbidden:
-        await interaction.response.send_message(
-            "❌ No tengo permisos para asignar roles",
-            ephemeral=True
-        )
-    except Exception as e:
-        await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
-            ephemeral=True
-        )
+        await interaction.response.send_message(mensaje_error, ephemeral=True)
+        return
+    
+    async def asignar_roles():
+        return await aplicar_periodo_prueba(usuario, roles_a_asignar, usuario_roblox, interaction.user, clave=interaction.id)
+    
+    async def anunciar():
+        await enviar_mensaje_periodo_prueba(interaction.guild, usuario, interaction.user, usuario_roblox, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(
+        interaction, "periodo-de-prueba", asignar_roles, anunciar,
+        mensaje_forbidden="❌ No tengo permisos para asignar roles"
+    )
 
-async def enviar_mensaje_periodo_prueba(guild, usuario, autor_comando, usuario_roblox):
-    """Envía el mensaje de período de prueba al canal '↪📰》𝗣eriodo-de-𝗣rueba'"""
+async def enviar_mensaje_periodo_prueba(guild, usuario, autor_comando, usuario_roblox, clave=None):
+    """Envía el mensaje de período de prueba al canal de períodos de prueba"""
     try:
         # Buscar el canal "boosts"
-        canal_boosts = discord.utils.get(guild.channels, name="↪📰》𝗣eriodo-de-𝗣rueba")
+        canal_boosts = configuracion.canal(guild, 'periodo_prueba')
         
         if not canal_boosts:
-            print("⚠️ Canal 'boosts' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('periodo_prueba'), extra={'guild': guild.id})
             return
         
-        # Calcular fechas
+        # Calcular fechas (la caducidad es la del período registrado)
         fecha_inicio = datetime.datetime.now()
-        fecha_caducidad = fecha_inicio + datetime.timedelta(days=7)
+        periodo = registro_periodos.activo(guild.id, usuario.id)
+        fecha_caducidad = periodo.caduca if periodo else fecha_inicio + datetime.timedelta(days=configuracion.de(guild).dias_periodo_prueba)
         
         # Crear timestamp para Discord
         timestamp_caducidad = int(fecha_caducidad.timestamp())
@@ -379,16 +754,87 @@ async def enviar_mensaje_periodo_prueba(guild, usuario, autor_comando, usuario_r
         embed_periodo.set_footer(text=f"Período iniciado por {autor_comando.display_name}")
         embed_periodo.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal boosts
-        await canal_boosts.send(content=f"{usuario.mention}", embed=embed_periodo)
+        # Encolar el mensaje para el canal boosts
+        buzon.encolar(Anuncio(canal_boosts.id, f"{usuario.mention}", embed_periodo, clave=f"periodo:{clave}" if clave else None, guild_id=guild.id))
         
-        print(f"✅ Mensaje de período de prueba enviado al canal 'boosts' para {usuario.display_name}")
+        log.info("Mensaje de período de prueba encolado para el canal 'boosts' para %s", usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje al canal boosts: {str(e)}")
+        log.exception("Error al enviar mensaje al canal boosts: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
+
+# Texto del aviso de fin de período de prueba según la acción configurada
+AVISOS_FIN_PERIODO = {
+    configuracion.RECORDATORIO: "Revisad si ha completado los formularios de actividad y el curso.",
+    configuracion.QUITAR_ROLES: "Se le han retirado los roles del período de prueba.",
+    configuracion.REVISAR: "Queda pendiente de revisión en `/periodos-activos`.",
+}
+
+async def caducar_periodo(periodo):
+    """Ejecuta la acción configurada al terminar un período de prueba; devuelve su estado final"""
+    guild = bot.get_guild(periodo.guild_id)
+    if guild is None:
+        # El servidor lo atiende otro proceso del clúster: se queda activo para ese proceso
+        return None
+    miembro = await miembros.obtener_para_editar(guild, periodo.miembro_id)
+    if miembro is None:
+        return periodos.FINALIZADO
+    
+    config = configuracion.de(guild)
+    accion = config.accion_periodo_prueba
+    if accion == configuracion.QUITAR_ROLES:
+        roles, _ = buscar_roles(guild, config.roles_periodo_prueba)
+        await PlanMiembro(miembro).quitar(*roles).aplicar()
+    if accion != configuracion.NINGUNA:
+        enviar_mensaje_fin_periodo(guild, miembro, periodo, AVISOS_FIN_PERIODO[accion])
+    return periodos.REVISION if accion == configuracion.REVISAR else periodos.CADUCADO
+
+def enviar_mensaje_fin_periodo(guild, usuario, periodo, aviso):
+    """Encola el aviso de fin de período de prueba en el canal de períodos de prueba"""
+    canal_periodos = configuracion.canal(guild, 'periodo_prueba')
+    if not canal_periodos:
+        log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('periodo_prueba'), extra={'guild': guild.id})
+        return
+    
+    embed_fin = discord.Embed(
+        title="⏰ Fin del Período de Pruebas",
+        description=f"El período de prueba de {usuario.mention} terminó <t:{int(periodo.caduca.timestamp())}:R>.\n{aviso}",
+        color=discord.Color.orange()
+    )
+    embed_fin.set_footer(text=f"Iniciado el {periodo.inicio.astimezone(ZONA_HORARIA).strftime('%d/%m/%Y')}")
+    # La clave evita un segundo aviso si el bot se reinicia a mitad
+    buzon.encolar(Anuncio(canal_periodos.id, f"{usuario.mention}", embed_fin, clave=f"periodo-fin:{periodo.id}", guild_id=guild.id))
+
+# Un solo temporizador para las caducidades de todos los períodos de prueba
+vigilante_periodos = VigilantePeriodos(registro_periodos, caducar_periodo)
+
+# Períodos que se muestran en cada sección de /periodos-activos
+MAX_LISTADO_PERIODOS = 20
+
+@bot.tree.command(name="periodos-activos", description="Lista los períodos de prueba en curso y los pendientes de revisión")
+async def periodos_activos(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message(
+            "❌ No tienes permisos para usar este comando",
+            ephemeral=True
+        )
+        return
+    
+    embed = discord.Embed(title="🔄 Períodos de Pruebas", color=discord.Color.blue())
+    secciones = [("⏳ En curso", periodos.ACTIVO, "caduca"), ("🔎 Pendientes de revisión", periodos.REVISION, "terminó")]
+    for titulo, estado, verbo in secciones:
+        total = registro_periodos.contar(interaction.guild.id, estado)
+        lineas = [
+            f"<@{periodo.miembro_id}> · {verbo} <t:{int(periodo.caduca.timestamp())}:R>"
+            for periodo in registro_periodos.listar(interaction.guild.id, estado, limite=MAX_LISTADO_PERIODOS)
+        ]
+        if total > len(lineas):
+            lineas.append(f"… y {total - len(lineas)} más")
+        embed.add_field(name=f"{titulo} ({total})", value="\n".join(lineas) or "Ninguno", inline=False)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.command(name="quitar-rol", description="Quita un rol a un usuario")
-async def quitar_rol(ctx, usuario: discord.Member, rol: discord.Role):
+async def quitar_rol(ctx, usuario: miembros.ConversorMiembro, rol: discord.Role):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
@@ -399,7 +845,7 @@ async def quitar_rol(ctx, usuario: discord.Member, rol: discord.Role):
             await ctx.send(f"❌ **{usuario.display_name}** no tiene el rol **{rol.name}**")
             return
         
-        await usuario.remove_roles(rol)
+        await PlanMiembro(usuario).quitar(rol).aplicar()
         
         embed = discord.Embed(
             title="✅ Rol Removido Exitosamente",
@@ -412,13 +858,15 @@ async def quitar_rol(ctx, usuario: discord.Member, rol: discord.Role):
         
         await ctx.send(embed=embed)
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para quitar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
 @bot.command(name="roles-usuario", description="Muestra todos los roles de un usuario")
-async def roles_usuario(ctx, usuario: discord.Member):
+async def roles_usuario(ctx, usuario: miembros.ConversorMiembro):
     roles = [rol.mention for rol in usuario.roles if rol.name != "@everyone"]
     
     if not roles:
@@ -442,17 +890,19 @@ async def roles_usuario(ctx, usuario: discord.Member):
 
 # Comando manual para sincronizar comandos
 @bot.command(name='sync')
-async def sync_commands(ctx):
-    """Sincroniza los comandos slash manualmente"""
+async def sync_commands(ctx, ambito: str = sincronizacion.GLOBAL):
+    """Sincroniza los comandos slash manualmente: '!sync' (global) o '!sync servidor' (solo este servidor)"""
     if ctx.author.guild_permissions.administrator:
         try:
-            print(f'🔄 Sincronización manual solicitada por {ctx.author}')
-            synced = await bot.tree.sync()
-            await ctx.send(f'✅ Sincronizados {len(synced)} comandos exitosamente!')
-            print(f'✅ Sincronización manual completada: {len(synced)} comandos')
+            log.info('Sincronización manual (%s) solicitada por %s', ambito, ctx.author, extra={'comando': 'sync', 'miembro': ctx.author.id})
+            guild = ctx.guild if ambito == sincronizacion.SERVIDOR else None
+            _, total = await sincronizador.sincronizar(guild, forzar=True)
+            await ctx.send(f'✅ Sincronizados {total} comandos exitosamente!')
+            log.info('Sincronización manual completada: %d comandos', total, extra={'comando': 'sync'})
         except Exception as e:
+            metricas.fallo(ctx, e)
             await ctx.send(f'❌ Error al sincronizar: {e}')
-            print(f'❌ Error en sincronización manual: {e}')
+            log.error('Error en sincronización manual: %s', e, extra={'comando': 'sync'})
     else:
         await ctx.send('❌ Solo los administradores pueden usar este comando')
 
@@ -467,7 +917,7 @@ async def on_command_error(ctx, error):
         await ctx.send(f"❌ Error: {str(error)}")
 
 @bot.command(name="periodo-de-prueba", description="Asigna roles predefinidos de período de prueba a un usuario")
-async def periodo_prueba_prefix(ctx, usuario: discord.Member):
+async def periodo_prueba_prefix(ctx, usuario: miembros.ConversorMiembro):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
@@ -480,39 +930,20 @@ async def periodo_prueba_prefix(ctx, usuario: discord.Member):
     
     try:
         # Buscar los roles predefinidos en el servidor
-        roles_a_asignar = []
-        roles_no_encontrados = []
-        
-        for nombre_rol in ROLES_PERIODO_PRUEBA:
-            rol = discord.utils.get(ctx.guild.roles, name=nombre_rol)
-            if rol:
-                # Verificar que el bot puede asignar este rol
-                if rol.position < ctx.guild.me.top_role.position and not rol.managed:
-                    roles_a_asignar.append(rol)
-                else:
-                    roles_no_encontrados.append(nombre_rol)
-            else:
-                roles_no_encontrados.append(nombre_rol)
+        roles_configurados = configuracion.de(ctx.guild).roles_periodo_prueba
+        roles_a_asignar, roles_no_encontrados = buscar_roles(ctx.guild, roles_configurados)
         
         if not roles_a_asignar:
-            await ctx.send(f"❌ No se encontraron roles válidos para asignar. Roles configurados: {', '.join(ROLES_PERIODO_PRUEBA)}")
+            await ctx.send(f"❌ No se encontraron roles válidos para asignar. Roles configurados: {', '.join(roles_configurados)}")
             if roles_no_encontrados:
                 await ctx.send(f"⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}")
             return
         
-        # Verificar roles que ya tiene el usuario
-        roles_ya_asignados = []
-        roles_nuevos = []
-        
-        for rol in roles_a_asignar:
-            if rol in usuario.roles:
-                roles_ya_asignados.append(rol)
-            else:
-                roles_nuevos.append(rol)
-        
-        # Asignar roles nuevos
-        if roles_nuevos:
-            await usuario.add_roles(*roles_nuevos)
+        # Asignar los roles que aún no tiene
+        plan = PlanMiembro(usuario).agregar(*roles_a_asignar)
+        roles_nuevos = plan.roles_agregados
+        await plan.aplicar()
+        iniciar_periodo_prueba(usuario, None, ctx.author, clave=ctx.message.id)
         
         # Enviar confirmación al canal donde se ejecutó el comando
         if roles_nuevos:
@@ -522,19 +953,69 @@ async def periodo_prueba_prefix(ctx, usuario: discord.Member):
             await ctx.send(f"ℹ️ {usuario.mention} ya tenía todos los roles configurados")
         
         # Enviar mensaje al canal "boosts"
-        await enviar_mensaje_periodo_prueba(ctx.guild, usuario, ctx.author, "N/A") # Assuming no Roblox user for prefix command
+        await enviar_mensaje_periodo_prueba(ctx.guild, usuario, ctx.author, "N/A", clave=ctx.message.id) # Assuming no Roblox user for prefix command
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para asignar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
+# guild_id -> registros importados cuando se completó el registro de placas con el historial
+placas_sembradas = {}
+
+def sembrar_placas(guild_id):
+    """Sin el intent de miembros, completa el registro de placas con las del historial importado.
+
+    Sin el intent no se ven los nicknames de los miembros, así que las
+    placas que no asignó el bot solo se conocen por sus anuncios. Se vuelve
+    a hacer cuando la importación del servidor ha avanzado.
+    """
+    if bot.intents.members:
+        return
+    importados = sum(total for _, total, _ in importador_historial.progreso(guild_id))
+    if placas_sembradas.get(guild_id) == importados:
+        return
+    placas_sembradas[guild_id] = importados
+    anadidas = registro_placas.sembrar(guild_id, importador_historial.placas(guild_id))
+    if anadidas:
+        log.info('Registro de placas completado con %d placas del historial', anadidas, extra={'guild': guild_id})
+
+def placa_ocupada(guild, usuario, numero_placa):
+    """Mensaje de error si la placa ya es de otro miembro, o None si está libre"""
+    titular_id = registro_placas.titular(guild.id, numero_placa)
+    if titular_id is not None and titular_id != usuario.id:
+        return f"❌ La placa número {numero_placa} ya la tiene <@{titular_id}>"
+    return None
+
+async def aplicar_placa(usuario, numero_placa, nombre=None):
+    """Pone la placa NVI-<número> delante del nickname actual (o del nombre) y la registra"""
+    guild_id = usuario.guild.id
+    anterior = registro_placas.numero_de(guild_id, usuario.id)
+    
+    # Reservar el número antes de cambiar el nickname para que no se asigne dos veces
+    if not registro_placas.asignar(guild_id, numero_placa, usuario.id):
+        raise tuberia.ErrorComando(placa_ocupada(usuario.guild, usuario, numero_placa))
+    
+    try:
+        nombre = nombre or usuario.nick or usuario.name
+        await PlanMiembro(usuario).apodo(nick_con_placa("NVI", numero_placa, nombre)).aplicar()
+    except Exception:
+        # Deshacer la reserva si no se pudo cambiar el nickname
+        registro_placas.liberar(guild_id, usuario.id)
+        if anterior is not None:
+            registro_placas.asignar(guild_id, anterior, usuario.id)
+        raise
+    
+    return f"✅ Se ha asignado la placa **NVI-{numero_placa}** a {usuario.mention}"
+
 @bot.tree.command(name="asignar-placa", description="Asigna un número de placa a un usuario y cambia su nickname")
 @app_commands.describe(
     usuario="Usuario al que asignar la placa",
-    numero_placa="Número de placa a asignar (1-99)"
+    numero_placa="Número de placa a asignar (1-99); si se omite se usa el primero libre"
 )
-async def asignar_placa(interaction: discord.Interaction, usuario: discord.Member, numero_placa: int):
+async def asignar_placa(interaction: discord.Interaction, usuario: discord.Member, numero_placa: Optional[int] = None):
     # Verificar permisos
     if not interaction.user.guild_permissions.manage_nicknames:
         await interaction.response.send_message(
@@ -551,6 +1032,17 @@ async def asignar_placa(interaction: discord.Interaction, usuario: discord.Membe
         )
         return
     
+    # Sin número: usar el primero libre
+    sembrar_placas(interaction.guild.id)
+    if numero_placa is None:
+        numero_placa = registro_placas.siguiente_libre(interaction.guild.id)
+        if numero_placa is None:
+            await interaction.response.send_message(
+                "❌ No quedan números de placa libres",
+                ephemeral=True
+            )
+            return
+    
     # Verificar que el número de placa sea válido (máximo 2 dígitos)
     if numero_placa <= 0 or numero_placa > 99:
         await interaction.response.send_message(
@@ -559,48 +1051,40 @@ async def asignar_placa(interaction: discord.Interaction, usuario: discord.Membe
         )
         return
     
-    try:
-        # Obtener el nickname actual o el nombre si no tiene nickname
-        nombre_actual = usuario.nick if usuario.nick else usuario.name
-        nuevo_nickname = f"NVI-{numero_placa} | {nombre_actual}"
-        
-        # Verificar si el nickname es muy largo (límite de Discord: 32 caracteres)
-        if len(nuevo_nickname) > 32:
-            # Truncar el nombre si es necesario
-            nombre_truncado = nombre_actual[:32 - len(f"NVI-{numero_placa} | ")]
-            nuevo_nickname = f"NVI-{numero_placa} | {nombre_truncado}"
-        
-        # Cambiar el nickname del usuario
-        await usuario.edit(nick=nuevo_nickname)
-        
-        # Enviar confirmación solo al usuario que ejecutó el comando (ephemeral)
-        await interaction.response.send_message(
-            f"✅ Se ha asignado la placa **NVI-{numero_placa}** a {usuario.mention}",
-            ephemeral=True
-        )
-        
-        # Enviar mensaje al canal "noticias-random"
-        await enviar_mensaje_asignacion_placa(interaction.guild, usuario, numero_placa, interaction.user)
-        
-    except discord.Forbidden:
-        await interaction.response.send_message(
-            "❌ No tengo permisos para cambiar el nickname de este usuario",
-            ephemeral=True
-        )
-    except Exception as e:
-        await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
-            ephemeral=True
-        )
+    # Verificar que nadie más tenga esa placa
+    error_placa = placa_ocupada(interaction.guild, usuario, numero_placa)
+    if error_placa:
+        await interaction.response.send_message(error_placa, ephemeral=True)
+        return
+    
+    async def cambiar_nickname():
+        return await aplicar_placa(usuario, numero_placa)
+    
+    async def anunciar():
+        await enviar_mensaje_asignacion_placa(interaction.guild, usuario, numero_placa, interaction.user, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(
+        interaction, "asignar-placa", cambiar_nickname, anunciar,
+        mensaje_forbidden="❌ No tengo permisos para cambiar el nickname de este usuario"
+    )
+
+@asignar_placa.autocomplete('numero_placa')
+async def autocompletar_numero_placa(interaction: discord.Interaction, actual: str):
+    """Sugiere números de placa libres que empiecen por lo escrito"""
+    actual = str(actual or "")
+    sembrar_placas(interaction.guild_id)
+    libres = [numero for numero in registro_placas.libres(interaction.guild_id) if str(numero).startswith(actual)]
+    return [app_commands.Choice(name=f"NVI-{numero} (libre)", value=numero) for numero in libres[:25]]
 
-async def enviar_mensaje_asignacion_placa(guild, usuario, numero_placa, autor_comando):
-    """Envía el mensaje de asignación de placa al canal '↪🆔》𝗣lacas-𝗔signadas'"""
+async def enviar_mensaje_asignacion_placa(guild, usuario, numero_placa, autor_comando, clave=None):
+    """Envía el mensaje de asignación de placa al canal de placas"""
     try:
-        # Buscar el canal "↪🆔》𝗣lacas-𝗔signadas"
-        canal_noticias = discord.utils.get(guild.channels, name="↪🆔》𝗣lacas-𝗔signadas")
+        # Buscar el canal de placas
+        canal_noticias = configuracion.canal(guild, 'placas')
         
         if not canal_noticias:
-            print("⚠️ Canal '↪🆔》𝗣lacas-𝗔signadas' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('placas'), extra={'guild': guild.id})
             return
         
         # Crear embed de asignación de placa
@@ -628,39 +1112,42 @@ async def enviar_mensaje_asignacion_placa(guild, usuario, numero_placa, autor_co
         embed_placa.set_footer(text=f"Placa asignada por {autor_comando.display_name}")
         embed_placa.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal noticias-random
-        await canal_noticias.send(content=f"{usuario.mention}", embed=embed_placa)
+        anuncios = [Anuncio(canal_noticias.id, f"{usuario.mention}", embed_placa, clave=f"placa:{clave}" if clave else None, guild_id=guild.id)]
         
-        print(f"✅ Mensaje de asignación de placa enviado al canal '↪🆔》𝗣lacas-𝗔signadas' para {usuario.display_name}")
+        # Mensaje de bienvenida al canal de empleados (se encola junto con la placa)
+        anuncio_bienvenida = crear_anuncio_bienvenida_empleados(guild, usuario, clave=clave)
+        if anuncio_bienvenida:
+            anuncios.append(anuncio_bienvenida)
         
-        # Enviar mensaje de bienvenida al canal de empleados
-        await enviar_mensaje_bienvenida_empleados(guild, usuario)
+        # Encolar los mensajes en una sola transacción
+        buzon.encolar(*anuncios)
+        
+        log.info("Mensaje de asignación de placa encolado para el canal '%s' para %s", canal_noticias.name, usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje al canal noticias-random: {str(e)}")
+        log.exception("Error al enviar mensaje al canal noticias-random: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
-async def enviar_mensaje_bienvenida_empleados(guild, usuario):
-    """Envía el mensaje de bienvenida al canal '↪🧥》𝗖hat-𝗘mpleados'"""
-    try:
-        # Buscar el canal "↪🧥》𝗖hat-𝗘mpleados"
-        canal_empleados = discord.utils.get(guild.channels, name="↪🧥》𝗖hat-𝗘mpleados")
-        
-        if not canal_empleados:
-            print("⚠️ Canal '↪🧥》𝗖hat-𝗘mpleados' no encontrado")
-            return
-        
-        # Buscar los canales mencionados para crear enlaces
-        canal_licencias = discord.utils.get(guild.channels, name="↪💳》𝗟icencias")
-        canal_tutoriales = discord.utils.get(guild.channels, name="↪🥏》𝗧utoriales-𝗦ugerencias")
-        canal_guia = discord.utils.get(guild.channels, name="↪📚》𝙂uía")
-        
-        # Crear enlaces a los canales (si existen)
-        enlace_licencias = f"<#{canal_licencias.id}>" if canal_licencias else "#↪💳》𝗟icencias"
-        enlace_tutoriales = f"<#{canal_tutoriales.id}>" if canal_tutoriales else "#↪🥏》𝗧utoriales-𝗦ugerencias"
-        enlace_guia = f"<#{canal_guia.id}>" if canal_guia else "#↪📚》𝙂uía"
-        
-        # Crear el mensaje de bienvenida con enlaces
-        mensaje_bienvenida = f"""{usuario.mention} :wave: ¡Bienvenida/o a MTMS! 
+def crear_anuncio_bienvenida_empleados(guild, usuario, clave=None):
+    """Prepara el mensaje de bienvenida al canal de chat de empleados (None si no existe el canal)"""
+    # Buscar el canal de chat de empleados
+    canal_empleados = configuracion.canal(guild, 'empleados')
+    
+    if not canal_empleados:
+        log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('empleados'), extra={'guild': guild.id})
+        return None
+    
+    # Buscar los canales mencionados para crear enlaces
+    canal_licencias = configuracion.canal(guild, 'licencias')
+    canal_tutoriales = configuracion.canal(guild, 'tutoriales')
+    canal_guia = configuracion.canal(guild, 'guia')
+    
+    # Crear enlaces a los canales (si existen)
+    enlace_licencias = f"<#{canal_licencias.id}>" if canal_licencias else f"#{configuracion.de(guild).nombre_canal('licencias')}"
+    enlace_tutoriales = f"<#{canal_tutoriales.id}>" if canal_tutoriales else f"#{configuracion.de(guild).nombre_canal('tutoriales')}"
+    enlace_guia = f"<#{canal_guia.id}>" if canal_guia else f"#{configuracion.de(guild).nombre_canal('guia')}"
+    
+    # Crear el mensaje de bienvenida con enlaces
+    mensaje_bienvenida = f"""{usuario.mention} :wave: ¡Bienvenida/o a MTMS! 
 
 Antes de empezar, asegúrate de:
 
@@ -670,17 +1157,25 @@ Antes de empezar, asegúrate de:
 :pencil: En tus primeros 7 días, debes enviar 3 formularios para pasar el periodo de prueba.
 
 ¡Buena suerte y cualquier duda no dudéis en preguntarme!"""
+    
+    return Anuncio(canal_empleados.id, mensaje_bienvenida, clave=f"bienvenida:{clave}" if clave else None, guild_id=guild.id)
+
+async def enviar_mensaje_bienvenida_empleados(guild, usuario, clave=None):
+    """Envía el mensaje de bienvenida al canal de chat de empleados"""
+    try:
+        anuncio = crear_anuncio_bienvenida_empleados(guild, usuario, clave=clave)
+        if not anuncio:
+            return
         
-        # Enviar mensaje al canal de empleados
-        await canal_empleados.send(content=mensaje_bienvenida)
+        buzon.encolar(anuncio)
         
-        print(f"✅ Mensaje de bienvenida enviado al canal '↪🧥》𝗖hat-𝗘mpleados' para {usuario.display_name}")
+        log.info("Mensaje de bienvenida encolado para %s", usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje de bienvenida al canal de empleados: {str(e)}")
+        log.exception("Error al enviar mensaje de bienvenida al canal de empleados: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
 @bot.command(name="asignar-placa", description="Asigna un número de placa a un usuario y cambia su nickname")
-async def asignar_placa_prefix(ctx, usuario: discord.Member, numero_placa: int):
+async def asignar_placa_prefix(ctx, usuario: miembros.ConversorMiembro, numero_placa: int):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_nicknames:
         await ctx.send("❌ No tienes permisos para gestionar nicknames")
@@ -696,28 +1191,25 @@ async def asignar_placa_prefix(ctx, usuario: discord.Member, numero_placa: int):
         await ctx.send("❌ El número de placa debe estar entre 1 y 99")
         return
     
+    sembrar_placas(ctx.guild.id)
     try:
-        # Crear el nuevo nickname
-        nuevo_nickname = f"NVI-{numero_placa} | {usuario.name}"
-        
-        # Verificar si el nickname es muy largo (límite de Discord: 32 caracteres)
-        if len(nuevo_nickname) > 32:
-            # Truncar el nombre si es necesario
-            nombre_truncado = usuario.name[:32 - len(f"NVI-{numero_placa} | ")]
-            nuevo_nickname = f"NVI-{numero_placa} | {nombre_truncado}"
-        
         # Cambiar el nickname del usuario
-        await usuario.edit(nick=nuevo_nickname)
+        await aplicar_placa(usuario, numero_placa, nombre=usuario.name)
         
         # Enviar confirmación solo al usuario que ejecutó el comando (ephemeral para slash, público para prefijo)
         await ctx.send(f"✅ Se ha asignado la placa **NVI-{numero_placa}** a {usuario.mention}")
         
         # Enviar mensaje al canal "noticias-random"
-        await enviar_mensaje_asignacion_placa(ctx.guild, usuario, numero_placa, ctx.author)
+        await enviar_mensaje_asignacion_placa(ctx.guild, usuario, numero_placa, ctx.author, clave=ctx.message.id)
         
-    except discord.Forbidden:
+    except tuberia.ErrorComando as e:
+        metricas.fallo(ctx, e)
+        await ctx.send(str(e))
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para cambiar el nickname de este usuario")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
 @bot.tree.command(name="ascenso", description="Asciende a un usuario a un nuevo rango")
@@ -743,72 +1235,59 @@ async def ascenso(interaction: discord.Interaction, usuario: discord.Member, ran
         )
         return
     
-    try:
-        # Verificar que el bot puede asignar este rol
-        if rango.position >= interaction.guild.me.top_role.position or rango.managed:
-            await interaction.response.send_message(
-                f"❌ No tengo permisos para asignar el rol '{rango.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Verificar si el usuario ya tiene el rol
-        if rango in usuario.roles:
-            await interaction.response.send_message(
-                f"❌ {usuario.mention} ya tiene el rol '{rango.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Asignar el rol
-        await usuario.add_roles(rango)
-        
-        # Cambiar la placa si el rol está en el diccionario
-        prefijo = PREFIJOS_PLACA.get(rango.name)
-        if prefijo:
-            # Intentar extraer el número de placa del nickname actual
-            numero_placa = "00"
-            if usuario.nick:
-                match = re.match(r"^[A-Z]{3}-?(\d{1,2})\s*\|", usuario.nick)
-                if match:
-                    numero_placa = match.group(1)
-            nuevo_nickname = f"{prefijo}-{numero_placa} | {usuario.name}"
-            if len(nuevo_nickname) > 32:
-                nombre_truncado = usuario.name[:32 - len(f"{prefijo}-{numero_placa} | ")]
-                nuevo_nickname = f"{prefijo}-{numero_placa} | {nombre_truncado}"
-            try:
-                await usuario.edit(nick=nuevo_nickname)
-            except Exception as e:
-                print(f"❌ Error al cambiar la placa: {str(e)}")
-        
-        # Enviar confirmación al usuario que ejecutó el comando
-        await interaction.response.send_message(
-            f"✅ Se ha ascendido a {usuario.mention} al rango **{rango.name}**",
-            ephemeral=True
-        )
-        
-        # Enviar mensaje al canal de ascensos
-        await enviar_mensaje_ascenso(interaction.guild, usuario, rango, motivo, interaction.user)
-        
-    except discord.Forbidden:
+    # Un ascenso repetido recibe el resultado del original (si no, diría que ya tiene el rol)
+    clave = tuberia.clave("ascenso", interaction.user, usuario, rango, motivo)
+    if await tuberia.responder_duplicado(interaction, clave):
+        return
+    
+    # Verificar que el bot puede asignar este rol
+    if not indice.asignable(interaction.guild, rango):
         await interaction.response.send_message(
-            "❌ No tengo permisos para asignar roles",
+            f"❌ No tengo permisos para asignar el rol '{rango.name}'",
             ephemeral=True
         )
-    except Exception as e:
+        return
+    
+    # Verificar si el usuario ya tiene el rol
+    if rango in usuario.roles:
         await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
+            f"❌ {usuario.mention} ya tiene el rol '{rango.name}'",
             ephemeral=True
         )
+        return
+    
+    async def ascender():
+        # Asignar el rol y cambiar la placa si el rol está en el diccionario, en un solo cambio
+        plan = PlanMiembro(usuario).agregar(rango)
+        prefijo = configuracion.de(rango.guild).prefijos_placa.get(rango.name)
+        if prefijo:
+            # Conservar el número de placa registrado (o el del nickname actual)
+            numero_placa = registro_placas.numero_de(usuario.guild.id, usuario.id) or numero_placa_de(usuario.nick) or "00"
+            plan.apodo(nick_con_placa(prefijo, numero_placa, usuario.name), opcional=True)
+        await plan.aplicar()
+        for aviso in plan.avisos:
+            log.warning("%s", aviso, extra={'guild': usuario.guild.id, 'miembro': usuario.id})
+        terminar_periodo_prueba(usuario)
+        
+        return con_avisos(f"✅ Se ha ascendido a {usuario.mention} al rango **{rango.name}**", plan)
+    
+    async def anunciar():
+        await enviar_mensaje_ascenso(interaction.guild, usuario, rango, motivo, interaction.user, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(
+        interaction, "ascenso", ascender, anunciar,
+        mensaje_forbidden="❌ No tengo permisos para asignar roles", clave=clave
+    )
 
-async def enviar_mensaje_ascenso(guild, usuario, rango, motivo, autor_comando):
-    """Envía el mensaje de ascenso al canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango'"""
+async def enviar_mensaje_ascenso(guild, usuario, rango, motivo, autor_comando, clave=None):
+    """Envía el mensaje de ascenso al canal de rangos"""
     try:
-        # Buscar el canal "↪📣》𝗦ubir-𝗕ajar-𝗥ango"
-        canal_ascensos = discord.utils.get(guild.channels, name="↪📣》𝗦ubir-𝗕ajar-𝗥ango")
+        # Buscar el canal de rangos
+        canal_ascensos = configuracion.canal(guild, 'rangos')
         
         if not canal_ascensos:
-            print("⚠️ Canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('rangos'), extra={'guild': guild.id})
             return
         
         # Crear embed de ascenso
@@ -843,16 +1322,16 @@ async def enviar_mensaje_ascenso(guild, usuario, rango, motivo, autor_comando):
         embed_ascenso.set_footer(text=f"Ejecuta: {autor_comando.display_name}")
         embed_ascenso.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal de ascensos
-        await canal_ascensos.send(content=f"{usuario.mention}", embed=embed_ascenso)
+        # Encolar el mensaje para el canal de ascensos
+        buzon.encolar(Anuncio(canal_ascensos.id, f"{usuario.mention}", embed_ascenso, clave=f"ascenso:{clave}" if clave else None, guild_id=guild.id))
         
-        print(f"✅ Mensaje de ascenso enviado al canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango' para {usuario.display_name}")
+        log.info("Mensaje de ascenso encolado para el canal '%s' para %s", canal_ascensos.name, usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje de ascenso: {str(e)}")
+        log.exception("Error al enviar mensaje de ascenso: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
 @bot.command(name="ascenso", description="Asciende a un usuario a un nuevo rango")
-async def ascenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *, motivo: str):
+async def ascenso_prefix(ctx, usuario: miembros.ConversorMiembro, rango: discord.Role, *, motivo: str):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
@@ -865,7 +1344,7 @@ async def ascenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *, m
     
     try:
         # Verificar que el bot puede asignar este rol
-        if rango.position >= ctx.guild.me.top_role.position or rango.managed:
+        if not indice.asignable(ctx.guild, rango):
             await ctx.send(f"❌ No tengo permisos para asignar el rol '{rango.name}'")
             return
         
@@ -874,36 +1353,29 @@ async def ascenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *, m
             await ctx.send(f"❌ {usuario.mention} ya tiene el rol '{rango.name}'")
             return
         
-        # Asignar el rol
-        await usuario.add_roles(rango)
-        
-        # Cambiar la placa si el rol está en el diccionario
-        prefijo = PREFIJOS_PLACA.get(rango.name)
+        # Asignar el rol y cambiar la placa si el rol está en el diccionario, en un solo cambio
+        plan = PlanMiembro(usuario).agregar(rango)
+        prefijo = configuracion.de(rango.guild).prefijos_placa.get(rango.name)
         if prefijo:
-            # Intentar extraer el número de placa del nickname actual
-            numero_placa = "00"
-            if usuario.nick:
-                match = re.match(r"^[A-Z]{3}-?(\d{1,2})\s*\|", usuario.nick)
-                if match:
-                    numero_placa = match.group(1)
-            nuevo_nickname = f"{prefijo}-{numero_placa} | {usuario.name}"
-            if len(nuevo_nickname) > 32:
-                nombre_truncado = usuario.name[:32 - len(f"{prefijo}-{numero_placa} | ")]
-                nuevo_nickname = f"{prefijo}-{numero_placa} | {nombre_truncado}"
-            try:
-                await usuario.edit(nick=nuevo_nickname)
-            except Exception as e:
-                print(f"❌ Error al cambiar la placa: {str(e)}")
+            # Conservar el número de placa registrado (o el del nickname actual)
+            numero_placa = registro_placas.numero_de(usuario.guild.id, usuario.id) or numero_placa_de(usuario.nick) or "00"
+            plan.apodo(nick_con_placa(prefijo, numero_placa, usuario.name), opcional=True)
+        await plan.aplicar()
+        for aviso in plan.avisos:
+            log.warning("%s", aviso, extra={'guild': usuario.guild.id, 'miembro': usuario.id})
+        terminar_periodo_prueba(usuario)
         
         # Enviar confirmación al canal donde se ejecutó el comando
-        await ctx.send(f"✅ Se ha ascendido a {usuario.mention} al rango **{rango.name}**")
+        await ctx.send(con_avisos(f"✅ Se ha ascendido a {usuario.mention} al rango **{rango.name}**", plan))
         
         # Enviar mensaje al canal de ascensos
-        await enviar_mensaje_ascenso(ctx.guild, usuario, rango, motivo, ctx.author)
+        await enviar_mensaje_ascenso(ctx.guild, usuario, rango, motivo, ctx.author, clave=ctx.message.id)
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para asignar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
 @bot.tree.command(name="descenso", description="Desciende a un usuario a un rango inferior")
@@ -929,54 +1401,45 @@ async def descenso(interaction: discord.Interaction, usuario: discord.Member, ra
         )
         return
     
-    try:
-        # Verificar que el bot puede asignar este rol
-        if rango.position >= interaction.guild.me.top_role.position or rango.managed:
-            await interaction.response.send_message(
-                f"❌ No tengo permisos para asignar el rol '{rango.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Verificar si el usuario ya tiene el rol
-        if rango in usuario.roles:
-            await interaction.response.send_message(
-                f"❌ {usuario.mention} ya tiene el rol '{rango.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Asignar el rol
-        await usuario.add_roles(rango)
-        
-        # Enviar confirmación al usuario que ejecutó el comando
-        await interaction.response.send_message(
-            f"✅ Se ha descendido a {usuario.mention} al rango **{rango.name}**",
-            ephemeral=True
-        )
-        
-        # Enviar mensaje al canal de descensos
-        await enviar_mensaje_descenso(interaction.guild, usuario, rango, motivo, interaction.user)
-        
-    except discord.Forbidden:
+    # Verificar que el bot puede asignar este rol
+    if not indice.asignable(interaction.guild, rango):
         await interaction.response.send_message(
-            "❌ No tengo permisos para asignar roles",
+            f"❌ No tengo permisos para asignar el rol '{rango.name}'",
             ephemeral=True
         )
-    except Exception as e:
+        return
+    
+    # Verificar si el usuario ya tiene el rol
+    if rango in usuario.roles:
         await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
+            f"❌ {usuario.mention} ya tiene el rol '{rango.name}'",
             ephemeral=True
         )
+        return
+    
+    async def descender():
+        # Asignar el rol
+        await PlanMiembro(usuario).agregar(rango).aplicar()
+        
+        return f"✅ Se ha descendido a {usuario.mention} al rango **{rango.name}**"
+    
+    async def anunciar():
+        await enviar_mensaje_descenso(interaction.guild, usuario, rango, motivo, interaction.user, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(
+        interaction, "descenso", descender, anunciar,
+        mensaje_forbidden="❌ No tengo permisos para asignar roles"
+    )
 
-async def enviar_mensaje_descenso(guild, usuario, rango, motivo, autor_comando):
-    """Envía el mensaje de descenso al canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango'"""
+async def enviar_mensaje_descenso(guild, usuario, rango, motivo, autor_comando, clave=None):
+    """Envía el mensaje de descenso al canal de rangos"""
     try:
-        # Buscar el canal "↪📣》𝗦ubir-𝗕ajar-𝗥ango"
-        canal_descensos = discord.utils.get(guild.channels, name="↪📣》𝗦ubir-𝗕ajar-𝗥ango")
+        # Buscar el canal de rangos
+        canal_descensos = configuracion.canal(guild, 'rangos')
         
         if not canal_descensos:
-            print("⚠️ Canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('rangos'), extra={'guild': guild.id})
             return
         
         # Crear embed de descenso
@@ -1011,16 +1474,16 @@ async def enviar_mensaje_descenso(guild, usuario, rango, motivo, autor_comando):
         embed_descenso.set_footer(text=f"Ejecuta: {autor_comando.display_name}")
         embed_descenso.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal de descensos
-        await canal_descensos.send(content=f"{usuario.mention}", embed=embed_descenso)
+        # Encolar el mensaje para el canal de descensos
+        buzon.encolar(Anuncio(canal_descensos.id, f"{usuario.mention}", embed_descenso, clave=f"descenso:{clave}" if clave else None, guild_id=guild.id))
         
-        print(f"✅ Mensaje de descenso enviado al canal '↪📣》𝗦ubir-𝗕ajar-𝗥ango' para {usuario.display_name}")
+        log.info("Mensaje de descenso encolado para el canal '%s' para %s", canal_descensos.name, usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje de descenso: {str(e)}")
+        log.exception("Error al enviar mensaje de descenso: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
 @bot.command(name="descenso", description="Desciende a un usuario a un rango inferior")
-async def descenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *, motivo: str):
+async def descenso_prefix(ctx, usuario: miembros.ConversorMiembro, rango: discord.Role, *, motivo: str):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
@@ -1033,7 +1496,7 @@ async def descenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *,
     
     try:
         # Verificar que el bot puede asignar este rol
-        if rango.position >= ctx.guild.me.top_role.position or rango.managed:
+        if not indice.asignable(ctx.guild, rango):
             await ctx.send(f"❌ No tengo permisos para asignar el rol '{rango.name}'")
             return
         
@@ -1043,19 +1506,28 @@ async def descenso_prefix(ctx, usuario: discord.Member, rango: discord.Role, *,
             return
         
         # Asignar el rol
-        await usuario.add_roles(rango)
+        await PlanMiembro(usuario).agregar(rango).aplicar()
         
         # Enviar confirmación al canal donde se ejecutó el comando
         await ctx.send(f"✅ Se ha descendido a {usuario.mention} al rango **{rango.name}**")
         
         # Enviar mensaje al canal de descensos
-        await enviar_mensaje_descenso(ctx.guild, usuario, rango, motivo, ctx.author)
+        await enviar_mensaje_descenso(ctx.guild, usuario, rango, motivo, ctx.author, clave=ctx.message.id)
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para asignar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
+async def aplicar_despido(usuario, roles_a_asignar):
+    """Sustituye todos los roles del usuario por los de sanción en un solo cambio"""
+    await PlanMiembro(usuario).quitar_todos().agregar(*roles_a_asignar).aplicar()
+    terminar_periodo_prueba(usuario)
+    
+    return f"✅ Se ha despedido a {usuario.mention} y se le han asignado los roles de sanción"
+
 @bot.tree.command(name="despido", description="Despide a un usuario y le asigna roles de sanción")
 @app_commands.describe(
     usuario="Usuario al que despedir",
@@ -1078,76 +1550,39 @@ async def despido(interaction: discord.Interaction, usuario: discord.Member, mot
         )
         return
     
-    try:
-        # Buscar los roles de sanción
-        roles_sancion = [
-            "═══════Sanciones═══════",
-            "❌| Despedido",
-            "🎟️〴Civil〴"
-        ]
-        
-        roles_a_asignar = []
-        roles_no_encontrados = []
-        
-        for nombre_rol in roles_sancion:
-            rol = discord.utils.get(interaction.guild.roles, name=nombre_rol)
-            if rol:
-                # Verificar que el bot puede asignar este rol
-                if rol.position < interaction.guild.me.top_role.position and not rol.managed:
-                    roles_a_asignar.append(rol)
-                else:
-                    roles_no_encontrados.append(nombre_rol)
-            else:
-                roles_no_encontrados.append(nombre_rol)
-        
-        if not roles_a_asignar:
-            await interaction.response.send_message(
-                f"❌ No se encontraron roles de sanción válidos. Roles configurados: {', '.join(roles_sancion)}",
-                ephemeral=True
-            )
-            if roles_no_encontrados:
-                await interaction.followup.send(
-                    f"⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}",
-                    ephemeral=True
-                )
-            return
-        
-        # Quitar todos los roles del usuario (excepto @everyone)
-        roles_a_quitar = [rol for rol in usuario.roles if rol.name != "@everyone"]
-        if roles_a_quitar:
-            await usuario.remove_roles(*roles_a_quitar)
-        
-        # Asignar roles de sanción
-        await usuario.add_roles(*roles_a_asignar)
-        
-        # Enviar confirmación al usuario que ejecutó el comando
-        await interaction.response.send_message(
-            f"✅ Se ha despedido a {usuario.mention} y se le han asignado los roles de sanción",
-            ephemeral=True
-        )
-        
-        # Enviar mensaje al canal de despidos
-        await enviar_mensaje_despido(interaction.guild, usuario, motivo, interaction.user)
-        
-    except discord.Forbidden:
-        await interaction.response.send_message(
-            "❌ No tengo permisos para gestionar roles",
-            ephemeral=True
-        )
-    except Exception as e:
+    # Buscar los roles de sanción
+    roles_configurados = configuracion.de(interaction.guild).roles_despido
+    roles_a_asignar, roles_no_encontrados = buscar_roles(interaction.guild, roles_configurados)
+    
+    if not roles_a_asignar:
         await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
+            f"❌ No se encontraron roles de sanción válidos. Roles configurados: {', '.join(roles_configurados)}",
             ephemeral=True
         )
+        if roles_no_encontrados:
+            await interaction.followup.send(
+                f"⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}",
+                ephemeral=True
+            )
+        return
+    
+    async def despedir():
+        return await aplicar_despido(usuario, roles_a_asignar)
+    
+    async def anunciar():
+        await enviar_mensaje_despido(interaction.guild, usuario, motivo, interaction.user, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(interaction, "despido", despedir, anunciar, clave=tuberia.clave("despido", interaction.user, usuario, motivo))
 
-async def enviar_mensaje_despido(guild, usuario, motivo, autor_comando):
-    """Envía el mensaje de despido al canal '↪🚫》𝗗espidos'"""
+async def enviar_mensaje_despido(guild, usuario, motivo, autor_comando, clave=None):
+    """Envía el mensaje de despido al canal de despidos"""
     try:
-        # Buscar el canal "↪🚫》𝗗espidos"
-        canal_despidos = discord.utils.get(guild.channels, name="↪🚫》𝗗espidos")
+        # Buscar el canal de despidos
+        canal_despidos = configuracion.canal(guild, 'despidos')
         
         if not canal_despidos:
-            print("⚠️ Canal '↪🚫》𝗗espidos' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('despidos'), extra={'guild': guild.id})
             return
         
         # Crear embed de despido
@@ -1175,16 +1610,16 @@ async def enviar_mensaje_despido(guild, usuario, motivo, autor_comando):
         embed_despido.set_footer(text=f"Ejecuta: {autor_comando.display_name}")
         embed_despido.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal de despidos
-        await canal_despidos.send(content=f"{usuario.mention}", embed=embed_despido)
+        # Encolar el mensaje para el canal de despidos
+        buzon.encolar(Anuncio(canal_despidos.id, f"{usuario.mention}", embed_despido, clave=f"despido:{clave}" if clave else None, guild_id=guild.id))
         
-        print(f"✅ Mensaje de despido enviado al canal '↪🚫》𝗗espidos' para {usuario.display_name}")
+        log.info("Mensaje de despido encolado para el canal '%s' para %s", canal_despidos.name, usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje de despido: {str(e)}")
+        log.exception("Error al enviar mensaje de despido: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
 @bot.command(name="despido", description="Despide a un usuario y le asigna roles de sanción")
-async def despido_prefix(ctx, usuario: discord.Member, *, motivo: str):
+async def despido_prefix(ctx, usuario: miembros.ConversorMiembro, *, motivo: str):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
@@ -1197,60 +1632,41 @@ async def despido_prefix(ctx, usuario: discord.Member, *, motivo: str):
     
     try:
         # Buscar los roles de sanción
-        roles_sancion = [
-            "═══════Sanciones═══════",
-            "❌| Despedido",
-            "🎟️〴Civil〴"
-        ]
-        
-        roles_a_asignar = []
-        roles_no_encontrados = []
-        
-        for nombre_rol in roles_sancion:
-            rol = discord.utils.get(ctx.guild.roles, name=nombre_rol)
-            if rol:
-                # Verificar que el bot puede asignar este rol
-                if rol.position < ctx.guild.me.top_role.position and not rol.managed:
-                    roles_a_asignar.append(rol)
-                else:
-                    roles_no_encontrados.append(nombre_rol)
-            else:
-                roles_no_encontrados.append(nombre_rol)
+        roles_configurados = configuracion.de(ctx.guild).roles_despido
+        roles_a_asignar, roles_no_encontrados = buscar_roles(ctx.guild, roles_configurados)
         
         if not roles_a_asignar:
-            await ctx.send(f"❌ No se encontraron roles de sanción válidos. Roles configurados: {', '.join(roles_sancion)}")
+            await ctx.send(f"❌ No se encontraron roles de sanción válidos. Roles configurados: {', '.join(roles_configurados)}")
             if roles_no_encontrados:
                 await ctx.send(f"⚠️ Roles no encontrados o sin permisos: {', '.join(roles_no_encontrados)}")
             return
         
-        # Quitar todos los roles del usuario (excepto @everyone)
-        roles_a_quitar = [rol for rol in usuario.roles if rol.name != "@everyone"]
-        if roles_a_quitar:
-            await usuario.remove_roles(*roles_a_quitar)
-        
-        # Asignar roles de sanción
-        await usuario.add_roles(*roles_a_asignar)
+        # Sustituir todos los roles del usuario por los de sanción en un solo cambio
+        await PlanMiembro(usuario).quitar_todos().agregar(*roles_a_asignar).aplicar()
+        terminar_periodo_prueba(usuario)
         
         # Enviar confirmación al canal donde se ejecutó el comando
         await ctx.send(f"✅ Se ha despedido a {usuario.mention} y se le han asignado los roles de sanción")
         
         # Enviar mensaje al canal de despidos
-        await enviar_mensaje_despido(ctx.guild, usuario, motivo, ctx.author)
+        await enviar_mensaje_despido(ctx.guild, usuario, motivo, ctx.author, clave=ctx.message.id)
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para gestionar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
 @bot.tree.command(name="sancion", description="Aplica una sanción a un usuario")
 @app_commands.describe(
     usuario="Usuario al que sancionar",
     rol="Rol de sanción a aplicar",
-    strikes="Número de strikes acumulados",
     razon="Razón de la sanción",
-    autorizado_por="Persona que autoriza la sanción"
+    autorizado_por="Persona que autoriza la sanción",
+    strikes="Strikes que suma esta sanción (por defecto 1)"
 )
-async def sancion(interaction: discord.Interaction, usuario: discord.Member, rol: discord.Role, strikes: int, razon: str, autorizado_por: discord.Member):
+async def sancion(interaction: discord.Interaction, usuario: discord.Member, rol: discord.Role, razon: str, autorizado_por: discord.Member, strikes: app_commands.Range[int, 0, 10] = 1):
     # Verificar permisos
     if not interaction.user.guild_permissions.manage_roles:
         await interaction.response.send_message(
@@ -1267,54 +1683,66 @@ async def sancion(interaction: discord.Interaction, usuario: discord.Member, rol
         )
         return
     
-    try:
-        # Verificar que el bot puede asignar este rol
-        if rol.position >= interaction.guild.me.top_role.position or rol.managed:
-            await interaction.response.send_message(
-                f"❌ No tengo permisos para asignar el rol '{rol.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Verificar si el usuario ya tiene el rol
-        if rol in usuario.roles:
-            await interaction.response.send_message(
-                f"❌ {usuario.mention} ya tiene el rol '{rol.name}'",
-                ephemeral=True
-            )
-            return
-        
-        # Asignar el rol de sanción
-        await usuario.add_roles(rol)
-        
-        # Enviar confirmación al usuario que ejecutó el comando
+    # Una sanción repetida recibe el resultado de la original (si no, diría que ya tiene el rol)
+    clave = tuberia.clave("sancion", interaction.user, usuario, rol, razon, autorizado_por, strikes)
+    if await tuberia.responder_duplicado(interaction, clave):
+        return
+    
+    # Verificar que el bot puede asignar este rol
+    if not indice.asignable(interaction.guild, rol):
         await interaction.response.send_message(
-            f"✅ Se ha sancionado a {usuario.mention} con el rol **{rol.name}**",
+            f"❌ No tengo permisos para asignar el rol '{rol.name}'",
             ephemeral=True
         )
-        
-        # Enviar mensaje al canal de sanciones
-        await enviar_mensaje_sancion(interaction.guild, usuario, rol, strikes, razon, autorizado_por, interaction.user)
-        
-    except discord.Forbidden:
+        return
+    
+    # Verificar si el usuario ya tiene el rol
+    if rol in usuario.roles:
         await interaction.response.send_message(
-            "❌ No tengo permisos para asignar roles",
+            f"❌ {usuario.mention} ya tiene el rol '{rol.name}'",
             ephemeral=True
         )
-    except Exception as e:
-        await interaction.response.send_message(
-            f"❌ Error: {str(e)}",
-            ephemeral=True
+        return
+    
+    total_strikes = 0
+    
+    async def sancionar():
+        nonlocal total_strikes
+        # Asignar el rol de sanción
+        await PlanMiembro(usuario).agregar(rol).aplicar()
+        
+        # Registrar la sanción; el total acumulado lo calcula el registro
+        total_strikes = registro_sanciones.registrar(
+            interaction.guild.id, usuario.id, rol, strikes, razon,
+            autorizado_por=autorizado_por.id, ejecutado_por=interaction.user.id, clave=f"sancion:{interaction.id}"
         )
+        
+        return f"✅ Se ha sancionado a {usuario.mention} con el rol **{rol.name}** ({total_strikes} strikes acumulados){aviso_strikes(interaction.guild)}"
+    
+    async def anunciar():
+        await enviar_mensaje_sancion(interaction.guild, usuario, rol, total_strikes, razon, autorizado_por, interaction.user, clave=interaction.id)
+    
+    # Responder de inmediato y aplicar los cambios en segundo plano
+    await tuberia.ejecutar(
+        interaction, "sancion", sancionar, anunciar,
+        mensaje_forbidden="❌ No tengo permisos para asignar roles", clave=clave
+    )
 
-async def enviar_mensaje_sancion(guild, usuario, rol, strikes, razon, autorizado_por, ejecuta):
-    """Envía el mensaje de sanción al canal '↪📛》𝗦anciones'"""
+def aviso_strikes(guild):
+    """Aviso para el moderador si el total de strikes aún no cuenta las sanciones anteriores al registro"""
+    canal_sanciones = configuracion.canal(guild, 'sanciones')
+    if canal_sanciones is None or importador_historial.completado(canal_sanciones.id):
+        return ""
+    return "\n⚠️ El historial de sanciones no se ha importado (`/importar-historial`): el total solo cuenta las sanciones registradas desde que el bot las guarda"
+
+async def enviar_mensaje_sancion(guild, usuario, rol, strikes, razon, autorizado_por, ejecuta, clave=None):
+    """Envía el mensaje de sanción al canal de sanciones"""
     try:
-        # Buscar el canal "↪📛》𝗦anciones"
-        canal_sanciones = discord.utils.get(guild.channels, name="↪📛》𝗦anciones")
+        # Buscar el canal de sanciones
+        canal_sanciones = configuracion.canal(guild, 'sanciones')
         
         if not canal_sanciones:
-            print("⚠️ Canal '↪📛》𝗦anciones' no encontrado")
+            log.warning("Canal '%s' no encontrado", configuracion.de(guild).nombre_canal('sanciones'), extra={'guild': guild.id})
             return
         
         # Crear embed de sanción
@@ -1356,21 +1784,31 @@ async def enviar_mensaje_sancion(guild, usuario, rol, strikes, razon, autorizado
         embed_sancion.set_footer(text=f"Ejecuta: {ejecuta.display_name}")
         embed_sancion.set_thumbnail(url=usuario.display_avatar.url)
         
-        # Enviar mensaje al canal de sanciones
-        await canal_sanciones.send(content=f"{usuario.mention}", embed=embed_sancion)
+        # Encolar el mensaje para el canal de sanciones
+        buzon.encolar(Anuncio(canal_sanciones.id, f"{usuario.mention}", embed_sancion, clave=f"sancion:{clave}" if clave else None, guild_id=guild.id))
         
-        print(f"✅ Mensaje de sanción enviado al canal '↪📛》𝗦anciones' para {usuario.display_name}")
+        log.info("Mensaje de sanción encolado para el canal '%s' para %s", canal_sanciones.name, usuario.display_name, extra={'guild': guild.id, 'miembro': usuario.id})
         
     except Exception as e:
-        print(f"❌ Error al enviar mensaje de sanción: {str(e)}")
+        log.exception("Error al enviar mensaje de sanción: %s", e, extra={'guild': guild.id, 'miembro': usuario.id})
 
 @bot.command(name="sancion", description="Aplica una sanción a un usuario")
-async def sancion_prefix(ctx, usuario: discord.Member, rol: discord.Role, strikes: int, autorizado_por: discord.Member, *, razon: str):
+async def sancion_prefix(ctx, usuario: miembros.ConversorMiembro, rol: discord.Role, strikes: Optional[int] = 1, autorizado_por: miembros.ConversorMiembro = None, *, razon: str):
     # Verificar permisos
     if not ctx.author.guild_permissions.manage_roles:
         await ctx.send("❌ No tienes permisos para gestionar roles")
         return
     
+    # Los strikes son los que suma esta sanción (por defecto 1), no el total acumulado
+    if strikes is None:
+        strikes = 1
+    if not 0 <= strikes <= 10:
+        await ctx.send("❌ Los strikes que suma la sanción deben estar entre 0 y 10 (el total acumulado se calcula solo)")
+        return
+    if autorizado_por is None:
+        await ctx.send("❌ Faltan argumentos requeridos para este comando")
+        return
+    
     # Verificar que el bot tenga permisos
     if not ctx.guild.me.guild_permissions.manage_roles:
         await ctx.send("❌ No tengo permisos para gestionar roles en este servidor")
@@ -1378,7 +1816,7 @@ async def sancion_prefix(ctx, usuario: discord.Member, rol: discord.Role, strike
     
     try:
         # Verificar que el bot puede asignar este rol
-        if rol.position >= ctx.guild.me.top_role.position or rol.managed:
+        if not indice.asignable(ctx.guild, rol):
             await ctx.send(f"❌ No tengo permisos para asignar el rol '{rol.name}'")
             return
         
@@ -1388,25 +1826,475 @@ async def sancion_prefix(ctx, usuario: discord.Member, rol: discord.Role, strike
             return
         
         # Asignar el rol de sanción
-        await usuario.add_roles(rol)
+        await PlanMiembro(usuario).agregar(rol).aplicar()
+        
+        # Registrar la sanción; el total acumulado lo calcula el registro
+        total_strikes = registro_sanciones.registrar(
+            ctx.guild.id, usuario.id, rol, strikes, razon,
+            autorizado_por=autorizado_por.id, ejecutado_por=ctx.author.id, clave=f"sancion:{ctx.message.id}"
+        )
         
         # Enviar confirmación al canal donde se ejecutó el comando
-        await ctx.send(f"✅ Se ha sancionado a {usuario.mention} con el rol **{rol.name}**")
+        await ctx.send(f"✅ Se ha sancionado a {usuario.mention} con el rol **{rol.name}** ({total_strikes} strikes acumulados){aviso_strikes(ctx.guild)}")
         
         # Enviar mensaje al canal de sanciones
-        await enviar_mensaje_sancion(ctx.guild, usuario, rol, strikes, razon, autorizado_por, ctx.author)
+        await enviar_mensaje_sancion(ctx.guild, usuario, rol, total_strikes, razon, autorizado_por, ctx.author, clave=ctx.message.id)
         
-    except discord.Forbidden:
+    except discord.Forbidden as e:
+        metricas.fallo(ctx, e)
         await ctx.send("❌ No tengo permisos para asignar roles")
     except Exception as e:
+        metricas.fallo(ctx, e)
         await ctx.send(f"❌ Error: {str(e)}")
 
+@bot.tree.command(name="historial-sanciones", description="Muestra las sanciones y strikes acumulados de un miembro")
+@app_commands.describe(
+    usuario="Miembro a consultar"
+)
+async def historial_sanciones(interaction: discord.Interaction, usuario: discord.Member):
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message(
+            "❌ No tienes permisos para usar este comando",
+            ephemeral=True
+        )
+        return
+    
+    total_strikes = registro_sanciones.total(interaction.guild.id, usuario.id)
+    historial = registro_sanciones.historial(interaction.guild.id, usuario.id, limite=10)
+    
+    embed = discord.Embed(
+        title="📛 Historial de sanciones",
+        description=f"{usuario.mention} · **{total_strikes}** strikes vigentes{aviso_strikes(interaction.guild)}",
+        color=discord.Color.red() if total_strikes else discord.Color.green()
+    )
+    if not historial:
+        embed.add_field(name="Sin sanciones", value="No hay sanciones registradas", inline=False)
+    for sancion_registrada in historial:
+        estado = "" if sancion_registrada.vigente() else " (caducada)"
+        autorizado = f" · autoriza <@{sancion_registrada.autorizado_por}>" if sancion_registrada.autorizado_por else ""
+        embed.add_field(
+            name=f"{sancion_registrada.creado.astimezone(ZONA_HORARIA).strftime('%d/%m/%Y')} · {sancion_registrada.rol_nombre} · {sancion_registrada.strikes} strikes{estado}",
+            value=f"{(sancion_registrada.razon or 'Sin razón')[:900]}{autorizado}",
+            inline=False
+        )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="recargar-config", description="Recarga la configuración de roles y canales sin reiniciar el bot")
+@app_commands.describe(
+    forzar="Aplica la configuración aunque falten roles o canales"
+)
+async def recargar_config(interaction: discord.Interaction, forzar: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "❌ Solo los administradores pueden usar este comando",
+            ephemeral=True
+        )
+        return
+    
+    aplicada, errores = configuracion.almacen().recargar(bot.guilds, forzar=forzar)
+    log.info('Recarga de configuración solicitada por %s: %s', interaction.user, 'aplicada' if aplicada else 'rechazada', extra={'comando': 'recargar-config', 'miembro': interaction.user.id})
+    detalle = "\n".join(f"• {error}" for error in errores[:20])
+    if len(errores) > 20:
+        detalle += f"\n… y {len(errores) - 20} más"
+    if aplicada:
+        mensaje = "✅ Configuración recargada"
+        if errores:
+            mensaje += f" con referencias que faltan:\n{detalle}"
+    else:
+        mensaje = f"❌ La configuración no se ha aplicado:\n{detalle}"
+        if not forzar:
+            mensaje += "\nSi solo faltan roles o canales, puedes aplicarla con `forzar: True`."
+    await interaction.response.send_message(mensaje[:2000], ephemeral=True)
+
+@bot.tree.command(name="importar-historial", description="Importa en segundo plano el historial de los canales de anuncios")
+@app_commands.describe(
+    reiniciar="Vuelve a importar los canales desde el principio"
+)
+async def importar_historial(interaction: discord.Interaction, reiniciar: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "❌ Solo los administradores pueden usar este comando",
+            ephemeral=True
+        )
+        return
+    
+    canales = [canal for canal in (configuracion.canal(interaction.guild, clave) for clave in CANALES_HISTORIAL) if canal]
+    nombres = {canal.id: canal.name for canal in canales}
+    
+    if importacion_en_marcha():
+        progreso = "\n".join(
+            f"{'✅' if completado else '⏳'} {nombres.get(canal_id, canal_id)}: {importados} registros"
+            for canal_id, importados, completado in importador_historial.progreso(interaction.guild.id)
+        )
+        await interaction.response.send_message(f"⏳ Ya hay una importación en curso\n{progreso}", ephemeral=True)
+        return
+    
+    if not canales:
+        await interaction.response.send_message("❌ No se encontró ningún canal de anuncios", ephemeral=True)
+        return
+    
+    if reiniciar:
+        for canal in canales:
+            importador_historial.reiniciar(canal.id)
+    iniciar_importacion(canales)
+    await interaction.response.send_message(
+        f"📚 Importando el historial de {len(canales)} canales en segundo plano. Vuelve a usar el comando para ver el progreso.",
+        ephemeral=True
+    )
+
+@bot.tree.command(name="buscar-placa", description="Muestra quién tiene un número de placa")
+@app_commands.describe(
+    numero_placa="Número de placa a buscar (1-99)"
+)
+async def buscar_placa(interaction: discord.Interaction, numero_placa: int):
+    sembrar_placas(interaction.guild.id)
+    titular_id = registro_placas.titular(interaction.guild.id, numero_placa)
+    if titular_id is None:
+        siguiente = registro_placas.siguiente_libre(interaction.guild.id)
+        await interaction.response.send_message(
+            f"ℹ️ La placa número {numero_placa} está libre (primer número libre: {siguiente})",
+            ephemeral=True
+        )
+        return
+    
+    await interaction.response.send_message(
+        f"🆔 La placa número {numero_placa} pertenece a <@{titular_id}>",
+        ephemeral=True
+    )
+
+# --- Asistencia ---
+
+def leer_fecha(texto):
+    """Convierte 'dd/mm/aaaa' en una fecha; lanza ValueError si no es válida"""
+    return datetime.datetime.strptime(texto.strip(), '%d/%m/%Y').date()
+
+@bot.tree.command(name="asistencia", description="Muestra la asistencia diaria de un miembro en un rango de fechas")
+@app_commands.describe(
+    usuario="Miembro a consultar",
+    desde="Fecha inicial (dd/mm/aaaa, por defecto hace 30 días)",
+    hasta="Fecha final (dd/mm/aaaa, por defecto hoy)"
+)
+async def consultar_asistencia(interaction: discord.Interaction, usuario: discord.Member, desde: Optional[str] = None, hasta: Optional[str] = None):
+    hoy = datetime.datetime.now(ZONA_HORARIA).date()
+    try:
+        fecha_hasta = leer_fecha(hasta) if hasta else hoy
+        fecha_desde = leer_fecha(desde) if desde else fecha_hasta - datetime.timedelta(days=29)
+    except ValueError:
+        await interaction.response.send_message("❌ Las fechas deben tener el formato dd/mm/aaaa", ephemeral=True)
+        return
+    if fecha_desde > fecha_hasta:
+        await interaction.response.send_message("❌ La fecha inicial es posterior a la final", ephemeral=True)
+        return
+    if (fecha_hasta - fecha_desde).days >= asistencia.MAX_DIAS_HISTORIAL:
+        await interaction.response.send_message(
+            f"❌ El rango de fechas no puede superar {asistencia.MAX_DIAS_HISTORIAL} días",
+            ephemeral=True
+        )
+        return
+    
+    historial = registro_asistencia.historial(interaction.guild.id, usuario.id, fecha_desde, fecha_hasta)
+    presentes = [fecha for fecha, estado in historial if estado == 'presente']
+    ausentes = [fecha for fecha, estado in historial if estado == 'ausente']
+    dias_actividad = len(presentes) + len(ausentes)
+    
+    periodo = f"{fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
+    if not dias_actividad:
+        await interaction.response.send_message(
+            f"ℹ️ No hubo mensajes de actividad registrados entre {periodo}",
+            ephemeral=True
+        )
+        return
+    
+    embed = discord.Embed(
+        title="📅 Asistencia diaria",
+        description=f"{usuario.mention} · {periodo}",
+        color=0x00ff00 if not ausentes else 0xffa500
+    )
+    embed.add_field(name="✅ Presente", value=f"{len(presentes)}/{dias_actividad} días", inline=True)
+    embed.add_field(name="❌ Ausente", value=f"{len(ausentes)} días", inline=True)
+    if ausentes:
+        fechas = ", ".join(fecha.strftime('%d/%m') for fecha in ausentes)
+        embed.add_field(name="Días sin reaccionar", value=fechas[:1024], inline=False)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def informe_sin_reaccion(guild, dia):
+    """Embed y CSV con el Personal MTMS que no reaccionó al mensaje de actividad de ``dia``.
+
+    La lista de reacciones se pide por páginas y se cruza con los miembros del
+    rol, que se descargan antes si el servidor no lo está; también cuentan las
+    reacciones vistas en vivo ese día. Sin el intent de miembros no se puede
+    saber quién tiene el rol y se rechaza.
+    """
+    if not bot.intents.members:
+        raise tuberia.ErrorComando("Este informe necesita el intent de miembros (INTENT_MIEMBROS distinto de 'no')")
+    nombre_rol = configuracion.de(guild).rol_personal
+    rol_personal = indice.rol(guild, nombre_rol)
+    if not rol_personal:
+        raise tuberia.ErrorComando(f"Rol '{nombre_rol}' no encontrado")
+    if not guild.chunked:
+        await guild.chunk(cache=True)
+    
+    clave = asistencia.dia_clave(dia)
+    publicado = registro_asistencia.mensaje_del_dia(guild.id, clave)
+    if publicado is None:
+        raise tuberia.ErrorComando(f"No hay mensaje de actividad registrado el {dia.strftime('%d/%m/%Y')}")
+    
+    canal_id, mensaje_id = publicado
+    try:
+        canal = guild.get_channel(canal_id) or await guild.fetch_channel(canal_id)
+        mensaje = await canal.fetch_message(mensaje_id)
+    except discord.NotFound:
+        raise tuberia.ErrorComando("El mensaje de actividad ya no existe")
+    reaccionaron = await asistencia.reactores(mensaje) | registro_asistencia.presentes(guild.id, clave)
+    ausentes = asistencia.sin_reaccion(rol_personal, reaccionaron)
+    total = sum(1 for miembro in rol_personal.members if not miembro.bot)
+    
+    embed = discord.Embed(
+        title=f"📋 Sin reacción a la actividad del {dia.strftime('%d/%m/%Y')}",
+        description=f"{len(ausentes)} de {total} miembros de {rol_personal.mention} no han reaccionado",
+        color=0x00ff00 if not ausentes else 0xffa500
+    )
+    if ausentes:
+        menciones = ""
+        for posicion, miembro in enumerate(ausentes):
+            linea = f"{miembro.mention}\n"
+            if len(menciones) + len(linea) > 1000:
+                menciones += f"… y {len(ausentes) - posicion} más (ver CSV adjunto)"
+                break
+            menciones += linea
+        embed.add_field(name="Miembros", value=menciones, inline=False)
+    
+    archivo = discord.File(io.BytesIO(asistencia.csv_miembros(ausentes)), filename=f"sin-reaccion-{clave}.csv")
+    return embed, archivo
+
+@bot.tree.command(name="sin-reaccion", description="Lista el Personal MTMS que no ha reaccionado al mensaje de actividad")
+@app_commands.describe(
+    fecha="Día del mensaje de actividad (dd/mm/aaaa, por defecto hoy)"
+)
+async def sin_reaccion(interaction: discord.Interaction, fecha: Optional[str] = None):
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message(
+            "❌ No tienes permisos para usar este comando",
+            ephemeral=True
+        )
+        return
+    try:
+        dia = leer_fecha(fecha) if fecha else datetime.datetime.now(ZONA_HORARIA).date()
+    except ValueError:
+        await interaction.response.send_message("❌ La fecha debe tener el formato dd/mm/aaaa", ephemeral=True)
+        return
+    
+    # Recorrer las reacciones de un servidor grande lleva varias peticiones
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        embed, archivo = await informe_sin_reaccion(interaction.guild, dia)
+        await interaction.followup.send(embed=embed, file=archivo, ephemeral=True)
+    except tuberia.ErrorComando as e:
+        metricas.fallo(interaction, e)
+        await interaction.followup.send(f"❌ {str(e)}", ephemeral=True)
+    except discord.HTTPException as e:
+        metricas.fallo(interaction, e)
+        await interaction.followup.send(f"❌ Error al leer las reacciones: {str(e)}", ephemeral=True)
+
+async def enviar_informe_sin_reaccion(fecha):
+    """Publica el informe de quién no ha reaccionado en el canal de informes de actividad de cada servidor"""
+    dia = (fecha - datetime.timedelta(hours=HORAS_INFORME_ACTIVIDAD)).date()
+    
+    async def enviar_en_guild(guild):
+        nombre_canal = configuracion.de(guild).nombre_canal('informe_actividad') or CANAL_INFORME_ACTIVIDAD
+        if not nombre_canal:
+            raise difusion.Omitido(difusion.SIN_CANAL, "Sin canal de informes configurado")
+        canal = indice.canal(guild, nombre_canal)
+        if not canal:
+            raise difusion.Omitido(difusion.SIN_CANAL, f"Canal '{nombre_canal}' no encontrado")
+        embed, archivo = await informe_sin_reaccion(guild, dia)
+        return await canal.send(embed=embed, file=archivo)
+    
+    resultados = await difusion.difundir(bot.guilds, enviar_en_guild, concurrencia=CONCURRENCIA_DIFUSION)
+    for resultado in resultados:
+        log.log(
+            logging.INFO if resultado.estado == difusion.ENVIADO else logging.WARNING,
+            "Informe de actividad %s en %s: %s %s", dia.strftime('%d/%m/%Y'), resultado.guild_nombre, resultado.estado, resultado.detalle,
+            extra={'guild': resultado.guild_id}
+        )
+
+if HORAS_INFORME_ACTIVIDAD:
+    hora_informe = (datetime.datetime.combine(datetime.date.min, HORA_ACTIVIDAD) + datetime.timedelta(hours=HORAS_INFORME_ACTIVIDAD)).time()
+    if intents.members:
+        planificador.agregar(TareaDiaria('informe-actividad', hora_informe, ZONA_HORARIA, enviar_informe_sin_reaccion))
+    else:
+        log.warning("HORAS_INFORME_ACTIVIDAD no tiene efecto sin el intent de miembros (INTENT_MIEMBROS=no)")
+
+# --- Comandos masivos ---
+
+def leer_miembros(texto, con_dato=True):
+    """Lee '@usuario dato, @usuario dato, ...' y devuelve una lista de (ID, dato) sin repetidos"""
+    if con_dato:
+        entradas = re.findall(r"<@!?(\d+)>\s*([^\s,;<]+)", texto)
+    else:
+        entradas = [(usuario_id, None) for usuario_id in re.findall(r"<@!?(\d+)>", texto)]
+    # Si un usuario aparece dos veces se usa la primera entrada
+    unicas = {}
+    for usuario_id, dato in entradas:
+        unicas.setdefault(int(usuario_id), dato)
+    return list(unicas.items())
+
+async def obtener_miembro(guild, usuario_id):
+    """Devuelve el miembro reciente para editarlo (con consultas por lotes); lanza ErrorComando si no está en el servidor"""
+    miembro = await miembros.obtener_para_editar(guild, usuario_id)
+    if miembro is None:
+        raise tuberia.ErrorComando("No es miembro del servidor")
+    return miembro
+
+def etiquetas_miembros(guild, entradas):
+    """Añade una etiqueta legible a cada (ID, dato) para la tabla de resultados"""
+    elementos = []
+    for usuario_id, dato in entradas:
+        miembro = guild.get_member(usuario_id)
+        etiqueta = miembro.display_name if miembro else str(usuario_id)
+        elementos.append((etiqueta, (usuario_id, dato)))
+    return elementos
+
+@bot.tree.command(name="periodo-de-prueba-masivo", description="Inicia el período de prueba de varios usuarios a la vez")
+@app_commands.describe(
+    lista_miembros="Lista de '@usuario usuario_roblox' separados por comas"
+)
+@app_commands.rename(lista_miembros='miembros')
+async def periodo_prueba_masivo(interaction: discord.Interaction, lista_miembros: str):
+    # Verificar permisos
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message("❌ No tienes permisos para gestionar roles", ephemeral=True)
+        return
+    
+    # Verificar que el bot tenga permisos
+    if not interaction.guild.me.guild_permissions.manage_roles:
+        await interaction.response.send_message("❌ No tengo permisos para gestionar roles en este servidor", ephemeral=True)
+        return
+    
+    entradas = leer_miembros(lista_miembros)
+    if not entradas:
+        await interaction.response.send_message("❌ Formato: `@usuario usuario_roblox, @usuario usuario_roblox, ...`", ephemeral=True)
+        return
+    
+    roles_configurados = configuracion.de(interaction.guild).roles_periodo_prueba
+    roles_a_asignar, roles_no_encontrados = buscar_roles(interaction.guild, roles_configurados)
+    if not roles_a_asignar:
+        await interaction.response.send_message(
+            f"❌ No se encontraron roles válidos para asignar. Roles configurados: {', '.join(roles_configurados)}",
+            ephemeral=True
+        )
+        return
+    
+    async def procesar(entrada):
+        usuario_id, usuario_roblox = entrada
+        usuario = await obtener_miembro(interaction.guild, usuario_id)
+        mensaje = await aplicar_periodo_prueba(usuario, roles_a_asignar, usuario_roblox, interaction.user, clave=f"{interaction.id}:{usuario_id}")
+        await enviar_mensaje_periodo_prueba(interaction.guild, usuario, interaction.user, usuario_roblox, clave=f"{interaction.id}:{usuario_id}")
+        return mensaje
+    
+    await masivo.ejecutar(interaction, "periodo-de-prueba-masivo", etiquetas_miembros(interaction.guild, entradas), procesar, concurrencia=CONCURRENCIA_MASIVA)
+
+@bot.tree.command(name="asignar-placa-masivo", description="Asigna placas a varios usuarios a la vez")
+@app_commands.describe(
+    lista_miembros="Lista de '@usuario número_placa' (o '@usuario auto') separados por comas"
+)
+@app_commands.rename(lista_miembros='miembros')
+async def asignar_placa_masivo(interaction: discord.Interaction, lista_miembros: str):
+    # Verificar permisos
+    if not interaction.user.guild_permissions.manage_nicknames:
+        await interaction.response.send_message("❌ No tienes permisos para gestionar nicknames", ephemeral=True)
+        return
+    
+    # Verificar que el bot tenga permisos
+    if not interaction.guild.me.guild_permissions.manage_nicknames:
+        await interaction.response.send_message("❌ No tengo permisos para gestionar nicknames en este servidor", ephemeral=True)
+        return
+    
+    entradas = leer_miembros(lista_miembros)
+    if not entradas:
+        await interaction.response.send_message("❌ Formato: `@usuario número_placa, @usuario número_placa, ...`", ephemeral=True)
+        return
+    
+    sembrar_placas(interaction.guild.id)
+    
+    async def procesar(entrada):
+        usuario_id, numero = entrada
+        # Verificar que el número de placa sea válido (máximo 2 dígitos) o 'auto'
+        if numero.lower() != "auto" and (not numero.isdigit() or not 1 <= int(numero) <= 99):
+            raise tuberia.ErrorComando("El número de placa debe estar entre 1 y 99 (o 'auto')")
+        usuario = await obtener_miembro(interaction.guild, usuario_id)
+        if numero.lower() == "auto":
+            # Se elige y se reserva sin esperas intermedias, así no coincide con otro trabajador
+            numero_placa = registro_placas.siguiente_libre(interaction.guild.id)
+            if numero_placa is None:
+                raise tuberia.ErrorComando("No quedan números de placa libres")
+        else:
+            numero_placa = int(numero)
+        mensaje = await aplicar_placa(usuario, numero_placa)
+        await enviar_mensaje_asignacion_placa(interaction.guild, usuario, numero_placa, interaction.user, clave=f"{interaction.id}:{usuario_id}")
+        return mensaje
+    
+    await masivo.ejecutar(interaction, "asignar-placa-masivo", etiquetas_miembros(interaction.guild, entradas), procesar, concurrencia=CONCURRENCIA_MASIVA)
+
+@bot.tree.command(name="despido-masivo", description="Despide a varios usuarios a la vez y les asigna roles de sanción")
+@app_commands.describe(
+    lista_miembros="Menciones de los usuarios a despedir",
+    motivo="Motivo del despido"
+)
+@app_commands.rename(lista_miembros='miembros')
+async def despido_masivo(interaction: discord.Interaction, lista_miembros: str, motivo: str):
+    # Verificar permisos
+    if not interaction.user.guild_permissions.manage_roles:
+        await interaction.response.send_message("❌ No tienes permisos para gestionar roles", ephemeral=True)
+        return
+    
+    # Verificar que el bot tenga permisos
+    if not interaction.guild.me.guild_permissions.manage_roles:
+        await interaction.response.send_message("❌ No tengo permisos para gestionar roles en este servidor", ephemeral=True)
+        return
+    
+    entradas = leer_miembros(lista_miembros, con_dato=False)
+    if not entradas:
+        await interaction.response.send_message("❌ Menciona al menos a un usuario", ephemeral=True)
+        return
+    
+    # Buscar los roles de sanción
+    roles_configurados = configuracion.de(interaction.guild).roles_despido
+    roles_a_asignar, roles_no_encontrados = buscar_roles(interaction.guild, roles_configurados)
+    if not roles_a_asignar:
+        await interaction.response.send_message(
+            f"❌ No se encontraron roles de sanción válidos. Roles configurados: {', '.join(roles_configurados)}",
+            ephemeral=True
+        )
+        return
+    
+    async def procesar(entrada):
+        usuario_id, _ = entrada
+        usuario = await obtener_miembro(interaction.guild, usuario_id)
+        mensaje = await aplicar_despido(usuario, roles_a_asignar)
+        await enviar_mensaje_despido(interaction.guild, usuario, motivo, interaction.user, clave=f"{interaction.id}:{usuario_id}")
+        return mensaje
+    
+    await masivo.ejecutar(interaction, "despido-masivo", etiquetas_miembros(interaction.guild, entradas), procesar, concurrencia=CONCURRENCIA_MASIVA)
+
 # Ejecutar el bot
 if __name__ == "__main__":
     token = os.getenv('DISCORD_TOKEN')
+    bitacora.configurar()
     if not token:
-        print("❌ Error: No se encontró el token de Discord en las variables de entorno")
+        log.critical("No se encontró el token de Discord en las variables de entorno")
+        bitacora.detener()
         exit(1)
     
-    print("🚀 Iniciando bot de Discord...")
-    bot.run(token) 
\ No newline at end of file
+    if os.getenv('GRABAR_EVENTOS'):
+        # Graba los eventos del gateway para repetirlos después con repeticion.py
+        grabador = grabacion.GrabadorEventos(
+            os.getenv('GRABAR_EVENTOS'), anonimizar=os.getenv('GRABAR_ANONIMIZAR', '1') != '0', sal=os.getenv('GRABAR_SAL'),
+        )
+        grabador.instalar(bot)
+
+    log.info("Iniciando bot de Discord (modo %s)", MODO_PROCESO)
+    # El logging ya está configurado: discord.py no debe añadir su propio handler
+    bot.run(token, log_handler=None) 
\ No newline at end of file
@@ -0,0 +1,172 @@
+import asyncio
+import io
+import logging
+import time
+
+import discord
+
+import metricas
+import mutaciones
+import tuberia
+
+log = logging.getLogger(__name__)
+
+# Límite orientativo de ediciones de miembros por servidor (peticiones, segundos)
+LIMITE_EDICIONES = (10, 10.0)
+# Intervalo mínimo entre ediciones del mensaje de progreso
+INTERVALO_PROGRESO = 2.0
+
+ICONOS = {
+    'ok': '✅',
+    'rechazado': '⚠️',
+    'error': '❌',
+}
+
+
+class LimitadorTasa:
+    """Cubo de fichas: como mucho ``cantidad`` operaciones cada ``periodo`` segundos"""
+
+    def __init__(self, cantidad, periodo):
+        self.capacidad = cantidad
+        self.fichas = float(cantidad)
+        self.ritmo = cantidad / periodo
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultimo) * self.ritmo)
+                self._ultimo = ahora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                await asyncio.sleep((1 - self.fichas) / self.ritmo)
+
+
+# Un limitador por servidor: las ediciones de miembros comparten bucket por servidor
+_limitadores = {}
+
+
+def limitador_guild(guild_id):
+    limitador = _limitadores.get(guild_id)
+    if limitador is None:
+        limitador = _limitadores[guild_id] = LimitadorTasa(*LIMITE_EDICIONES)
+    return limitador
+
+
+class Lote:
+    """Estado de un comando masivo: un resultado por elemento"""
+
+    def __init__(self, comando, elementos):
+        self.comando = comando
+        self.elementos = elementos
+        self.resultados = [None] * len(elementos)  # (etiqueta, estado, mensaje)
+
+    @property
+    def completados(self):
+        return sum(1 for resultado in self.resultados if resultado is not None)
+
+    def progreso(self):
+        total = len(self.elementos)
+        hechos = self.completados
+        llenos = round(20 * hechos / total) if total else 20
+        return f"⏳ /{self.comando}: {hechos}/{total} `{'█' * llenos}{'░' * (20 - llenos)}`"
+
+    def tabla(self):
+        """Tabla de resultados en texto plano"""
+        filas = [(etiqueta, estado, mensaje) for etiqueta, estado, mensaje in self.resultados]
+        ancho = max([len(etiqueta) for etiqueta, _, _ in filas] + [7])
+        lineas = [f"{'Miembro'.ljust(ancho)}  Estado     Detalle"]
+        for etiqueta, estado, mensaje in filas:
+            lineas.append(f"{etiqueta.ljust(ancho)}  {estado.ljust(9)}  {mensaje}")
+        return '\n'.join(lineas)
+
+    def resumen(self):
+        recuento = {}
+        for _, estado, _ in self.resultados:
+            recuento[estado] = recuento.get(estado, 0) + 1
+        partes = ' · '.join(f"{ICONOS[estado]} {estado}: {total}" for estado, total in recuento.items())
+        return f"📋 /{self.comando} terminado ({len(self.elementos)} miembros) — {partes}"
+
+
+async def ejecutar(interaction, comando, elementos, procesar, concurrencia=3, limitador=None):
+    """Procesa un lote de elementos en segundo plano con concurrencia acotada.
+
+    ``elementos`` es una lista de (etiqueta, dato) y ``procesar(dato)`` es una
+    corrutina que devuelve el mensaje de resultado o lanza ``ErrorComando``.
+    El progreso se muestra editando la respuesta diferida y al final se
+    sustituye por el resumen y la tabla de resultados por miembro.
+    """
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    metricas.en_segundo_plano(interaction)
+    if limitador is None:
+        limitador = limitador_guild(interaction.guild_id)
+    lote = Lote(comando, elementos)
+    task = asyncio.create_task(_procesar_lote(interaction, lote, procesar, concurrencia, limitador), name=f'masivo:{comando}')
+    tuberia.trabajos_activos.add(task)
+    task.add_done_callback(tuberia.trabajos_activos.discard)
+    return lote
+
+
+async def _procesar_lote(interaction, lote, procesar, concurrencia, limitador):
+    mutaciones.marcar_lote()
+    semaforo = asyncio.Semaphore(concurrencia)
+    cambios = asyncio.Event()
+    inicio = time.perf_counter()
+
+    async def procesar_elemento(posicion, etiqueta, dato):
+        async with semaforo:
+            await limitador.adquirir()
+            try:
+                resultado = (etiqueta, 'ok', await procesar(dato))
+            except tuberia.ErrorComando as e:
+                resultado = (etiqueta, 'rechazado', str(e))
+            except discord.Forbidden:
+                resultado = (etiqueta, 'error', "Sin permisos")
+            except Exception as e:
+                resultado = (etiqueta, 'error', str(e))
+            lote.resultados[posicion] = resultado
+            cambios.set()
+
+    async def informar_progreso():
+        while True:
+            await cambios.wait()
+            cambios.clear()
+            try:
+                await interaction.edit_original_response(content=lote.progreso())
+            except discord.HTTPException:
+                pass
+            await asyncio.sleep(INTERVALO_PROGRESO)
+
+    informador = asyncio.create_task(informar_progreso())
+    try:
+        await asyncio.gather(*(
+            procesar_elemento(posicion, etiqueta, dato)
+            for posicion, (etiqueta, dato) in enumerate(lote.elementos)
+        ))
+    finally:
+        informador.cancel()
+
+    tabla = lote.tabla()
+    contenido = f"{lote.resumen()}\n```\n{tabla}\n```"
+    adjuntos = []
+    if len(contenido) > 2000:
+        # La tabla no cabe en un mensaje: se adjunta como archivo
+        contenido = lote.resumen()
+        adjuntos = [discord.File(io.BytesIO(tabla.encode('utf-8')), filename=f"{lote.comando}.txt")]
+    try:
+        await interaction.edit_original_response(content=contenido, attachments=adjuntos)
+    except discord.HTTPException as e:
+        log.error("Error al editar la respuesta de /%s: %s", lote.comando, e, extra={'comando': lote.comando, 'guild': interaction.guild_id})
+
+    latencia = (time.perf_counter() - inicio) * 1000
+    metricas.trabajo(lote.comando, 'lote', latencia / 1000)
+    # El lote cuenta como error si falló algún miembro (los rechazados no son errores)
+    fallido = any(estado == 'error' for _, estado, _ in lote.resultados)
+    metricas.comando(lote.comando, 'slash', interaction.created_at, 'error' if fallido else 'ok')
+    log.info(
+        "/%s: %d miembros en %.0fms", lote.comando, len(lote.elementos), latencia,
+        extra={'comando': lote.comando, 'guild': interaction.guild_id, 'miembro': interaction.user.id, 'latencia_ms': round(latencia)},
+    )
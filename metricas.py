@@ -0,0 +1,321 @@
+import bisect
+import logging
+import re
+import time
+
+import aiohttp
+import discord
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# IDs numéricos y tokens de interacción en las URLs de la API, para agrupar por ruta
+_ID_EN_RUTA = re.compile(r'/\d{15,}')
+_TOKEN_EN_RUTA = re.compile(r'(/(?:interactions|webhooks)/[^/]+)/[^/]+')
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ''
+    pares = ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores))
+    return '{' + pares + '}'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+
+    def inc(self, *valores, cantidad=1):
+        self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} counter']
+        for valores, total in sorted(self._valores.items()):
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}')
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # valores -> [cubos..., desbordados, suma, cuenta]
+
+    def observar(self, valor, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [0] * (len(self.limites) + 3)
+        # Por encima del último límite cae en el cubo de desbordados (solo cuenta para +Inf)
+        serie[bisect.bisect_left(self.limites, valor)] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        nombres = self.etiquetas + ('le',)
+        for valores, serie in sorted(self._series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites, serie):
+                acumulado += cantidad
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(nombres, valores + (limite,))} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{_etiquetas(nombres, valores + ("+Inf",))} {serie[-1]}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {serie[-2]:.6f}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {serie[-1]}')
+        return lineas
+
+
+class Indicador:
+    """Valor que se lee en el momento de exponer las métricas.
+
+    Con ``etiquetas``, ``leer()`` devuelve un diccionario {valores: valor}.
+    """
+
+    def __init__(self, nombre, ayuda, leer, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.leer = leer
+        self.etiquetas = tuple(etiquetas)
+
+    def exponer(self):
+        try:
+            valores = self.leer() if self.etiquetas else {(): self.leer()}
+        except Exception:
+            return []
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} gauge']
+        for etiquetas, valor in sorted(valores.items()):
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}')
+        return lineas
+
+
+_metricas = []
+
+
+def _registrar(metrica):
+    _metricas.append(metrica)
+    return metrica
+
+
+comandos = _registrar(Contador(
+    'bot_comandos_total', 'Comandos ejecutados por resultado', ('comando', 'tipo', 'resultado', 'error')
+))
+duracion_comandos = _registrar(Histograma(
+    'bot_comando_duracion_segundos', 'Tiempo desde que se crea la interacción o el mensaje hasta que termina el comando', ('comando', 'tipo')
+))
+duracion_trabajos = _registrar(Histograma(
+    'bot_trabajo_duracion_segundos', 'Duración de los trabajos en segundo plano de los comandos', ('comando', 'estado')
+))
+duplicados = _registrar(Contador(
+    'bot_comandos_duplicados_total', 'Comandos repetidos que no se ejecutaron de nuevo', ('comando', 'original')
+))
+peticiones_rest = _registrar(Contador(
+    'bot_rest_peticiones_total', 'Peticiones a la API REST de Discord', ('metodo', 'ruta', 'estado')
+))
+duracion_rest = _registrar(Histograma(
+    'bot_rest_duracion_segundos', 'Duración de las peticiones a la API REST de Discord', ('metodo', 'ruta')
+))
+limites_rest = _registrar(Contador(
+    'bot_rest_429_total', 'Respuestas 429 (rate limit) de la API REST de Discord', ('metodo', 'ruta')
+))
+
+
+def indicador(nombre, ayuda, leer, etiquetas=()):
+    """Registra un indicador cuyo valor se obtiene con ``leer()`` al exponer"""
+    return _registrar(Indicador(nombre, ayuda, leer, etiquetas))
+
+
+def histograma(nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+    """Registra un histograma nuevo"""
+    return _registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+
+def exponer():
+    """Texto en formato de exposición de Prometheus"""
+    lineas = []
+    for metrica in _metricas:
+        lineas.extend(metrica.exponer())
+    return '\n'.join(lineas) + '\n'
+
+
+# --- Comandos ---
+
+def _tipo_error(error):
+    original = getattr(error, 'original', None)
+    return type(original or error).__name__
+
+
+def comando(nombre, tipo, creado, resultado='ok', error=''):
+    """Registra el resultado de un comando y su duración desde ``creado``"""
+    duracion = (discord.utils.utcnow() - creado).total_seconds()
+    duracion_comandos.observar(max(duracion, 0.0), nombre, tipo)
+    comandos.inc(nombre, tipo, resultado, error)
+
+
+def _registrar_comando(nombre, tipo, creado, error=None):
+    if error is None:
+        comando(nombre, tipo, creado)
+    else:
+        comando(nombre, tipo, creado, 'error', _tipo_error(error))
+
+
+def en_segundo_plano(interaction):
+    """Marca un comando slash cuyo resultado se registra al terminar su trabajo en segundo plano.
+
+    El evento de fin de comando llega en cuanto se difiere la respuesta, así
+    que para estos comandos lo registra quien ejecuta el trabajo, con
+    :func:`comando`.
+    """
+    interaction.extras['metricas_en_segundo_plano'] = True
+
+
+def fallo(origen, error):
+    """Registra como fallido un comando que ya ha respondido al error por su cuenta.
+
+    Si el comando captura la excepción, discord.py lanza el evento de fin de
+    comando y no el de error, así que se registraría como correcto.
+    ``origen`` es el ``Context`` de un comando de prefijo o la interacción de
+    uno slash.
+    """
+    if isinstance(origen, discord.Interaction):
+        origen.extras['metricas_registrado'] = True
+        nombre = origen.command.qualified_name if origen.command else 'desconocido'
+        _registrar_comando(nombre, 'slash', origen.created_at, error)
+    else:
+        origen.metricas_registrado = True
+        _registrar_comando(origen.command.qualified_name, 'prefijo', origen.message.created_at, error)
+
+
+def registrar(bot):
+    """Mide todos los comandos slash y de prefijo del bot.
+
+    Se usan los eventos de fin de comando y los manejadores de error del
+    árbol y del bot, así que no hace falta tocar cada comando. La duración
+    se mide desde la creación de la interacción o del mensaje. Los comandos
+    marcados con :func:`en_segundo_plano` se registran al terminar su trabajo,
+    y los que responden a sus propios errores, con :func:`fallo`.
+    """
+    @bot.listen('on_app_command_completion')
+    async def metricas_comando_slash(interaction, command):
+        if interaction.extras.get('metricas_en_segundo_plano') or interaction.extras.get('metricas_registrado'):
+            return
+        _registrar_comando(command.qualified_name, 'slash', interaction.created_at)
+
+    @bot.listen('on_command_completion')
+    async def metricas_comando_prefijo(ctx):
+        if getattr(ctx, 'metricas_registrado', False):
+            return
+        _registrar_comando(ctx.command.qualified_name, 'prefijo', ctx.message.created_at)
+
+    @bot.listen('on_command_error')
+    async def metricas_error_prefijo(ctx, error):
+        nombre = ctx.command.qualified_name if ctx.command else 'desconocido'
+        _registrar_comando(nombre, 'prefijo', ctx.message.created_at, error)
+
+    on_error_anterior = bot.tree.on_error
+
+    async def on_error(interaction, error):
+        nombre = interaction.command.qualified_name if interaction.command else 'desconocido'
+        _registrar_comando(nombre, 'slash', interaction.created_at, error)
+        await on_error_anterior(interaction, error)
+
+    bot.tree.on_error = on_error
+
+
+def trabajo(comando, estado, segundos):
+    """Registra la duración de un trabajo en segundo plano"""
+    duracion_trabajos.observar(segundos, comando, estado)
+
+
+def duplicado(comando, original):
+    """Registra un comando repetido; ``original`` es 'en_curso' o 'terminado'"""
+    duplicados.inc(comando, original)
+
+
+# --- Cliente HTTP ---
+
+def ruta_de(url):
+    """Ruta de la API sin IDs ni tokens: /api/v10/channels/123/messages -> /channels/:id/messages"""
+    ruta = url.path
+    if ruta.startswith('/api/v'):
+        ruta = ruta.split('/', 3)[-1]
+        ruta = '/' + ruta
+    ruta = _TOKEN_EN_RUTA.sub(r'\1/:token', ruta)
+    return _ID_EN_RUTA.sub('/:id', ruta)
+
+
+def traza_http():
+    """TraceConfig de aiohttp para pasar a ``commands.Bot(http_trace=...)``.
+
+    Cuenta cada petición real a la API (incluidos los reintentos tras un
+    429 que discord.py hace por su cuenta), por método, ruta y estado.
+    """
+    traza = aiohttp.TraceConfig()
+
+    async def al_empezar(sesion, contexto, params):
+        contexto.inicio = time.perf_counter()
+
+    async def al_terminar(sesion, contexto, params):
+        ruta = ruta_de(params.url)
+        estado = params.response.status
+        peticiones_rest.inc(params.method, ruta, str(estado))
+        duracion_rest.observar(time.perf_counter() - contexto.inicio, params.method, ruta)
+        if estado == 429:
+            limites_rest.inc(params.method, ruta)
+
+    async def al_fallar(sesion, contexto, params):
+        peticiones_rest.inc(params.method, ruta_de(params.url), type(params.exception).__name__)
+
+    traza.on_request_start.append(al_empezar)
+    traza.on_request_end.append(al_terminar)
+    traza.on_request_exception.append(al_fallar)
+    return traza
+
+
+# --- Servidor HTTP ---
+
+class ServidorMetricas:
+    """Servidor HTTP local con ``/metrics`` (formato Prometheus) y ``/healthz``"""
+
+    def __init__(self, salud, puerto, host='0.0.0.0'):
+        self.salud = salud
+        self.puerto = puerto
+        self.host = host
+        self._runner = None
+
+    @property
+    def activo(self):
+        return self._runner is not None
+
+    async def _metricas(self, request):
+        return web.Response(text=exponer(), content_type='text/plain', charset='utf-8')
+
+    async def _healthz(self, request):
+        ok, detalle = self.salud()
+        return web.json_response(detalle, status=200 if ok else 503)
+
+    async def iniciar(self):
+        if self.activo:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._metricas)
+        app.router.add_get('/healthz', self._healthz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.puerto).start()
+        log.info('Métricas disponibles en http://%s:%d/metrics', self.host, self.puerto)
+
+    async def detener(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
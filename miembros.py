@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+from discord.ext import commands
+
+log = logging.getLogger(__name__)
+
+# Estrategias del intent de miembros
+SIN_INTENT = 'no'       # Sin intent: solo la caché con TTL y consultas por lotes
+PEREZOSO = 'perezoso'   # Intent activo; los miembros se cachean según llegan eventos
+INICIO = 'inicio'       # Intent activo y descarga completa de miembros al conectar
+DEMANDA = 'demanda'     # Intent activo; cada servidor se descarga la primera vez que se consulta
+
+# Máximo de IDs por consulta al gateway (límite de Discord)
+LOTE_MAXIMO = 100
+# Tiempo que se espera para juntar consultas en un mismo lote
+ESPERA_LOTE = 0.05
+# Antigüedad máxima (s) de un miembro de la caché sobre el que se calcula una edición:
+# el PATCH sustituye la lista entera de roles, y sin el intent nada avisa de los cambios de otros
+FRESCURA_EDICION = 5.0
+
+
+class CacheMiembros:
+    """Caché de miembros con tamaño máximo (LRU) y caducidad.
+
+    Con el intent de miembros, la caché de discord.py se mantiene al día por
+    el gateway y se usa directamente. Sin él, los miembros se guardan aquí
+    durante ``ttl`` segundos. Los fallos se agrupan por servidor: las
+    consultas que llegan en la misma ventana se resuelven con una sola
+    petición al gateway de hasta 100 IDs, y dos consultas del mismo miembro
+    comparten la misma petición. Quien vaya a editar el miembro pide con
+    ``max_antiguedad`` una copia reciente: sin el intent la caché no se
+    entera de los roles que cambian otros moderadores o bots.
+    """
+
+    def __init__(self, tamano=5000, ttl=300.0, estrategia=SIN_INTENT):
+        self.tamano = tamano
+        self.ttl = ttl
+        self.estrategia = estrategia
+        self._entradas = OrderedDict()  # (guild_id, miembro_id) -> (miembro, caduca, guardado)
+        self._en_vuelo = {}             # (guild_id, miembro_id) -> futuro
+        self._lotes = {}                # guild_id -> lista de IDs pendientes
+        self._descargando = set()       # guild_id con descarga (chunk) en curso
+        self._tareas = set()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @property
+    def intent_miembros(self):
+        return self.estrategia != SIN_INTENT
+
+    # --- Caché ---
+
+    def guardar(self, miembro):
+        clave = (miembro.guild.id, miembro.id)
+        ahora = time.monotonic()
+        self._entradas[clave] = (miembro, ahora + self.ttl, ahora)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.tamano:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, guild_id, miembro_id):
+        self._entradas.pop((guild_id, miembro_id), None)
+
+    def _leer(self, clave, max_antiguedad=None):
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        miembro, caduca, guardado = entrada
+        ahora = time.monotonic()
+        if caduca <= ahora:
+            del self._entradas[clave]
+            return None
+        if max_antiguedad is not None and ahora - guardado > max_antiguedad:
+            # Se vuelve a pedir; la respuesta sustituye a esta entrada
+            return None
+        self._entradas.move_to_end(clave)
+        return miembro
+
+    # --- Consulta ---
+
+    async def obtener(self, guild, miembro_id, max_antiguedad=None):
+        """Devuelve el miembro o None si no está en el servidor.
+
+        Con ``max_antiguedad`` (segundos), una entrada de la caché más antigua
+        se trata como un fallo y se vuelve a pedir (en el mismo lote que las
+        demás). Con el intent, la caché de discord.py ya está al día.
+        """
+        if self.intent_miembros:
+            miembro = guild.get_member(miembro_id)
+            if miembro is not None:
+                self.aciertos += 1
+                return miembro
+            if self.estrategia == DEMANDA:
+                self._descargar(guild)
+
+        clave = (guild.id, miembro_id)
+        miembro = self._leer(clave, max_antiguedad)
+        if miembro is not None:
+            self.aciertos += 1
+            return miembro
+        self.fallos += 1
+
+        futuro = self._en_vuelo.get(clave)
+        if futuro is None:
+            futuro = self._en_vuelo[clave] = asyncio.get_running_loop().create_future()
+            self._encolar(guild, miembro_id)
+        return await asyncio.shield(futuro)
+
+    def _encolar(self, guild, miembro_id):
+        lote = self._lotes.get(guild.id)
+        if lote is None:
+            lote = self._lotes[guild.id] = []
+            asyncio.get_running_loop().call_later(ESPERA_LOTE, self._cerrar_lote, guild)
+        lote.append(miembro_id)
+        if len(lote) >= LOTE_MAXIMO:
+            self._cerrar_lote(guild)
+
+    def _cerrar_lote(self, guild):
+        ids = self._lotes.pop(guild.id, None)
+        if ids:
+            self._lanzar(self._consultar(guild, ids))
+
+    def _lanzar(self, corrutina):
+        tarea = asyncio.create_task(corrutina)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def _consultar(self, guild, ids):
+        try:
+            encontrados = await self._pedir(guild, ids)
+        except Exception as e:
+            for miembro_id in ids:
+                futuro = self._en_vuelo.pop((guild.id, miembro_id), None)
+                if futuro is not None and not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        for miembro_id in ids:
+            miembro = encontrados.get(miembro_id)
+            if miembro is not None:
+                self.guardar(miembro)
+            futuro = self._en_vuelo.pop((guild.id, miembro_id), None)
+            if futuro is not None and not futuro.done():
+                futuro.set_result(miembro)
+
+    async def _pedir(self, guild, ids):
+        """{id: miembro} de los IDs que siguen en el servidor"""
+        try:
+            miembros = await guild.query_members(user_ids=ids, limit=len(ids), cache=self.intent_miembros)
+            return {miembro.id: miembro for miembro in miembros}
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            # El gateway no responde o está limitado: se consulta por la API
+            log.warning("Consulta de %d miembros por el gateway fallida (%s), se usa la API", len(ids), e, extra={'guild': guild.id})
+        resultados = await asyncio.gather(*(guild.fetch_member(miembro_id) for miembro_id in ids), return_exceptions=True)
+        for resultado in resultados:
+            if isinstance(resultado, Exception) and not isinstance(resultado, discord.NotFound):
+                raise resultado
+        return {miembro.id: miembro for miembro in resultados if isinstance(miembro, discord.Member)}
+
+    def _descargar(self, guild):
+        """Descarga en segundo plano todos los miembros del servidor (una sola vez)"""
+        if guild.chunked or guild.id in self._descargando:
+            return
+        self._descargando.add(guild.id)
+
+        async def descargar():
+            try:
+                await guild.chunk(cache=True)
+                log.info("Miembros de %s descargados (%d)", guild.name, guild.member_count or 0, extra={'guild': guild.id})
+            finally:
+                self._descargando.discard(guild.id)
+
+        self._lanzar(descargar())
+
+
+_cache = CacheMiembros()
+
+
+def configurar(tamano, ttl, estrategia):
+    global _cache
+    _cache = CacheMiembros(tamano, ttl, estrategia)
+    return _cache
+
+
+def cache():
+    return _cache
+
+
+async def obtener(guild, miembro_id, max_antiguedad=None):
+    return await _cache.obtener(guild, miembro_id, max_antiguedad)
+
+
+async def obtener_para_editar(guild, miembro_id):
+    """Miembro lo bastante reciente para calcular sobre él un PATCH de roles (ver ``FRESCURA_EDICION``)"""
+    return await _cache.obtener(guild, miembro_id, FRESCURA_EDICION)
+
+
+def aplicar_intents(intents, estrategia):
+    """Activa el intent de miembros si la estrategia lo necesita"""
+    intents.members = estrategia != SIN_INTENT
+    return intents
+
+
+class ConversorMiembro(commands.MemberConverter):
+    """``discord.Member`` para comandos de prefijo que, si no está en caché, usa la caché con lotes.
+
+    Los comandos de prefijo editan el miembro, así que se pide una copia reciente.
+    """
+
+    async def query_member_by_id(self, bot, guild, user_id):
+        return await obtener_para_editar(guild, user_id)
+
+
+def registrar(bot):
+    """Mantiene la caché al día con los eventos de miembros"""
+
+    @bot.listen('on_member_update')
+    async def cache_miembro_actualizado(antes, despues):
+        if (despues.guild.id, despues.id) in _cache._entradas:
+            _cache.guardar(despues)
+
+    @bot.listen('on_raw_member_remove')
+    async def cache_miembro_eliminado(payload):
+        _cache.invalidar(payload.guild_id, payload.user.id)
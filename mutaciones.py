@@ -0,0 +1,131 @@
+import contextvars
+
+import miembros
+import tuberia
+
+_SIN_CAMBIO = object()
+
+# En el modo gateway, las ediciones de los comandos masivos las hace un proceso de trabajos:
+# ejecutor(miembro, cambios, reason) y la marca de que la tarea actual procesa un lote
+_ejecutor_remoto = None
+_en_lote = contextvars.ContextVar('en_lote', default=False)
+
+
+def delegar(ejecutor):
+    """Delega las ediciones de los lotes en ``ejecutor`` (None: se aplican en este proceso)"""
+    global _ejecutor_remoto
+    _ejecutor_remoto = ejecutor
+
+
+def marcar_lote():
+    """Marca la tarea actual (y las que cree) como procesamiento de un lote"""
+    _en_lote.set(True)
+
+
+class PlanMiembro:
+    """Cambios pendientes de roles y apodo sobre un miembro.
+
+    Se acumula el conjunto final de roles y el apodo deseado y se aplican
+    en una sola llamada ``Member.edit(roles=..., nick=...)`` (un único PATCH)
+    en lugar de un ``add_roles``/``remove_roles``/``edit`` por cada cambio.
+    Si el resultado coincide con el estado actual no se hace ninguna llamada.
+    Como el PATCH sustituye la lista entera de roles, ``miembro`` tiene que
+    estar al día: el de la interacción, el de la caché de discord.py con el
+    intent de miembros o uno de ``miembros.obtener_para_editar``.
+    """
+
+    def __init__(self, miembro):
+        self.miembro = miembro
+        self._roles_actuales = {rol.id: rol for rol in miembro.roles if not rol.is_default()}
+        self._roles = dict(self._roles_actuales)
+        self._nick = _SIN_CAMBIO
+        self._apodo_opcional = False
+        self.avisos = []
+
+    # --- Roles ---
+
+    def agregar(self, *roles):
+        for rol in roles:
+            self._roles[rol.id] = rol
+        return self
+
+    def quitar(self, *roles):
+        for rol in roles:
+            self._roles.pop(rol.id, None)
+        return self
+
+    def quitar_todos(self):
+        """Quita todos los roles que el bot puede gestionar (los gestionados por integraciones y los superiores al bot se conservan)"""
+        me = self.miembro.guild.me
+        for rol_id, rol in list(self._roles.items()):
+            if not rol.managed and rol < me.top_role:
+                del self._roles[rol_id]
+        return self
+
+    @property
+    def roles_agregados(self):
+        return [rol for rol_id, rol in self._roles.items() if rol_id not in self._roles_actuales]
+
+    @property
+    def roles_quitados(self):
+        return [rol for rol_id, rol in self._roles_actuales.items() if rol_id not in self._roles]
+
+    # --- Apodo ---
+
+    def apodo(self, nick, opcional=False):
+        """Fija el apodo (``None`` lo elimina); se recorta al límite de 32 caracteres.
+
+        Si el bot no puede cambiarlo, :meth:`aplicar` lanza ``ErrorComando`` sin
+        hacer ningún cambio; con ``opcional`` aplica el resto y deja un aviso.
+        """
+        self._nick = nick[:32] if nick else None
+        self._apodo_opcional = opcional
+        return self
+
+    @property
+    def cambia_apodo(self):
+        return self._nick is not _SIN_CAMBIO and self._nick != self.miembro.nick
+
+    def _puede_cambiar_apodo(self):
+        guild = self.miembro.guild
+        if self.miembro.id == guild.owner_id:
+            return False
+        return self.miembro.top_role < guild.me.top_role
+
+    # --- Aplicar ---
+
+    @property
+    def sin_cambios(self):
+        return not self.roles_agregados and not self.roles_quitados and not self.cambia_apodo
+
+    async def aplicar(self, reason=None):
+        """Aplica los cambios en un único PATCH; devuelve False si no había nada que cambiar"""
+        cambios = {}
+        if self.roles_agregados or self.roles_quitados:
+            cambios['roles'] = list(self._roles.values())
+        if self.cambia_apodo:
+            if self._puede_cambiar_apodo():
+                cambios['nick'] = self._nick
+            elif self._apodo_opcional:
+                self.avisos.append(f"No puedo cambiar el apodo de {self.miembro.display_name} (su rol es igual o superior al mío)")
+            else:
+                raise tuberia.ErrorComando(
+                    f"❌ No puedo cambiar el apodo de {self.miembro.mention}: es el propietario del servidor o su rol es igual o superior al mío"
+                )
+
+        if not cambios:
+            return False
+
+        if _ejecutor_remoto is not None and _en_lote.get():
+            await _ejecutor_remoto(self.miembro, cambios, reason)
+            # El resultado lo tiene el otro proceso: la próxima consulta pedirá el miembro
+            miembros.cache().invalidar(self.miembro.guild.id, self.miembro.id)
+            return True
+
+        actualizado = await self.miembro.edit(reason=reason, **cambios)
+        # La caché de miembros no recibe eventos sin el intent: se guarda el resultado
+        if actualizado is not None:
+            miembros.cache().guardar(actualizado)
+        else:
+            miembros.cache().invalidar(self.miembro.guild.id, self.miembro.id)
+        return True
@@ -0,0 +1,224 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import time
+
+import almacen
+
+log = logging.getLogger(__name__)
+
+# Estados de un período de prueba
+ACTIVO = 'activo'
+CADUCADO = 'caducado'        # Pasó la fecha y se ejecutó la acción configurada
+REVISION = 'revision'        # Pasó la fecha y queda pendiente de que lo revise un moderador
+FINALIZADO = 'finalizado'    # Terminó antes de tiempo (ascenso, despido o salida del servidor)
+REINICIADO = 'reiniciado'    # Se inició otro período para el mismo miembro
+
+# Si la acción falla, se reintenta pasados estos segundos
+REINTENTO = 300.0
+
+
+class Periodo:
+    """Fila del registro de períodos de prueba"""
+
+    def __init__(self, fila):
+        self.id = fila['id']
+        self.guild_id = fila['guild_id']
+        self.miembro_id = fila['miembro_id']
+        self.usuario_roblox = fila['usuario_roblox']
+        self.iniciado_por = fila['iniciado_por']
+        self.estado = fila['estado']
+        self.inicio = datetime.datetime.fromtimestamp(fila['inicio'], datetime.timezone.utc)
+        self.caduca = datetime.datetime.fromtimestamp(fila['caduca'], datetime.timezone.utc)
+
+
+class RegistroPeriodos:
+    """Registro persistente de los períodos de prueba por servidor y miembro.
+
+    Cada miembro tiene como mucho un período activo (índice único parcial);
+    el índice (servidor, estado, caducidad) sirve los listados de
+    ``/periodos-activos`` ya ordenados y la carga del temporizador al
+    arrancar, sin volver a leer el canal de períodos de prueba.
+    """
+
+    def __init__(self, con=None):
+        self._con = con
+        self._tabla_creada = False
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.executescript(
+                'CREATE TABLE IF NOT EXISTS periodos_prueba ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' clave TEXT UNIQUE,'
+                ' guild_id INTEGER NOT NULL,'
+                ' miembro_id INTEGER NOT NULL,'
+                ' usuario_roblox TEXT,'
+                ' iniciado_por INTEGER,'
+                ' estado TEXT NOT NULL,'
+                ' inicio REAL NOT NULL,'
+                ' caduca REAL NOT NULL,'
+                ' cerrado REAL);'
+                "CREATE UNIQUE INDEX IF NOT EXISTS periodos_prueba_activo ON periodos_prueba (guild_id, miembro_id) WHERE estado = 'activo';"
+                'CREATE INDEX IF NOT EXISTS periodos_prueba_estado ON periodos_prueba (guild_id, estado, caduca);'
+            )
+        return self._con
+
+    def iniciar(self, guild_id, miembro_id, dias, usuario_roblox=None, iniciado_por=None, clave=None, inicio=None):
+        """Empieza el período de prueba de un miembro (y cierra el que tuviera activo).
+
+        Con la misma ``clave`` el período solo se crea una vez. Devuelve el
+        período activo del miembro.
+        """
+        inicio = inicio if inicio is not None else time.time()
+        with almacen.transaccion(self.con):
+            if clave is not None:
+                fila = self.con.execute('SELECT * FROM periodos_prueba WHERE clave = ?', (clave,)).fetchone()
+                if fila is not None:
+                    return Periodo(fila)
+            self.con.execute(
+                'UPDATE periodos_prueba SET estado = ?, cerrado = ? WHERE guild_id = ? AND miembro_id = ? AND estado = ?',
+                (REINICIADO, inicio, guild_id, miembro_id, ACTIVO),
+            )
+            fila = self.con.execute(
+                'INSERT INTO periodos_prueba (clave, guild_id, miembro_id, usuario_roblox, iniciado_por, estado, inicio, caduca)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING *',
+                (clave, guild_id, miembro_id, usuario_roblox, iniciado_por, ACTIVO, inicio, inicio + dias * 86400),
+            ).fetchone()
+        return Periodo(fila)
+
+    def obtener(self, periodo_id):
+        fila = self.con.execute('SELECT * FROM periodos_prueba WHERE id = ?', (periodo_id,)).fetchone()
+        return Periodo(fila) if fila else None
+
+    def activo(self, guild_id, miembro_id):
+        fila = self.con.execute(
+            'SELECT * FROM periodos_prueba WHERE guild_id = ? AND miembro_id = ? AND estado = ?', (guild_id, miembro_id, ACTIVO)
+        ).fetchone()
+        return Periodo(fila) if fila else None
+
+    def listar(self, guild_id, estado=ACTIVO, limite=None):
+        """Períodos de un servidor en un estado, del que caduca antes al que caduca después"""
+        consulta = 'SELECT * FROM periodos_prueba WHERE guild_id = ? AND estado = ? ORDER BY caduca'
+        parametros = (guild_id, estado)
+        if limite:
+            consulta += ' LIMIT ?'
+            parametros += (limite,)
+        return [Periodo(fila) for fila in self.con.execute(consulta, parametros)]
+
+    def contar(self, guild_id, estado=ACTIVO):
+        return self.con.execute('SELECT COUNT(*) FROM periodos_prueba WHERE guild_id = ? AND estado = ?', (guild_id, estado)).fetchone()[0]
+
+    def pendientes(self):
+        """(caducidad, ID) de todos los períodos activos, para el temporizador"""
+        return [(fila['caduca'], fila['id']) for fila in self.con.execute('SELECT id, caduca FROM periodos_prueba WHERE estado = ?', (ACTIVO,))]
+
+    def cerrar(self, periodo_id, estado, desde=ACTIVO):
+        """Cambia el estado de un período si sigue en ``desde``; devuelve False si ya no lo estaba"""
+        cursor = self.con.execute(
+            'UPDATE periodos_prueba SET estado = ?, cerrado = ? WHERE id = ? AND estado = ?', (estado, time.time(), periodo_id, desde)
+        )
+        return cursor.rowcount > 0
+
+    def finalizar(self, guild_id, miembro_id):
+        """Cierra el período activo o en revisión de un miembro; devuelve False si no tenía"""
+        cursor = self.con.execute(
+            'UPDATE periodos_prueba SET estado = ?, cerrado = ? WHERE guild_id = ? AND miembro_id = ? AND estado IN (?, ?)',
+            (FINALIZADO, time.time(), guild_id, miembro_id, ACTIVO, REVISION),
+        )
+        return cursor.rowcount > 0
+
+
+class VigilantePeriodos:
+    """Ejecuta la acción de caducidad de cada período de prueba a su hora.
+
+    Como el planificador, usa un solo temporizador sobre un montículo
+    (min-heap) de caducidades en lugar de una tarea por miembro. Al
+    arrancar carga los períodos activos del registro; los que caducaron con
+    el bot apagado se procesan en ese momento. ``al_caducar(periodo)``
+    devuelve el estado final del período, o None si no le corresponde a
+    este proceso (p. ej. el servidor está en otro nodo del clúster).
+    """
+
+    def __init__(self, registro, al_caducar):
+        self.registro = registro
+        self.al_caducar = al_caducar
+        self._monticulo = []
+        self._despertar = None
+        self._bucle_tarea = None
+        self._en_curso = set()
+        # IDs que se están procesando (un período puede estar dos veces en el montículo)
+        self._procesando = set()
+
+    @property
+    def activo(self):
+        return self._bucle_tarea is not None and not self._bucle_tarea.done()
+
+    def iniciar(self):
+        """Arranca el temporizador (no hace nada si ya está en marcha)"""
+        if self.activo:
+            return
+        self._despertar = asyncio.Event()
+        self._monticulo = self.registro.pendientes()
+        heapq.heapify(self._monticulo)
+        self._bucle_tarea = asyncio.create_task(self._bucle(), name='periodos')
+
+    def detener(self):
+        if self._bucle_tarea is not None:
+            self._bucle_tarea.cancel()
+            self._bucle_tarea = None
+
+    def programar(self, periodo):
+        """Añade un período recién iniciado al temporizador"""
+        heapq.heappush(self._monticulo, (periodo.caduca.timestamp(), periodo.id))
+        if self._despertar is not None:
+            self._despertar.set()
+
+    def proxima(self):
+        """Instante UTC de la próxima caducidad, o None"""
+        return datetime.datetime.fromtimestamp(self._monticulo[0][0], datetime.timezone.utc) if self._monticulo else None
+
+    async def _bucle(self):
+        while True:
+            self._despertar.clear()
+            if not self._monticulo:
+                await self._despertar.wait()
+                continue
+
+            espera = self._monticulo[0][0] - time.time()
+            if espera > 0:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                # Se vuelve a comprobar: puede haber llegado un período que caduca antes
+                continue
+
+            _, periodo_id = heapq.heappop(self._monticulo)
+            task = asyncio.create_task(self._caducar(periodo_id), name=f'periodos:{periodo_id}')
+            self._en_curso.add(task)
+            task.add_done_callback(self._en_curso.discard)
+
+    async def _caducar(self, periodo_id):
+        # Si el período se cerró o se reinició después de programarlo, ya no está activo
+        periodo = self.registro.obtener(periodo_id)
+        if periodo is None or periodo.estado != ACTIVO or periodo_id in self._procesando:
+            return
+        self._procesando.add(periodo_id)
+        try:
+            estado = await self.al_caducar(periodo)
+        except Exception as e:
+            log.exception('Error al procesar la caducidad del período de prueba %s: %s', periodo_id, e, extra={'guild': periodo.guild_id, 'miembro': periodo.miembro_id})
+            heapq.heappush(self._monticulo, (time.time() + REINTENTO, periodo_id))
+            self._despertar.set()
+            return
+        finally:
+            self._procesando.discard(periodo_id)
+        if estado is not None:
+            self.registro.cerrar(periodo_id, estado)
+            log.info('Período de prueba %s caducado (%s)', periodo_id, estado, extra={'guild': periodo.guild_id, 'miembro': periodo.miembro_id})
@@ -0,0 +1,160 @@
+import re
+
+import almacen
+
+# Formato de placa al inicio del nickname: 'ABC-12 | Nombre'
+PATRON_PLACA = re.compile(r"^[A-Z]{3}-?(\d{1,2})\s*\|")
+
+NUMERO_MINIMO = 1
+NUMERO_MAXIMO = 99
+
+
+def numero_de_nick(nickname):
+    """Número de placa (int) de un nickname, o None si no lleva placa válida"""
+    if not nickname:
+        return None
+    match = PATRON_PLACA.match(nickname)
+    if not match:
+        return None
+    numero = int(match.group(1))
+    return numero if NUMERO_MINIMO <= numero <= NUMERO_MAXIMO else None
+
+
+class RegistroPlacas:
+    """Registro de números de placa por servidor.
+
+    Mantiene en memoria los dos sentidos (número -> miembro y miembro ->
+    número) para comprobar colisiones y hacer búsquedas inversas en O(1), y
+    persiste cada cambio en SQLite para no depender de tener a todos los
+    miembros en caché tras un reinicio.
+    """
+
+    def __init__(self, con=None):
+        self._con = con
+        self._titulares = {}  # guild_id -> {numero: miembro_id}
+        self._numeros = {}    # guild_id -> {miembro_id: numero}
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        return self._con
+
+    def cargar(self):
+        """Crea la tabla si no existe y carga el registro guardado"""
+        self.con.execute(
+            'CREATE TABLE IF NOT EXISTS placas ('
+            ' guild_id INTEGER NOT NULL,'
+            ' numero INTEGER NOT NULL,'
+            ' miembro_id INTEGER NOT NULL,'
+            ' PRIMARY KEY (guild_id, numero),'
+            ' UNIQUE (guild_id, miembro_id))'
+        )
+        self._titulares = {}
+        self._numeros = {}
+        for fila in self.con.execute('SELECT guild_id, numero, miembro_id FROM placas'):
+            self._titulares.setdefault(fila['guild_id'], {})[fila['numero']] = fila['miembro_id']
+            self._numeros.setdefault(fila['guild_id'], {})[fila['miembro_id']] = fila['numero']
+
+    # --- Consultas ---
+
+    def titular(self, guild_id, numero):
+        """ID del miembro que tiene la placa, o None"""
+        return self._titulares.get(guild_id, {}).get(numero)
+
+    def numero_de(self, guild_id, miembro_id):
+        """Número de placa del miembro, o None"""
+        return self._numeros.get(guild_id, {}).get(miembro_id)
+
+    def disponible(self, guild_id, numero, miembro_id=None):
+        """Indica si la placa está libre (o ya es del propio miembro)"""
+        titular = self.titular(guild_id, numero)
+        return titular is None or titular == miembro_id
+
+    def libres(self, guild_id):
+        """Números libres en orden ascendente"""
+        ocupados = self._titulares.get(guild_id, {})
+        return [numero for numero in range(NUMERO_MINIMO, NUMERO_MAXIMO + 1) if numero not in ocupados]
+
+    def siguiente_libre(self, guild_id):
+        """Menor número libre, o None si están todos ocupados"""
+        ocupados = self._titulares.get(guild_id, {})
+        for numero in range(NUMERO_MINIMO, NUMERO_MAXIMO + 1):
+            if numero not in ocupados:
+                return numero
+        return None
+
+    # --- Cambios ---
+
+    def asignar(self, guild_id, numero, miembro_id):
+        """Asigna la placa al miembro (liberando la que tuviera); False si es de otro"""
+        if not self.disponible(guild_id, numero, miembro_id):
+            return False
+        anterior = self.numero_de(guild_id, miembro_id)
+        if anterior == numero:
+            return True
+        with almacen.transaccion(self.con):
+            self.con.execute('DELETE FROM placas WHERE guild_id = ? AND miembro_id = ?', (guild_id, miembro_id))
+            self.con.execute(
+                'INSERT INTO placas (guild_id, numero, miembro_id) VALUES (?, ?, ?)',
+                (guild_id, numero, miembro_id),
+            )
+        titulares = self._titulares.setdefault(guild_id, {})
+        if anterior is not None:
+            titulares.pop(anterior, None)
+        titulares[numero] = miembro_id
+        self._numeros.setdefault(guild_id, {})[miembro_id] = numero
+        return True
+
+    def liberar(self, guild_id, miembro_id):
+        """Libera la placa del miembro; devuelve el número liberado o None"""
+        numero = self._numeros.get(guild_id, {}).pop(miembro_id, None)
+        if numero is None:
+            return None
+        self._titulares.get(guild_id, {}).pop(numero, None)
+        self.con.execute('DELETE FROM placas WHERE guild_id = ? AND miembro_id = ?', (guild_id, miembro_id))
+        return numero
+
+    def actualizar_miembro(self, miembro):
+        """Sincroniza la placa de un miembro con su nickname actual.
+
+        Devuelve el ID del otro miembro si el número ya estaba ocupado (colisión), o None.
+        """
+        numero = numero_de_nick(miembro.nick)
+        guild_id = miembro.guild.id
+        if numero is None:
+            self.liberar(guild_id, miembro.id)
+            return None
+        if not self.asignar(guild_id, numero, miembro.id):
+            return self.titular(guild_id, numero)
+        return None
+
+    def sembrar(self, guild_id, placas):
+        """Añade placas conocidas por otra vía (p. ej. el historial de anuncios).
+
+        ``placas`` es una lista de (miembro_id, número) de la más reciente a
+        la más antigua; solo se añaden las de miembros sin placa en el
+        registro y con el número libre. Devuelve cuántas se añadieron.
+        """
+        anadidas = 0
+        for miembro_id, numero in placas:
+            if self.numero_de(guild_id, miembro_id) is None and self.titular(guild_id, numero) is None:
+                self.asignar(guild_id, numero, miembro_id)
+                anadidas += 1
+        return anadidas
+
+    def escanear(self, guild):
+        """Recorre una vez los miembros en caché y actualiza el registro con sus nicknames.
+
+        Devuelve una lista de (miembro, ID del titular) con las placas repetidas encontradas.
+        """
+        numeros = [(miembro, numero_de_nick(miembro.nick)) for miembro in guild.members]
+        # Primero se liberan las placas que ya no coinciden, para no dar falsas colisiones
+        for miembro, numero in numeros:
+            if self.numero_de(guild.id, miembro.id) != numero:
+                self.liberar(guild.id, miembro.id)
+        colisiones = []
+        for miembro, numero in numeros:
+            if numero is not None and not self.asignar(guild.id, numero, miembro.id):
+                colisiones.append((miembro, self.titular(guild.id, numero)))
+        return colisiones
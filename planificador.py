@@ -0,0 +1,212 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+
+import almacen
+
+log = logging.getLogger(__name__)
+
+UTC = datetime.timezone.utc
+
+# Políticas de recuperación para ejecuciones perdidas (bot caído a la hora programada)
+OMITIR = 'omitir'  # Se descarta la ejecución perdida y se espera a la siguiente
+ULTIMA = 'ultima'  # Se ejecuta una vez la última ocurrencia perdida, si no es demasiado antigua
+
+
+def _ahora():
+    return datetime.datetime.now(UTC)
+
+
+class TareaDiaria:
+    """Tarea que se ejecuta todos los días a una hora local de una zona IANA.
+
+    Las ocurrencias se calculan con ``zoneinfo``, así que los cambios de
+    horario de verano/invierno se respetan sin ajustes manuales.
+    """
+
+    def __init__(self, nombre, hora, zona, funcion, recuperar=ULTIMA, tolerancia=datetime.timedelta(hours=6)):
+        self.nombre = nombre
+        self.hora = hora
+        self.zona = zona
+        self.funcion = funcion
+        self.recuperar = recuperar
+        self.tolerancia = tolerancia
+
+    def _ocurrencia(self, dia):
+        return datetime.datetime.combine(dia, self.hora, tzinfo=self.zona).astimezone(UTC)
+
+    def siguiente(self, despues):
+        """Primera ocurrencia (UTC) estrictamente posterior a ``despues``"""
+        dia = despues.astimezone(self.zona).date()
+        ocurrencia = self._ocurrencia(dia)
+        while ocurrencia <= despues:
+            dia += datetime.timedelta(days=1)
+            ocurrencia = self._ocurrencia(dia)
+        return ocurrencia
+
+    def anterior(self, hasta):
+        """Última ocurrencia (UTC) anterior o igual a ``hasta``"""
+        dia = hasta.astimezone(self.zona).date()
+        ocurrencia = self._ocurrencia(dia)
+        while ocurrencia > hasta:
+            dia -= datetime.timedelta(days=1)
+            ocurrencia = self._ocurrencia(dia)
+        return ocurrencia
+
+
+class Planificador:
+    """Planificador de tareas con un único temporizador.
+
+    Mantiene un montículo (min-heap) con la próxima ejecución de cada tarea y
+    una sola corrutina que duerme hasta la más cercana, así que entre tareas
+    el bot no se despierta. La última ocurrencia ejecutada de cada tarea se
+    guarda en SQLite antes de lanzarla, de modo que un reinicio nunca repite
+    una ejecución ya hecha.
+    """
+
+    def __init__(self, con=None):
+        self._con = con
+        self._tabla_creada = False
+        self._tareas = {}
+        self._monticulo = []
+        self._secuencia = itertools.count()
+        self._despertar = None
+        self._bucle_tarea = None
+        self._en_curso = set()
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.execute(
+                'CREATE TABLE IF NOT EXISTS planificador_marcas ('
+                ' tarea TEXT PRIMARY KEY,'
+                ' ultima TEXT NOT NULL)'
+            )
+        return self._con
+
+    @property
+    def activo(self):
+        return self._bucle_tarea is not None and not self._bucle_tarea.done()
+
+    def diaria(self, nombre, hora, zona, recuperar=ULTIMA, tolerancia=datetime.timedelta(hours=6)):
+        """Decorador que registra una corrutina como tarea diaria"""
+        def decorador(funcion):
+            self.agregar(TareaDiaria(nombre, hora, zona, funcion, recuperar, tolerancia))
+            return funcion
+        return decorador
+
+    def agregar(self, tarea):
+        self._tareas[tarea.nombre] = tarea
+        if self.activo:
+            self._programar_inicio(tarea, _ahora())
+
+    def tareas(self):
+        return list(self._tareas.values())
+
+    def ejecutar(self, nombre, ocurrencia):
+        """Lanza ya una ocurrencia sin pasar por las marcas (las lleva quien la ordena, p. ej. el lanzador del clúster)"""
+        tarea = self._tareas.get(nombre)
+        if tarea is None:
+            return False
+        self._lanzar(tarea, ocurrencia)
+        return True
+
+    # --- Marcas persistentes ---
+
+    def ultima_ejecucion(self, nombre):
+        fila = self.con.execute('SELECT ultima FROM planificador_marcas WHERE tarea = ?', (nombre,)).fetchone()
+        return datetime.datetime.fromisoformat(fila['ultima']) if fila else None
+
+    def _reclamar(self, nombre, ocurrencia):
+        """Marca la ocurrencia como ejecutada; devuelve False si ya lo estaba"""
+        cursor = self.con.execute(
+            'INSERT INTO planificador_marcas (tarea, ultima) VALUES (?, ?) '
+            'ON CONFLICT(tarea) DO UPDATE SET ultima = excluded.ultima '
+            'WHERE excluded.ultima > planificador_marcas.ultima',
+            (nombre, ocurrencia.isoformat()),
+        )
+        return cursor.rowcount > 0
+
+    # --- Montículo ---
+
+    def _empujar(self, instante, tarea, ocurrencia):
+        heapq.heappush(self._monticulo, (instante, next(self._secuencia), tarea.nombre, ocurrencia))
+        if self._despertar is not None:
+            self._despertar.set()
+
+    def _programar(self, tarea, ahora):
+        ocurrencia = tarea.siguiente(ahora)
+        self._empujar(ocurrencia, tarea, ocurrencia)
+
+    def _programar_inicio(self, tarea, ahora):
+        """Programa una tarea al arrancar, aplicando la política de recuperación"""
+        ultima = self.ultima_ejecucion(tarea.nombre)
+        previa = tarea.anterior(ahora)
+        perdida = ultima is not None and ultima < previa
+        if perdida and tarea.recuperar == ULTIMA and ahora - previa <= tarea.tolerancia:
+            log.info("Recuperando ejecución perdida de '%s' (%s)", tarea.nombre, f'{previa.astimezone(tarea.zona):%d/%m/%Y %H:%M}', extra={'tarea': tarea.nombre})
+            self._empujar(ahora, tarea, previa)
+        else:
+            self._programar(tarea, ahora)
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        """Arranca el temporizador (no hace nada si ya está en marcha)"""
+        if self.activo:
+            return
+        self._despertar = asyncio.Event()
+        self._monticulo = []
+        ahora = _ahora()
+        for tarea in self._tareas.values():
+            self._programar_inicio(tarea, ahora)
+        self._bucle_tarea = asyncio.create_task(self._bucle(), name='planificador')
+
+    def detener(self):
+        if self._bucle_tarea is not None:
+            self._bucle_tarea.cancel()
+            self._bucle_tarea = None
+
+    def proximas(self):
+        """Devuelve (nombre, instante UTC) de las próximas ejecuciones ordenadas"""
+        return [(nombre, instante) for instante, _, nombre, _ in sorted(self._monticulo)]
+
+    async def _bucle(self):
+        while True:
+            self._despertar.clear()
+            if not self._monticulo:
+                await self._despertar.wait()
+                continue
+
+            espera = (self._monticulo[0][0] - _ahora()).total_seconds()
+            if espera > 0:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                # Se vuelve a comprobar: puede haber llegado una tarea más próxima
+                continue
+
+            _, _, nombre, ocurrencia = heapq.heappop(self._monticulo)
+            tarea = self._tareas.get(nombre)
+            if tarea is None:
+                continue
+            self._programar(tarea, max(ocurrencia, _ahora()))
+            if self._reclamar(nombre, ocurrencia):
+                self._lanzar(tarea, ocurrencia)
+
+    def _lanzar(self, tarea, ocurrencia):
+        task = asyncio.create_task(self._ejecutar(tarea, ocurrencia), name=f'planificador:{tarea.nombre}')
+        self._en_curso.add(task)
+        task.add_done_callback(self._en_curso.discard)
+
+    async def _ejecutar(self, tarea, ocurrencia):
+        try:
+            await tarea.funcion(ocurrencia.astimezone(tarea.zona))
+        except Exception as e:
+            log.exception("Error en la tarea programada '%s': %s", tarea.nombre, e, extra={'tarea': tarea.nombre})
@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+
+import metricas
+
+# Clases de prioridad (menor = antes)
+INTERACCION = 0  # Respuestas a moderadores
+MIEMBROS = 1     # Cambios de roles y apodos
+ANUNCIOS = 2     # Anuncios, difusión y reacciones
+
+NOMBRES = {INTERACCION: 'interaccion', MIEMBROS: 'miembros', ANUNCIOS: 'anuncios'}
+
+# Discord permite unas 50 peticiones por segundo en total; las clases bajas
+# dejan margen para que las altas no lleguen a ser limitadas
+LIMITE_GLOBAL = 50
+CUOTA_POR_SEGUNDO = {INTERACCION: LIMITE_GLOBAL, MIEMBROS: 40, ANUNCIOS: 30}
+# Fichas de cada bucket de ruta que las clases bajas dejan libres
+RESERVA_BUCKET = {INTERACCION: 0, MIEMBROS: 1, ANUNCIOS: 1}
+
+_prioridad_actual = contextvars.ContextVar('prioridad', default=None)
+
+
+@contextlib.contextmanager
+def con_prioridad(clase):
+    """Fija la prioridad de las peticiones que se hagan dentro del bloque"""
+    token = _prioridad_actual.set(clase)
+    try:
+        yield
+    finally:
+        _prioridad_actual.reset(token)
+
+
+def clasificar(route):
+    """Prioridad de una petición según su ruta (si no se ha fijado otra)"""
+    ruta = route.path
+    if ruta.startswith('/interactions') or ruta.startswith('/webhooks'):
+        return INTERACCION
+    if '/members' in ruta or '/roles' in ruta:
+        return MIEMBROS
+    return ANUNCIOS
+
+
+class PlanificadorREST:
+    """Ordena por prioridad las peticiones salientes del cliente HTTP de discord.py.
+
+    Sustituye ``HTTPClient.request`` por una versión que, antes de enviar,
+    espera turno en una cola con prioridad. Cada clase tiene una cuota por
+    segundo menor cuanto más baja es, así que con mucho tráfico de anuncios
+    las respuestas y los cambios de miembros siguen teniendo hueco antes de
+    que Discord aplique el límite global. Además, una petición de clase baja
+    no gasta la última ficha de su bucket de ruta: espera a que se renueve.
+    Expone la profundidad de la cola y el tiempo de espera por clase.
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self._original = None
+        self._cola = []  # (clase, secuencia, futuro)
+        self._secuencia = itertools.count()
+        self._enviadas = deque()  # instantes de las peticiones del último segundo
+        self._despertar = asyncio.Event()
+        self._despachador = None
+        self._espera = metricas.histograma(
+            'bot_rest_espera_segundos', 'Tiempo de espera en la cola de peticiones REST', ('prioridad',)
+        )
+        metricas.indicador(
+            'bot_rest_cola', 'Peticiones REST esperando turno', self.profundidad, ('prioridad',)
+        )
+
+    def instalar(self):
+        if self._original is None:
+            self._original = self.http.request
+            self.http.request = self._request
+
+    def profundidad(self):
+        recuento = {(nombre,): 0 for nombre in NOMBRES.values()}
+        for clase, _, futuro in self._cola:
+            if not futuro.done():
+                recuento[(NOMBRES[clase],)] += 1
+        return recuento
+
+    async def _request(self, route, **kwargs):
+        clase = _prioridad_actual.get()
+        if clase is None:
+            clase = clasificar(route)
+        inicio = time.perf_counter()
+        await self._esperar_bucket(route, clase)
+        await self._turno(clase)
+        self._espera.observar(time.perf_counter() - inicio, NOMBRES[clase])
+        return await self._original(route, **kwargs)
+
+    # --- Buckets por ruta ---
+
+    def _bucket(self, route):
+        """Bucket de discord.py de la ruta, si ya se conoce"""
+        hashes = getattr(self.http, '_bucket_hashes', {})
+        buckets = getattr(self.http, '_buckets', {})
+        bucket_hash = hashes.get(route.key)
+        clave = f'{bucket_hash or route.key}:{route.major_parameters}'
+        return buckets.get(clave)
+
+    async def _esperar_bucket(self, route, clase):
+        reserva = RESERVA_BUCKET[clase]
+        if not reserva:
+            return
+        while True:
+            bucket = self._bucket(route)
+            if bucket is None or bucket.expires is None:
+                return
+            espera = bucket.expires - asyncio.get_running_loop().time()
+            if bucket.remaining > reserva or espera <= 0:
+                return
+            await asyncio.sleep(espera)
+
+    # --- Turnos ---
+
+    async def _turno(self, clase):
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._cola, (clase, next(self._secuencia), futuro))
+        if self._despachador is None or self._despachador.done():
+            self._despachador = asyncio.create_task(self._despachar(), name='prioridad-rest')
+        self._despertar.set()
+        # Si la petición se cancela, el futuro queda cancelado y el despachador lo descarta
+        await futuro
+
+    def _margen(self, clase, ahora):
+        """Segundos hasta que la clase tenga cuota libre (0 si ya la tiene)"""
+        while self._enviadas and ahora - self._enviadas[0] >= 1.0:
+            self._enviadas.popleft()
+        cuota = CUOTA_POR_SEGUNDO[clase]
+        if len(self._enviadas) < cuota:
+            return 0.0
+        return self._enviadas[len(self._enviadas) - cuota] + 1.0 - ahora
+
+    async def _despachar(self):
+        while self._cola:
+            clase, _, futuro = self._cola[0]
+            if futuro.done():
+                heapq.heappop(self._cola)
+                continue
+            ahora = time.monotonic()
+            espera = self._margen(clase, ahora)
+            if espera > 0:
+                # Puede llegar antes una petición de más prioridad
+                self._despertar.clear()
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._cola)
+            self._enviadas.append(ahora)
+            futuro.set_result(None)
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import cProfile
+import datetime
+import itertools
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+import discord
+
+import grabacion
+
+DISCORD_EPOCH = 1420070400000
+# Cada cuántos eventos se toma una muestra de memoria
+MUESTREO_MEMORIA = 500
+# Espera máxima a que terminen las tareas que dejaron los últimos eventos
+ESPERA_FINAL = 30.0
+# Espera tras el último GUILD_CREATE antes de dar el bot por listo (discord.py espera 2 s)
+ESPERA_SERVIDORES = 0.1
+
+
+def _fecha():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class RestSimulado:
+    """Sustituye la capa REST del bot sin salir del proceso.
+
+    Responde a cada ruta con lo mínimo que necesita discord.py para
+    construir el objeto que espera (el usuario, el miembro editado, el
+    mensaje enviado...) y al resto con una respuesta vacía. Así la
+    repetición mide el bot y no la red ni los límites de Discord.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.peticiones = Counter()
+        self._ids = itertools.count(1)
+
+    def nuevo_id(self):
+        return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) + next(self._ids)
+
+    def _usuario(self):
+        if self.bot.user is not None:
+            usuario = self.bot.user
+            return {'id': str(usuario.id), 'username': usuario.name, 'discriminator': '0', 'global_name': None, 'avatar': None, 'bot': True}
+        return {'id': '1', 'username': 'bot', 'discriminator': '0', 'global_name': None, 'avatar': None, 'bot': True}
+
+    @staticmethod
+    def _parametros(route):
+        """Los parámetros de la ruta (``{user_id}``...) sacados de su URL"""
+        patron = re.escape(route.path)
+        patron = re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^/]+)', patron)
+        coincidencia = re.search(patron + '$', route.url.split('?')[0])
+        return coincidencia.groupdict() if coincidencia else {}
+
+    def _miembro(self, guild_id, usuario_id, cambios=None):
+        cambios = cambios or {}
+        guild = self.bot.get_guild(int(guild_id)) if guild_id else None
+        miembro = guild.get_member(int(usuario_id)) if guild else None
+        usuario = {'id': str(usuario_id), 'username': miembro.name if miembro else 'miembro', 'discriminator': '0', 'global_name': None, 'avatar': None}
+        return {
+            'user': usuario,
+            'roles': cambios.get('roles', [str(rol.id) for rol in miembro.roles[1:]] if miembro else []),
+            'nick': cambios.get('nick', miembro.nick if miembro else None),
+            'joined_at': miembro.joined_at.isoformat() if miembro and miembro.joined_at else _fecha(),
+            'deaf': False, 'mute': False, 'flags': 0, 'pending': False, 'avatar': None, 'communication_disabled_until': None,
+        }
+
+    def _mensaje(self, canal_id, datos):
+        return {
+            'id': str(self.nuevo_id()), 'channel_id': str(canal_id or 0), 'author': self._usuario(), 'content': datos.get('content') or '',
+            'timestamp': _fecha(), 'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+            'mention_roles': [], 'attachments': [], 'embeds': datos.get('embeds') or [], 'pinned': False, 'type': 0,
+            'flags': datos.get('flags') or 0, 'components': datos.get('components') or [], 'reactions': [],
+        }
+
+    def responder(self, route, datos):
+        self.peticiones[f'{route.method} {route.path}'] += 1
+        datos = datos if isinstance(datos, dict) else {}
+        if route.path == '/users/@me':
+            return self._usuario()
+        if route.path == '/oauth2/applications/@me':
+            return {
+                'id': '1', 'name': 'bot', 'description': '', 'icon': None, 'bot_public': True, 'bot_require_code_grant': False,
+                'owner': self._usuario(), 'team': None, 'verify_key': '0' * 64, 'flags': 0, 'summary': '', 'rpc_origins': [],
+            }
+        if route.path == '/guilds/{guild_id}/members/{user_id}' and route.method in ('GET', 'PATCH'):
+            return self._miembro(route.guild_id, self._parametros(route).get('user_id'), datos)
+        if route.path.endswith('/messages') and route.method == 'POST':
+            return self._mensaje(route.channel_id, datos)
+        if route.path.startswith('/webhooks/') and route.method in ('POST', 'PATCH', 'GET'):
+            return self._mensaje(route.channel_id, datos)
+        return None
+
+    def instalar(self):
+        async def peticion(route, **kwargs):
+            return self.responder(route, kwargs.get('json'))
+
+        async def peticion_webhook(adaptador, route, session=None, **kwargs):
+            return self.responder(route, kwargs.get('payload'))
+
+        self.bot.http.request = peticion
+        # Las respuestas a interacciones no pasan por bot.http
+        discord.webhook.async_.AsyncWebhookAdapter.request = peticion_webhook
+
+
+class _Medido:
+    """Ejecuta una corrutina sumando el tiempo de CPU de cada uno de sus pasos"""
+
+    def __init__(self, corrutina, al_medir):
+        self.corrutina = corrutina
+        self.al_medir = al_medir
+
+    def __await__(self):
+        pasos = self.corrutina.__await__()
+        valor, excepcion = None, None
+        while True:
+            inicio = time.process_time()
+            try:
+                futuro = pasos.throw(excepcion) if excepcion is not None else pasos.send(valor)
+            except StopIteration as fin:
+                return fin.value
+            finally:
+                self.al_medir(time.process_time() - inicio)
+            try:
+                valor, excepcion = (yield futuro), None
+            except BaseException as error:
+                valor, excepcion = None, error
+
+
+class Medidor:
+    """CPU por tipo de evento y por tarea, y memoria durante la repetición"""
+
+    def __init__(self, memoria=False):
+        self.parseo = defaultdict(float)
+        self.eventos = Counter()
+        self.tareas = defaultdict(float)
+        self.errores = Counter()
+        self.memoria = memoria
+        self.muestras = []
+        self._inicial = None
+
+    @staticmethod
+    def _nombre(corrutina):
+        """Las tareas de discord.py se agrupan por evento; el resto, por corrutina"""
+        marco = getattr(corrutina, 'cr_frame', None)
+        if marco is not None and corrutina.__qualname__ == 'Client._run_event':
+            return f"evento {marco.f_locals.get('event_name')}"
+        return getattr(corrutina, '__qualname__', type(corrutina).__name__)
+
+    def instalar(self, loop):
+        medidor = self
+
+        def fabrica(loop, corrutina, **kwargs):
+            nombre = medidor._nombre(corrutina)
+
+            async def medida():
+                return await _Medido(corrutina, lambda segundos: medidor._sumar(nombre, segundos))
+            return asyncio.Task(medida(), loop=loop, **kwargs)
+
+        loop.set_task_factory(fabrica)
+        if self.memoria:
+            tracemalloc.start(10)
+            self._inicial = tracemalloc.take_snapshot()
+
+    def _sumar(self, nombre, segundos):
+        self.tareas[nombre] += segundos
+
+    def evento(self, evento, segundos):
+        self.eventos[evento] += 1
+        self.parseo[evento] += segundos
+        if self.memoria and sum(self.eventos.values()) % MUESTREO_MEMORIA == 0:
+            self.muestra()
+
+    def muestra(self):
+        actual, pico = tracemalloc.get_traced_memory()
+        self.muestras.append({'eventos': sum(self.eventos.values()), 'actual_kb': actual // 1024, 'pico_kb': pico // 1024})
+
+    def crecimiento(self, limite=15):
+        """Las líneas que más memoria han retenido desde el principio"""
+        if not self.memoria:
+            return []
+        # Lo que reservan el propio perfilador y tracemalloc no es del bot
+        filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__)]
+        final = tracemalloc.take_snapshot().filter_traces(filtros)
+        diferencias = final.compare_to(self._inicial.filter_traces(filtros), 'lineno')
+        return [
+            {'sitio': str(diferencia.traceback), 'kb': round(diferencia.size_diff / 1024, 1), 'bloques': diferencia.count_diff}
+            for diferencia in diferencias[:limite] if diferencia.size_diff > 0
+        ]
+
+
+async def reproducir(args):
+    # El bot se importa con una base de datos vacía y sin sincronizar comandos ni grabar
+    os.environ.update({
+        'DB_PATH': os.path.join(args.directorio_temporal, 'bot.db'),
+        'CONFIG_SERVIDORES': os.path.join(args.directorio_temporal, 'servidores.json'),
+        'SINCRONIZAR_COMANDOS': 'no',
+    })
+    for variable in ('DISCORD_API', 'GRABAR_EVENTOS', 'PUERTO_METRICAS', 'PORT'):
+        os.environ.pop(variable, None)
+    import main
+    bot = main.bot
+
+    medidor = Medidor(memoria=args.memoria)
+    medidor.instalar(asyncio.get_running_loop())
+    rest = RestSimulado(bot)
+    rest.instalar()
+    await bot.login('token-repeticion')
+    bot._connection.guild_ready_timeout = ESPERA_SERVIDORES
+
+    parsers = bot._connection.parsers
+    desconocidos = Counter()
+    perfil = cProfile.Profile() if args.perfil else None
+    inicio_cpu = time.process_time()
+    inicio = time.perf_counter()
+    ultimo = 0
+    esperando_ready = False
+    if perfil:
+        perfil.enable()
+    for milisegundos, evento, datos in grabacion.leer(args.grabacion):
+        ultimo = milisegundos
+        if args.velocidad:
+            espera = milisegundos / 1000 / args.velocidad - (time.perf_counter() - inicio)
+            if espera > 0:
+                await asyncio.sleep(espera)
+        if esperando_ready and evento != 'GUILD_CREATE':
+            # Como en el gateway, el resto de eventos llegan cuando on_ready ya ha preparado el bot
+            await bot.wait_until_ready()
+            await asyncio.sleep(0)
+        esperando_ready = evento == 'READY' or (esperando_ready and evento == 'GUILD_CREATE')
+        parser = parsers.get(evento)
+        if parser is None:
+            desconocidos[evento] += 1
+            continue
+        cpu = time.process_time()
+        bot.dispatch('socket_event_type', evento)
+        try:
+            parser(datos)
+        except Exception as error:
+            medidor.errores[f'{evento}: {type(error).__name__}'] += 1
+        medidor.evento(evento, time.process_time() - cpu)
+        # Deja avanzar las tareas que ha lanzado el evento, como haría el websocket entre mensajes
+        await asyncio.sleep(0)
+
+    # Espera a que terminen los trabajos y los anuncios que dejaron los últimos eventos
+    limite = time.monotonic() + ESPERA_FINAL
+    while (main.tuberia.trabajos_activos or main.buzon.pendientes()) and time.monotonic() < limite:
+        await asyncio.sleep(0.05)
+    if perfil:
+        perfil.disable()
+        perfil.dump_stats(args.perfil)
+    duracion = time.perf_counter() - inicio
+    cpu_total = time.process_time() - inicio_cpu
+    if args.memoria:
+        medidor.muestra()
+    crecimiento = medidor.crecimiento()
+    await bot.close()
+
+    total = sum(medidor.eventos.values())
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'grabacion': args.grabacion,
+        'velocidad': args.velocidad or 'máxima',
+        'eventos': total,
+        'duracion_grabada_s': round(ultimo / 1000, 3),
+        'duracion_s': round(duracion, 3),
+        'eventos_por_segundo': round(total / duracion, 1) if duracion else None,
+        'cpu_s': round(cpu_total, 3),
+        'rss_max_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'parseo': {
+            evento: {'eventos': medidor.eventos[evento], 'cpu_ms': round(segundos * 1000, 2), 'us_por_evento': round(segundos / medidor.eventos[evento] * 1e6, 1)}
+            for evento, segundos in sorted(medidor.parseo.items(), key=lambda par: -par[1])
+        },
+        'tareas_cpu_ms': {nombre: round(segundos * 1000, 2) for nombre, segundos in sorted(medidor.tareas.items(), key=lambda par: -par[1])},
+        'peticiones_rest': dict(rest.peticiones.most_common()),
+        'errores': dict(medidor.errores),
+        'sin_parser': dict(desconocidos),
+        'memoria': medidor.muestras,
+        'crecimiento_memoria': crecimiento,
+    }
+
+
+def resumen(informe, limite=10):
+    lineas = [
+        f"{informe['eventos']} eventos ({informe['duracion_grabada_s']} s grabados) en {informe['duracion_s']} s "
+        f"a velocidad {informe['velocidad']}: {informe['eventos_por_segundo']} eventos/s, {informe['cpu_s']} s de CPU, "
+        f"RSS máximo {informe['rss_max_mb']} MB",
+        '', f"{'evento':<32}{'eventos':>10}{'CPU ms':>12}{'µs/evento':>12}",
+    ]
+    for evento, datos in list(informe['parseo'].items())[:limite]:
+        lineas.append(f"{evento:<32}{datos['eventos']:>10}{datos['cpu_ms']:>12g}{datos['us_por_evento']:>12g}")
+    lineas += ['', f"{'tarea':<60}{'CPU ms':>12}"]
+    for nombre, cpu_ms in list(informe['tareas_cpu_ms'].items())[:limite]:
+        lineas.append(f'{nombre[:59]:<60}{cpu_ms:>12g}')
+    if informe['memoria']:
+        final = informe['memoria'][-1]
+        lineas += ['', f"Memoria trazada al final: {final['actual_kb']} KB (pico {final['pico_kb']} KB)"]
+        for sitio in informe['crecimiento_memoria'][:limite]:
+            lineas.append(f"  +{sitio['kb']} KB en {sitio['bloques']} bloques  {sitio['sitio']}")
+    if informe['errores']:
+        lineas += ['', f"⚠️ Errores al procesar eventos: {informe['errores']}"]
+    return '\n'.join(lineas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Repite una grabación de eventos del gateway contra el bot y mide CPU y memoria')
+    parser.add_argument('grabacion', help='fichero grabado con GRABAR_EVENTOS')
+    parser.add_argument('--velocidad', type=float, default=0, help='1 = tiempo real, 10 = diez veces más rápido; 0 = sin esperas (por defecto)')
+    parser.add_argument('--memoria', action='store_true', help='traza la memoria con tracemalloc (más lento)')
+    parser.add_argument('--perfil', help='guarda un perfil de cProfile en este fichero')
+    parser.add_argument('--salida', help='guarda el informe completo en JSON en este fichero')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        args.directorio_temporal = directorio
+        informe = asyncio.run(reproducir(args))
+
+    print(resumen(informe))
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as fichero:
+            json.dump(informe, fichero, ensure_ascii=False, indent=2)
+        print(f'Informe guardado en {args.salida}', file=sys.stderr)
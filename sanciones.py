@@ -0,0 +1,124 @@
+import datetime
+import time
+
+import almacen
+
+# Prefijo de la clave de las sanciones importadas de los anuncios (lleva el ID del mensaje)
+CLAVE_HISTORIAL = 'historial:'
+
+
+class Sancion:
+    """Fila del registro de sanciones"""
+
+    def __init__(self, fila):
+        self.id = fila['id']
+        self.guild_id = fila['guild_id']
+        self.miembro_id = fila['miembro_id']
+        self.rol_id = fila['rol_id']
+        self.rol_nombre = fila['rol_nombre']
+        self.strikes = fila['strikes']
+        self.razon = fila['razon']
+        self.autorizado_por = fila['autorizado_por']
+        self.ejecutado_por = fila['ejecutado_por']
+        self.creado = datetime.datetime.fromtimestamp(fila['creado'], datetime.timezone.utc)
+        self.caduca = datetime.datetime.fromtimestamp(fila['caduca'], datetime.timezone.utc) if fila['caduca'] else None
+
+    def vigente(self, ahora=None):
+        return self.caduca is None or self.caduca > (ahora or datetime.datetime.now(datetime.timezone.utc))
+
+
+class RegistroSanciones:
+    """Registro persistente de sanciones y strikes por servidor y miembro.
+
+    Cada sanción guarda los strikes que suma y, si hay ventana de caducidad,
+    el instante en que deja de contar. El índice (servidor, miembro, fecha)
+    hace que el total acumulado y el historial de un miembro sean una sola
+    búsqueda por índice, sin depender del historial del canal de sanciones.
+    """
+
+    def __init__(self, con=None, dias_caducidad=0):
+        self._con = con
+        self._tabla_creada = False
+        # 0 = los strikes no caducan
+        self.dias_caducidad = dias_caducidad
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.executescript(
+                'CREATE TABLE IF NOT EXISTS sanciones ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' clave TEXT UNIQUE,'
+                ' guild_id INTEGER NOT NULL,'
+                ' miembro_id INTEGER NOT NULL,'
+                ' rol_id INTEGER,'
+                ' rol_nombre TEXT,'
+                ' strikes INTEGER NOT NULL,'
+                ' razon TEXT,'
+                ' autorizado_por INTEGER,'
+                ' ejecutado_por INTEGER,'
+                ' creado REAL NOT NULL,'
+                ' caduca REAL);'
+                'CREATE INDEX IF NOT EXISTS sanciones_miembro ON sanciones (guild_id, miembro_id, creado);'
+            )
+        return self._con
+
+    def registrar(self, guild_id, miembro_id, rol, strikes, razon, autorizado_por=None, ejecutado_por=None, clave=None, creado=None):
+        """Guarda una sanción y devuelve el total de strikes vigentes del miembro.
+
+        Con la misma ``clave`` la sanción solo se guarda una vez. ``strikes``
+        son los que suma esta sanción; no puede ser negativo.
+        """
+        if strikes < 0:
+            raise ValueError(f'Los strikes de una sanción no pueden ser negativos: {strikes}')
+        creado = creado if creado is not None else time.time()
+        caduca = creado + self.dias_caducidad * 86400 if self.dias_caducidad else None
+        self.con.execute(
+            'INSERT OR IGNORE INTO sanciones'
+            ' (clave, guild_id, miembro_id, rol_id, rol_nombre, strikes, razon, autorizado_por, ejecutado_por, creado, caduca)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                clave,
+                guild_id,
+                miembro_id,
+                getattr(rol, 'id', None),
+                getattr(rol, 'name', rol),
+                strikes,
+                razon,
+                autorizado_por,
+                ejecutado_por,
+                creado,
+                caduca,
+            ),
+        )
+        return self.total(guild_id, miembro_id)
+
+    def inicio(self, guild_id):
+        """Instante de la primera sanción registrada con un comando (no importada), o None"""
+        fila = self.con.execute(
+            'SELECT MIN(creado) FROM sanciones WHERE guild_id = ? AND (clave IS NULL OR clave NOT LIKE ?)',
+            (guild_id, CLAVE_HISTORIAL + '%'),
+        ).fetchone()
+        return fila[0]
+
+    def total(self, guild_id, miembro_id, ahora=None):
+        """Strikes vigentes (no caducados) del miembro"""
+        ahora = ahora if ahora is not None else time.time()
+        fila = self.con.execute(
+            'SELECT COALESCE(SUM(strikes), 0) FROM sanciones'
+            ' WHERE guild_id = ? AND miembro_id = ? AND (caduca IS NULL OR caduca > ?)',
+            (guild_id, miembro_id, ahora),
+        ).fetchone()
+        return fila[0]
+
+    def historial(self, guild_id, miembro_id, limite=None):
+        """Sanciones del miembro, de la más reciente a la más antigua"""
+        consulta = 'SELECT * FROM sanciones WHERE guild_id = ? AND miembro_id = ? ORDER BY creado DESC'
+        parametros = (guild_id, miembro_id)
+        if limite:
+            consulta += ' LIMIT ?'
+            parametros += (limite,)
+        return [Sancion(fila) for fila in self.con.execute(consulta, parametros)]
@@ -0,0 +1,634 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+import discord
+import yarl
+from aiohttp import web, WSMsgType
+
+import configuracion
+
+log = logging.getLogger(__name__)
+
+API = '/api/v10'
+DISCORD_EPOCH = 1420070400000
+INTERVALO_HEARTBEAT = 41250
+
+# Tipos de opción de los comandos de barra
+TEXTO = 3
+ENTERO = 4
+BOOLEANO = 5
+USUARIO = 6
+ROL = 8
+
+# Intents que deciden qué eventos se envían por el gateway
+INTENT_MIEMBROS = 1 << 1
+INTENT_MENSAJES = 1 << 9
+INTENT_REACCIONES = 1 << 10
+
+# Límite de cada ruta (peticiones, segundos); las que no aparecen usan LIMITE_PREDETERMINADO.
+# Son del orden de los que devuelve Discord, que no los documenta
+LIMITES = {
+    ('POST', '/channels/{channel_id}/messages'): (5, 5.0),
+    ('PATCH', '/guilds/{guild_id}/members/{user_id}'): (10, 10.0),
+    ('PUT', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me'): (1, 0.25),
+    ('GET', '/channels/{channel_id}/messages'): (5, 5.0),
+}
+LIMITE_PREDETERMINADO = (50, 1.0)
+# Las respuestas a interacciones no tienen límite por ruta
+SIN_LIMITE = {'/interactions/{interaction_id}/{token}/callback'}
+# Parámetros que separan buckets de la misma ruta (los "major parameters" de Discord)
+PARAMETROS_PRINCIPALES = ('channel_id', 'guild_id', 'webhook_id')
+
+ROL_MODERADOR = "🛡️〴Moderación〴"
+ROL_BOT = "🤖〴Bot〴"
+# Rol de sanción que no está en la configuración, para /sancion
+ROL_SANCION = "📛〴Strike〴"
+
+
+def apuntar(url):
+    """Hace que discord.py use ``url`` en lugar de Discord (API REST y gateway)"""
+    url = url.rstrip('/')
+    discord.http.Route.BASE = f'{url}{API}'
+    gateway = yarl.URL(url).with_path('/gateway')
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = gateway.with_scheme('wss' if gateway.scheme == 'https' else 'ws')
+
+
+def _json(datos, status=200, headers=None):
+    # discord.py solo interpreta la respuesta si el Content-Type es exactamente application/json (sin charset)
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+    return web.Response(body=cuerpo, status=status, headers={**(headers or {}), 'Content-Type': 'application/json'})
+
+
+def _fecha(instante=None):
+    return datetime.datetime.fromtimestamp(instante or time.time(), datetime.timezone.utc).isoformat()
+
+
+class Cubo:
+    """Ventana fija de peticiones de un bucket, como las que anuncian las cabeceras de Discord"""
+
+    def __init__(self, limite, periodo):
+        self.limite = limite
+        self.periodo = periodo
+        self.restantes = limite
+        self.reinicio = time.time() + periodo
+
+    def consumir(self):
+        """(permitida, segundos hasta el reinicio)"""
+        ahora = time.time()
+        if ahora >= self.reinicio:
+            self.restantes = self.limite
+            self.reinicio = ahora + self.periodo
+        if self.restantes <= 0:
+            return False, self.reinicio - ahora
+        self.restantes -= 1
+        return True, self.reinicio - ahora
+
+
+class Interaccion:
+    """Interacción enviada por el gateway, pendiente de su respuesta final"""
+
+    def __init__(self, id, token, nombre):
+        self.id = id
+        self.token = token
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.diferida = False
+        self.terminada = asyncio.get_running_loop().create_future()
+
+    def terminar(self, contenido):
+        if not self.terminada.done():
+            self.terminada.set_result((time.perf_counter() - self.inicio, contenido))
+
+
+class Simulador:
+    """Sustituto local de Discord: gateway por websocket y API REST en un servidor aiohttp.
+
+    Mantiene en memoria servidores, roles, canales, miembros y mensajes, y
+    responde a las rutas que usa el bot con el mismo formato que Discord.
+    Cada respuesta REST lleva las cabeceras ``X-RateLimit-*`` de su bucket
+    y devuelve 429 si se agota, con una latencia configurable. Las
+    interacciones se inyectan con ``interaccion()``, que espera a la
+    respuesta final del bot (la respuesta directa o la edición de la
+    respuesta diferida). Se lleva la cuenta de peticiones por ruta y de 429.
+    """
+
+    def __init__(self, latencia=0.0, variacion=0.0, probabilidad_429=0.0, limites=None):
+        self.latencia = latencia
+        self.variacion = variacion
+        self.probabilidad_429 = probabilidad_429
+        self.limites = {**LIMITES, **(limites or {})}
+        self._ids = itertools.count()
+        self.app_id = self.nuevo_id()
+        self.bot = self._usuario(self.nuevo_id(), 'bot-simulado', bot=True)
+        self.guilds = {}
+        self.mensajes = {}           # canal_id -> {mensaje_id: mensaje}
+        self.comandos = {}           # ámbito -> lista de comandos sincronizados
+        self._cubos = {}
+        self._interacciones = {}     # token -> Interaccion
+        self._conexiones = []        # (websocket, estado de la conexión: secuencia, intents y shard)
+        self.peticiones = Counter()  # 'MÉTODO ruta' -> peticiones
+        self.respuestas_429 = 0
+        self.no_implementadas = Counter()
+        self.url = None
+        self._runner = None
+
+    # --- Datos ---
+
+    def nuevo_id(self):
+        return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(self._ids) & 0x3FFFFF)
+
+    @staticmethod
+    def _usuario(id, nombre, bot=False):
+        return {'id': str(id), 'username': nombre, 'discriminator': '0', 'global_name': nombre, 'avatar': None, 'bot': bot, 'public_flags': 0}
+
+    def _rol(self, nombre, posicion, permisos=0, id=None):
+        return {
+            'id': str(id or self.nuevo_id()), 'name': nombre, 'color': 0, 'hoist': False, 'position': posicion,
+            'permissions': str(permisos), 'managed': False, 'mentionable': False, 'flags': 0,
+        }
+
+    def _miembro(self, usuario, roles=(), nick=None):
+        return {
+            'user': usuario, 'roles': [str(rol) for rol in roles], 'nick': nick, 'joined_at': _fecha(),
+            'deaf': False, 'mute': False, 'flags': 0, 'pending': False, 'avatar': None, 'communication_disabled_until': None,
+        }
+
+    def crear_guild(self, nombre='Servidor simulado', miembros=100):
+        """Servidor con los roles y canales de la configuración predeterminada, un moderador y ``miembros`` miembros"""
+        guild_id = self.nuevo_id()
+        config = configuracion.PREDETERMINADA
+        nombres_roles = dict.fromkeys([
+            *config['roles_periodo_prueba'], *config['roles_despido'], *config['prefijos_placa'], config['rol_personal'], ROL_SANCION,
+        ])
+        roles = [self._rol('@everyone', 0, permisos=discord.Permissions.general().value, id=guild_id)]
+        roles += [self._rol(nombre, posicion) for posicion, nombre in enumerate(nombres_roles, start=1)]
+        rol_moderador = self._rol(ROL_MODERADOR, len(roles), permisos=discord.Permissions.all().value)
+        rol_bot = self._rol(ROL_BOT, len(roles) + 1, permisos=discord.Permissions.all().value)
+        roles += [rol_moderador, rol_bot]
+
+        canales = {}
+        for posicion, nombre in enumerate(nombre for nombre in config['canales'].values() if nombre):
+            canal_id = self.nuevo_id()
+            canales[str(canal_id)] = {
+                'id': str(canal_id), 'type': 0, 'guild_id': str(guild_id), 'name': nombre, 'position': posicion,
+                'permission_overwrites': [], 'nsfw': False, 'parent_id': None, 'topic': None, 'rate_limit_per_user': 0, 'last_message_id': None,
+            }
+            self.mensajes[canal_id] = {}
+
+        moderador = self._miembro(self._usuario(self.nuevo_id(), 'moderador'), roles=[rol_moderador['id']])
+        socios = [self._miembro(self._usuario(self.nuevo_id(), f'miembro{i}')) for i in range(miembros)]
+        guild = {
+            'id': str(guild_id), 'name': nombre, 'owner_id': moderador['user']['id'],
+            'roles': {rol['id']: rol for rol in roles},
+            'channels': canales,
+            'members': {miembro['user']['id']: miembro for miembro in [self._miembro(self.bot, roles=[rol_bot['id']]), moderador, *socios]},
+            'moderador': moderador['user']['id'],
+        }
+        self.guilds[str(guild_id)] = guild
+        return guild
+
+    def rol_por_nombre(self, guild, nombre):
+        return next(rol for rol in guild['roles'].values() if rol['name'] == nombre)
+
+    def socios(self, guild):
+        """IDs de los miembros normales (sin el bot ni el moderador)"""
+        return [int(uid) for uid, miembro in guild['members'].items() if not miembro['user']['bot'] and uid != guild['moderador']]
+
+    def _guild_create(self, guild):
+        return {
+            'id': guild['id'], 'name': guild['name'], 'owner_id': guild['owner_id'], 'unavailable': False,
+            'roles': list(guild['roles'].values()), 'channels': list(guild['channels'].values()),
+            'members': list(guild['members'].values()), 'member_count': len(guild['members']),
+            'large': len(guild['members']) > 250, 'emojis': [], 'stickers': [], 'features': [], 'threads': [],
+            'voice_states': [], 'presences': [], 'stage_instances': [], 'guild_scheduled_events': [],
+            'premium_tier': 0, 'mfa_level': 0, 'verification_level': 0, 'explicit_content_filter': 0,
+            'default_message_notifications': 0, 'preferred_locale': 'es-ES', 'nsfw_level': 0,
+            'joined_at': _fecha(), 'application_id': None, 'system_channel_id': None, 'afk_channel_id': None,
+        }
+
+    # --- Gateway ---
+
+    def _en_shard(self, guild_id, shard, total):
+        return (int(guild_id) >> 22) % total == shard
+
+    async def _enviar_evento(self, ws, estado, tipo, datos):
+        estado['secuencia'] += 1
+        await ws.send_str(json.dumps({'op': 0, 's': estado['secuencia'], 't': tipo, 'd': datos}))
+
+    async def despachar(self, guild_id, tipo, datos, intent=None):
+        """Envía un evento a las conexiones del shard del servidor (que tengan el intent)"""
+        for ws, estado in list(self._conexiones):
+            if intent is not None and not estado['intents'] & intent:
+                continue
+            if guild_id is not None and not self._en_shard(guild_id, *estado['shard']):
+                continue
+            try:
+                await self._enviar_evento(ws, estado, tipo, datos)
+            except ConnectionResetError:
+                pass
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        estado = {'secuencia': 0, 'intents': 0, 'shard': (0, 1)}
+        await ws.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': INTERVALO_HEARTBEAT}}))
+        try:
+            async for mensaje in ws:
+                if mensaje.type != WSMsgType.TEXT:
+                    continue
+                carga = json.loads(mensaje.data)
+                op, datos = carga.get('op'), carga.get('d')
+                if op == 1:
+                    await ws.send_str(json.dumps({'op': 11}))
+                elif op == 2:
+                    await self._identificar(ws, estado, datos)
+                elif op == 6:
+                    self._conexiones.append((ws, estado))
+                    await self._enviar_evento(ws, estado, 'RESUMED', {})
+                elif op == 8:
+                    await self._pedir_miembros(ws, estado, datos)
+        finally:
+            self._conexiones = [(otro, e) for otro, e in self._conexiones if otro is not ws]
+        return ws
+
+    async def _identificar(self, ws, estado, datos):
+        estado['intents'] = datos.get('intents', 0)
+        estado['shard'] = tuple(datos.get('shard') or (0, 1))
+        propios = [guild for guild_id, guild in self.guilds.items() if self._en_shard(guild_id, *estado['shard'])]
+        await self._enviar_evento(ws, estado, 'READY', {
+            'v': 10, 'user': self.bot, 'session_id': f'sesion-{self.nuevo_id()}', 'resume_gateway_url': self.url.replace('http', 'ws', 1) + '/gateway',
+            'guilds': [{'id': guild['id'], 'unavailable': True} for guild in propios],
+            'shard': list(estado['shard']), 'application': {'id': str(self.app_id), 'flags': 0},
+        })
+        self._conexiones.append((ws, estado))
+        for guild in propios:
+            await self._enviar_evento(ws, estado, 'GUILD_CREATE', self._guild_create(guild))
+
+    async def _pedir_miembros(self, ws, estado, datos):
+        guild = self.guilds[str(datos['guild_id'])]
+        if datos.get('user_ids'):
+            ids = [str(uid) for uid in datos['user_ids']]
+            encontrados = [guild['members'][uid] for uid in ids if uid in guild['members']]
+            no_encontrados = [uid for uid in ids if uid not in guild['members']]
+        else:
+            consulta = (datos.get('query') or '').lower()
+            encontrados = [m for m in guild['members'].values() if m['user']['username'].startswith(consulta)]
+            if datos.get('limit'):
+                encontrados = encontrados[:datos['limit']]
+            no_encontrados = []
+        trozos = [encontrados[i:i + 1000] for i in range(0, len(encontrados), 1000)] or [[]]
+        for indice, trozo in enumerate(trozos):
+            await self._enviar_evento(ws, estado, 'GUILD_MEMBERS_CHUNK', {
+                'guild_id': guild['id'], 'members': trozo, 'chunk_index': indice, 'chunk_count': len(trozos),
+                'not_found': no_encontrados, 'nonce': datos.get('nonce'),
+            })
+
+    # --- Interacciones ---
+
+    async def interaccion(self, guild_id, nombre, opciones=(), timeout=60.0):
+        """Invoca un comando de barra como el moderador del servidor.
+
+        ``opciones`` es una lista de (nombre, tipo, valor) con los tipos
+        TEXTO, ENTERO, BOOLEANO, USUARIO o ROL. Devuelve (segundos hasta la
+        respuesta final, contenido de esa respuesta).
+        """
+        guild = self.guilds[str(guild_id)]
+        resueltos = {'users': {}, 'members': {}, 'roles': {}}
+        datos_opciones = []
+        for nombre_opcion, tipo, valor in opciones:
+            datos_opciones.append({'name': nombre_opcion, 'type': tipo, 'value': str(valor) if tipo in (USUARIO, ROL) else valor})
+            if tipo == USUARIO:
+                miembro = guild['members'][str(valor)]
+                resueltos['users'][str(valor)] = miembro['user']
+                resueltos['members'][str(valor)] = {clave: dato for clave, dato in miembro.items() if clave != 'user'}
+            elif tipo == ROL:
+                resueltos['roles'][str(valor)] = guild['roles'][str(valor)]
+        return await self._interactuar(guild, nombre, 2, {'id': str(self.nuevo_id()), 'name': nombre, 'type': 1, 'options': datos_opciones, 'resolved': resueltos}, timeout)
+
+    async def pulsar(self, guild_id, custom_id, timeout=60.0):
+        """Pulsa como el moderador un botón con ``custom_id`` de un mensaje del bot.
+
+        Devuelve (segundos hasta la respuesta final, contenido de esa
+        respuesta, o el título del primer embed si no tiene contenido).
+        """
+        guild = self.guilds[str(guild_id)]
+        mensaje = self._mensaje(next(iter(guild['channels'])), {'components': [
+            {'type': 1, 'components': [{'type': 2, 'style': 1, 'label': custom_id, 'custom_id': custom_id}]},
+        ]})
+        return await self._interactuar(guild, custom_id, 3, {'custom_id': custom_id, 'component_type': 2}, timeout, mensaje=mensaje)
+
+    async def _interactuar(self, guild, nombre, tipo, datos, timeout, mensaje=None):
+        moderador = guild['members'][guild['moderador']]
+        canal_id = next(iter(guild['channels']))
+        token = f'token-{self.nuevo_id()}'
+        interaccion = Interaccion(self.nuevo_id(), token, nombre)
+        self._interacciones[token] = interaccion
+        evento = {
+            'id': str(interaccion.id), 'application_id': str(self.app_id), 'type': tipo, 'token': token, 'version': 1,
+            'guild_id': guild['id'], 'channel_id': canal_id, 'channel': guild['channels'][canal_id],
+            'member': {**moderador, 'permissions': str(discord.Permissions.all().value)},
+            'app_permissions': str(discord.Permissions.all().value), 'locale': 'es-ES', 'guild_locale': 'es-ES',
+            'data': datos,
+        }
+        if mensaje is not None:
+            evento['message'] = mensaje
+        await self.despachar(guild['id'], 'INTERACTION_CREATE', evento)
+        try:
+            return await asyncio.wait_for(asyncio.shield(interaccion.terminada), timeout)
+        finally:
+            self._interacciones.pop(token, None)
+
+    # --- API REST ---
+
+    @web.middleware
+    async def _limites(self, request, handler):
+        ruta = request.match_info.route.resource.canonical[len(API):] if request.match_info.route.resource else request.path
+        if not request.path.startswith(API):
+            return await handler(request)
+        if self.latencia or self.variacion:
+            await asyncio.sleep(max(self.latencia + random.uniform(-self.variacion, self.variacion), 0))
+        self.peticiones[f'{request.method} {ruta}'] += 1
+        if ruta in SIN_LIMITE:
+            return await handler(request)
+
+        limite, periodo = self.limites.get((request.method, ruta), LIMITE_PREDETERMINADO)
+        principales = tuple(request.match_info.get(nombre) for nombre in PARAMETROS_PRINCIPALES)
+        clave = (request.method, ruta, principales)
+        cubo = self._cubos.get(clave)
+        if cubo is None:
+            cubo = self._cubos[clave] = Cubo(limite, periodo)
+        permitida, espera = cubo.consumir()
+        cabeceras = {
+            'X-RateLimit-Limit': str(limite),
+            'X-RateLimit-Remaining': str(max(cubo.restantes, 0)),
+            'X-RateLimit-Reset': f'{cubo.reinicio:.3f}',
+            'X-RateLimit-Reset-After': f'{espera:.3f}',
+            'X-RateLimit-Bucket': f'{request.method}:{ruta}',
+            # Sin Via, discord.py toma un 429 por un bloqueo de Cloudflare y no lo reintenta
+            'Via': '1.1 google',
+        }
+        if permitida and self.probabilidad_429 and random.random() < self.probabilidad_429:
+            # 429 de un recurso compartido: no depende de lo que ha gastado el bot
+            permitida, espera = False, 0.5
+            cabeceras['X-RateLimit-Scope'] = 'shared'
+        if not permitida:
+            self.respuestas_429 += 1
+            cabeceras['Retry-After'] = f'{espera:.3f}'
+            cabeceras.setdefault('X-RateLimit-Scope', 'user')
+            return _json(
+                {'message': 'You are being rate limited.', 'retry_after': round(espera, 3), 'global': False},
+                status=429, headers=cabeceras,
+            )
+        respuesta = await handler(request)
+        respuesta.headers.update(cabeceras)
+        return respuesta
+
+    @staticmethod
+    async def _cuerpo(request):
+        """JSON de la petición, también en multipart (``payload_json``, cuando hay adjuntos)"""
+        if request.content_type.startswith('multipart/'):
+            formulario = await request.post()
+            return json.loads(formulario.get('payload_json') or '{}')
+        if not request.can_read_body:
+            return {}
+        return await request.json()
+
+    @staticmethod
+    def _error(estado, codigo, mensaje):
+        return _json({'message': mensaje, 'code': codigo}, status=estado)
+
+    def _guild(self, request):
+        return self.guilds.get(request.match_info['guild_id'])
+
+    def _canal(self, canal_id):
+        for guild in self.guilds.values():
+            if canal_id in guild['channels']:
+                return guild, guild['channels'][canal_id]
+        return None, None
+
+    def _mensaje(self, canal_id, datos, autor=None):
+        mensaje_id = self.nuevo_id()
+        guild, _ = self._canal(canal_id)
+        mensaje = {
+            'id': str(mensaje_id), 'channel_id': canal_id, 'author': autor or self.bot, 'content': datos.get('content') or '',
+            'timestamp': _fecha(), 'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+            'mention_roles': [], 'attachments': [], 'embeds': datos.get('embeds') or [], 'pinned': False, 'type': 0,
+            'flags': datos.get('flags') or 0, 'components': datos.get('components') or [], 'reactions': [],
+        }
+        if guild is not None:
+            mensaje['guild_id'] = guild['id']
+        return mensaje
+
+    async def _usuario_actual(self, request):
+        return _json(self.bot)
+
+    async def _aplicacion(self, request):
+        return _json({
+            'id': str(self.app_id), 'name': self.bot['username'], 'description': '', 'icon': None, 'bot_public': True,
+            'bot_require_code_grant': False, 'owner': self._usuario(self.nuevo_id(), 'propietario'), 'team': None,
+            'verify_key': '0' * 64, 'flags': 0, 'summary': '', 'rpc_origins': [],
+        })
+
+    async def _gateway_url(self, request):
+        url = str(request.url.with_path('/gateway').with_query(None)).replace('http', 'ws', 1)
+        return _json({
+            'url': url, 'shards': 1,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def _sincronizar_comandos(self, request):
+        comandos = [{**comando, 'id': str(self.nuevo_id()), 'application_id': str(self.app_id), 'version': '1'} for comando in await request.json()]
+        self.comandos[request.match_info.get('guild_id', 'global')] = comandos
+        return _json(comandos)
+
+    async def _leer_comandos(self, request):
+        return _json(self.comandos.get(request.match_info.get('guild_id', 'global'), []))
+
+    async def _leer_canal(self, request):
+        _, canal = self._canal(request.match_info['channel_id'])
+        return _json(canal) if canal else self._error(404, 10003, 'Unknown Channel')
+
+    async def _crear_mensaje(self, request):
+        canal_id = request.match_info['channel_id']
+        guild, canal = self._canal(canal_id)
+        if canal is None:
+            return self._error(404, 10003, 'Unknown Channel')
+        mensaje = self._mensaje(canal_id, await self._cuerpo(request))
+        self.mensajes[int(canal_id)][int(mensaje['id'])] = mensaje
+        canal['last_message_id'] = mensaje['id']
+        await self.despachar(guild['id'], 'MESSAGE_CREATE', {**mensaje, 'member': {k: v for k, v in guild['members'][self.bot['id']].items() if k != 'user'}}, intent=INTENT_MENSAJES)
+        return _json(mensaje)
+
+    async def _leer_mensajes(self, request):
+        canal_id = int(request.match_info['channel_id'])
+        if canal_id not in self.mensajes:
+            return self._error(404, 10003, 'Unknown Channel')
+        limite = min(int(request.query.get('limit', 50)), 100)
+        ids = sorted(self.mensajes[canal_id])
+        if 'after' in request.query:
+            ids = [i for i in ids if i > int(request.query['after'])][:limite]
+        else:
+            if 'before' in request.query:
+                ids = [i for i in ids if i < int(request.query['before'])]
+            ids = ids[-limite:][::-1]
+        return _json([self.mensajes[canal_id][i] for i in ids])
+
+    async def _leer_mensaje(self, request):
+        mensaje = self.mensajes.get(int(request.match_info['channel_id']), {}).get(int(request.match_info['message_id']))
+        return _json(mensaje) if mensaje else self._error(404, 10008, 'Unknown Message')
+
+    async def _reaccionar(self, request):
+        canal_id, mensaje_id = request.match_info['channel_id'], request.match_info['message_id']
+        mensaje = self.mensajes.get(int(canal_id), {}).get(int(mensaje_id))
+        if mensaje is None:
+            return self._error(404, 10008, 'Unknown Message')
+        emoji = request.match_info['emoji']
+        if not any(reaccion['emoji']['name'] == emoji for reaccion in mensaje['reactions']):
+            mensaje['reactions'].append({'emoji': {'id': None, 'name': emoji}, 'count': 1, 'me': True})
+        await self.despachar(mensaje['guild_id'], 'MESSAGE_REACTION_ADD', {
+            'user_id': self.bot['id'], 'channel_id': canal_id, 'message_id': mensaje_id, 'guild_id': mensaje['guild_id'],
+            'emoji': {'id': None, 'name': emoji}, 'type': 0, 'burst': False,
+        }, intent=INTENT_REACCIONES)
+        return web.Response(status=204)
+
+    async def _leer_miembro(self, request):
+        guild = self._guild(request)
+        miembro = guild and guild['members'].get(request.match_info['user_id'])
+        return _json(miembro) if miembro else self._error(404, 10007, 'Unknown Member')
+
+    async def _editar_miembro(self, request):
+        guild = self._guild(request)
+        miembro = guild and guild['members'].get(request.match_info['user_id'])
+        if miembro is None:
+            return self._error(404, 10007, 'Unknown Member')
+        cambios = await request.json()
+        if 'roles' in cambios:
+            desconocidos = [rol for rol in cambios['roles'] if str(rol) not in guild['roles']]
+            if desconocidos:
+                return self._error(400, 50035, f'Invalid Form Body: roles {desconocidos}')
+            miembro['roles'] = [str(rol) for rol in cambios['roles']]
+        if 'nick' in cambios:
+            miembro['nick'] = cambios['nick']
+        await self.despachar(guild['id'], 'GUILD_MEMBER_UPDATE', {**miembro, 'guild_id': guild['id']}, intent=INTENT_MIEMBROS)
+        return _json(miembro)
+
+    async def _responder_interaccion(self, request):
+        interaccion = self._interacciones.get(request.match_info['token'])
+        datos = await self._cuerpo(request)
+        if interaccion is not None:
+            if datos.get('type') == 5:
+                interaccion.diferida = True
+            elif datos.get('type') in (4, 7):
+                respuesta = datos.get('data') or {}
+                embeds = respuesta.get('embeds') or [{}]
+                interaccion.terminar(respuesta.get('content') or embeds[0].get('title') or '')
+        return web.Response(status=204)
+
+    async def _editar_original(self, request):
+        datos = await self._cuerpo(request)
+        interaccion = self._interacciones.get(request.match_info['token'])
+        if interaccion is not None:
+            interaccion.terminar(datos.get('content') or '')
+        return _json(self._mensaje(None, datos))
+
+    async def _seguimiento(self, request):
+        return _json(self._mensaje(None, await self._cuerpo(request)))
+
+    async def _no_implementada(self, request):
+        self.no_implementadas[f'{request.method} {request.path}'] += 1
+        log.warning('Ruta no simulada: %s %s', request.method, request.path)
+        return self._error(404, 0, '404: Not Found')
+
+    async def _control_interaccion(self, request):
+        """POST /_simulador/interacciones {"guild_id", "nombre", "opciones": [[nombre, tipo, valor], ...]}"""
+        datos = await request.json()
+        guild_id = datos.get('guild_id') or next(iter(self.guilds))
+        segundos, contenido = await self.interaccion(guild_id, datos['nombre'], [tuple(opcion) for opcion in datos.get('opciones', [])])
+        return _json({'segundos': segundos, 'contenido': contenido})
+
+    async def _control_estado(self, request):
+        return _json({
+            'peticiones': dict(self.peticiones), 'respuestas_429': self.respuestas_429, 'no_implementadas': dict(self.no_implementadas),
+            'servidores': {guild_id: {'miembros': self.socios(guild)} for guild_id, guild in self.guilds.items()},
+        })
+
+    def aplicacion(self):
+        app = web.Application(middlewares=[self._limites])
+        rutas = [
+            ('GET', '/users/@me', self._usuario_actual),
+            ('GET', '/oauth2/applications/@me', self._aplicacion),
+            ('GET', '/gateway', self._gateway_url),
+            ('GET', '/gateway/bot', self._gateway_url),
+            ('PUT', '/applications/{application_id}/commands', self._sincronizar_comandos),
+            ('GET', '/applications/{application_id}/commands', self._leer_comandos),
+            ('PUT', '/applications/{application_id}/guilds/{guild_id}/commands', self._sincronizar_comandos),
+            ('GET', '/applications/{application_id}/guilds/{guild_id}/commands', self._leer_comandos),
+            ('GET', '/channels/{channel_id}', self._leer_canal),
+            ('POST', '/channels/{channel_id}/messages', self._crear_mensaje),
+            ('GET', '/channels/{channel_id}/messages', self._leer_mensajes),
+            ('GET', '/channels/{channel_id}/messages/{message_id}', self._leer_mensaje),
+            ('PUT', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me', self._reaccionar),
+            ('GET', '/guilds/{guild_id}/members/{user_id}', self._leer_miembro),
+            ('PATCH', '/guilds/{guild_id}/members/{user_id}', self._editar_miembro),
+            ('POST', '/interactions/{interaction_id}/{token}/callback', self._responder_interaccion),
+            ('PATCH', '/webhooks/{webhook_id}/{token}/messages/@original', self._editar_original),
+            ('POST', '/webhooks/{webhook_id}/{token}', self._seguimiento),
+        ]
+        for metodo, ruta, manejador in rutas:
+            app.router.add_route(metodo, API + ruta, manejador)
+        app.router.add_get('/gateway', self._gateway)
+        app.router.add_post('/_simulador/interacciones', self._control_interaccion)
+        app.router.add_get('/_simulador/estado', self._control_estado)
+        app.router.add_route('*', API + '/{resto:.*}', self._no_implementada)
+        return app
+
+    async def iniciar(self, puerto=0, host='127.0.0.1'):
+        """Arranca el servidor y devuelve su URL base (con ``puerto=0`` se elige uno libre)"""
+        self._runner = web.AppRunner(self.aplicacion(), access_log=None)
+        await self._runner.setup()
+        sitio = web.TCPSite(self._runner, host, puerto)
+        await sitio.start()
+        puerto = sitio._server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{puerto}'
+        return self.url
+
+    async def detener(self):
+        for ws, _ in list(self._conexiones):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _servir(args):
+    simulador = Simulador(latencia=args.latencia, variacion=args.variacion, probabilidad_429=args.probabilidad_429)
+    for i in range(args.servidores):
+        simulador.crear_guild(f'Servidor simulado {i + 1}', miembros=args.miembros)
+    url = await simulador.iniciar(args.puerto)
+    print(f'Simulador de Discord en {url} (DISCORD_API={url})')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulador.detener()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sustituto local de Discord (gateway y API REST)')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--servidores', type=int, default=1)
+    parser.add_argument('--miembros', type=int, default=100)
+    parser.add_argument('--latencia', type=float, default=0.05, help='latencia media de cada petición REST (s)')
+    parser.add_argument('--variacion', type=float, default=0.02, help='variación máxima de la latencia (s)')
+    parser.add_argument('--probabilidad-429', type=float, default=0.0, help='probabilidad de un 429 compartido en cada petición')
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_servir(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
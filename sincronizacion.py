@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import time
+
+import discord
+
+import almacen
+
+log = logging.getLogger(__name__)
+
+# Modos de sincronización automática al arrancar
+GLOBAL = 'global'      # Comandos globales (tardan en propagarse)
+SERVIDOR = 'servidor'  # Copia de los comandos en cada servidor (se ven al momento)
+NINGUNO = 'no'         # Solo con !sync
+
+
+def huella(comandos):
+    """Hash estable de una lista de comandos (el mismo payload que envía ``tree.sync``)"""
+    payload = sorted((comando.to_dict() for comando in comandos), key=lambda datos: (datos.get('type', 1), datos['name']))
+    texto = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class SincronizadorComandos:
+    """Sincroniza el árbol de comandos solo cuando ha cambiado.
+
+    Guarda en SQLite el hash del último árbol sincronizado de cada ámbito
+    (global o un servidor) y al arrancar solo llama a ``tree.sync`` para
+    los ámbitos cuyo hash no coincide, así que un reinicio sin cambios en
+    los comandos no hace ninguna petición.
+    """
+
+    def __init__(self, tree, con=None):
+        self.tree = tree
+        self._con = con
+        self._tabla_creada = False
+
+    @property
+    def con(self):
+        if self._con is None:
+            self._con = almacen.conexion()
+        if not self._tabla_creada:
+            self._tabla_creada = True
+            self._con.execute(
+                'CREATE TABLE IF NOT EXISTS comandos_sincronizados ('
+                ' ambito TEXT PRIMARY KEY,'
+                ' huella TEXT NOT NULL,'
+                ' fecha REAL NOT NULL)'
+            )
+        return self._con
+
+    def ultima_huella(self, ambito):
+        fila = self.con.execute('SELECT huella FROM comandos_sincronizados WHERE ambito = ?', (ambito,)).fetchone()
+        return fila['huella'] if fila else None
+
+    async def sincronizar(self, guild=None, forzar=False):
+        """Sincroniza un ámbito si su árbol ha cambiado (o si se fuerza).
+
+        Devuelve (sincronizado, número de comandos).
+        """
+        if guild is not None:
+            self.tree.copy_global_to(guild=guild)
+        comandos = self.tree.get_commands(guild=guild)
+        ambito = str(guild.id) if guild is not None else GLOBAL
+        nueva = huella(comandos)
+        if not forzar and nueva == self.ultima_huella(ambito):
+            return False, len(comandos)
+        sincronizados = await self.tree.sync(guild=guild)
+        self.con.execute(
+            'INSERT OR REPLACE INTO comandos_sincronizados (ambito, huella, fecha) VALUES (?, ?, ?)',
+            (ambito, nueva, time.time()),
+        )
+        return True, len(sincronizados)
+
+    async def sincronizar_inicio(self, modo, guilds):
+        """Sincronización automática al arrancar según el modo"""
+        if modo == GLOBAL:
+            ambitos = [None]
+        elif modo == SERVIDOR:
+            ambitos = list(guilds)
+        else:
+            return
+        for guild in ambitos:
+            nombre = guild.name if guild is not None else GLOBAL
+            try:
+                sincronizado, total = await self.sincronizar(guild)
+            except discord.HTTPException as e:
+                log.error("Error al sincronizar los comandos (%s): %s", nombre, e, extra={'guild': getattr(guild, 'id', None)})
+                continue
+            if sincronizado:
+                log.info("Comandos sincronizados (%s): %d", nombre, total, extra={'guild': getattr(guild, 'id', None)})
+            else:
+                log.debug("Comandos sin cambios (%s), no se sincronizan", nombre, extra={'guild': getattr(guild, 'id', None)})
@@ -0,0 +1,80 @@
+import json
+
+import discord
+
+import componentes
+import grabacion
+
+SANCIONADO = 412345678901234567
+AUTORIZA = 498765432109876543
+EJECUTA = 487654321098765432
+
+
+def _anuncio_sancion():
+    """MESSAGE_CREATE de un anuncio de sanción como los que publica el bot"""
+    embed = discord.Embed(title="📛 Sanción Aplicada", description="**Sanción:** <@&900000000000000001>", color=discord.Color.red())
+    embed.add_field(name="👷 Empleado sancionado:", value=f"<@{SANCIONADO}> (`roblox_juan#0` - ID: `{SANCIONADO}`)", inline=False)
+    embed.add_field(name="⚠️ Acumulación de strike:", value="**3** strikes", inline=False)
+    embed.add_field(name="💬 Razón:", value="Insultos a Juan Pérez en el canal general", inline=False)
+    embed.add_field(name="✅ Autorizado por:", value=f"<@{AUTORIZA}>", inline=False)
+    embed.set_footer(text="Sanción aplicada por Moderadora Ana", icon_url=f"https://cdn.discordapp.com/avatars/{EJECUTA}/abc.png")
+    embed.set_author(name="Moderadora Ana", icon_url=f"https://cdn.discordapp.com/avatars/{EJECUTA}/abc.png")
+    embed.timestamp = discord.utils.utcnow()
+    return {
+        'id': '1200000000000000000',
+        'channel_id': '1100000000000000000',
+        'guild_id': '1000000000000000000',
+        'author': {'id': '1300000000000000000', 'username': 'BotRRHH', 'discriminator': '0', 'global_name': None, 'avatar': 'abc', 'bot': True},
+        'content': f"<@{SANCIONADO}>",
+        'mentions': [{'id': str(SANCIONADO), 'username': 'roblox_juan', 'discriminator': '0', 'global_name': 'Juan', 'avatar': None}],
+        'embeds': [embed.to_dict()],
+        'attachments': [{
+            'id': '1400000000000000000', 'filename': 'pruebas-juan-perez.png', 'size': 1024, 'content_type': 'image/png',
+            'url': 'https://cdn.discordapp.com/attachments/1/2/pruebas-juan-perez.png',
+            'proxy_url': 'https://media.discordapp.net/attachments/1/2/pruebas-juan-perez.png',
+        }],
+    }
+
+
+def test_limpiar_anuncio_sin_datos_personales():
+    anonimizador = grabacion.Anonimizador(sal='prueba')
+    anuncio = _anuncio_sancion()
+    limpio = anonimizador.limpiar(anuncio)
+    texto = json.dumps(limpio, ensure_ascii=False)
+
+    for dato in (SANCIONADO, AUTORIZA, EJECUTA):
+        assert str(dato) not in texto
+    for dato in ('roblox_juan', 'Juan', 'Pérez', 'Insultos', 'Moderadora Ana', 'pruebas-juan-perez', 'cdn.discordapp.com'):
+        assert dato not in texto
+
+    embed = limpio['embeds'][0]
+    assert embed['type'] == 'rich'
+    assert embed['timestamp'] == anuncio['embeds'][0]['timestamp']
+    assert len(embed['fields']) == 4
+    adjunto = limpio['attachments'][0]
+    assert adjunto['id'] == '1400000000000000000'
+    assert adjunto['content_type'] == 'image/png'
+    # Los IDs que no son de usuario se conservan para la repetición
+    assert limpio['channel_id'] == '1100000000000000000'
+
+
+def test_menciones_con_id_seudonimo():
+    anonimizador = grabacion.Anonimizador(sal='prueba')
+    limpio = anonimizador.limpiar({'custom_id': 'x', 'label': f"Asignar a <@!{SANCIONADO}> y <@&900000000000000001>"})
+
+    assert limpio['label'] == f"Asignar a <@{anonimizador.id(SANCIONADO)}> y <@&900000000000000001>"
+
+
+def test_custom_id_con_id_de_usuario_seudonimo():
+    componentes.accion('prueba-rol', usuarios=(0,))(lambda interaction, usuario_id, rol_id: None)
+    anonimizador = grabacion.Anonimizador(sal='prueba')
+    limpio = anonimizador.limpiar({'data': {'custom_id': componentes.custom_id('prueba-rol', SANCIONADO, 900)}})
+
+    assert limpio['data']['custom_id'] == f"prueba-rol:{anonimizador.id(SANCIONADO)}:900"
+
+
+def test_custom_id_de_accion_desconocida_sin_ids_originales():
+    anonimizador = grabacion.Anonimizador(sal='prueba')
+    limpio = anonimizador.limpiar({'components': [{'type': 1, 'components': [{'type': 2, 'custom_id': f"otra:{SANCIONADO}:900"}]}]})
+
+    assert str(SANCIONADO) not in json.dumps(limpio)
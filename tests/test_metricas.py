@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+from discord.ext import commands
+
+import metricas
+
+
+def _lineas(histograma):
+    return dict(linea.rsplit(' ', 1) for linea in histograma.exponer() if not linea.startswith('#'))
+
+
+def test_histograma_valor_por_encima_del_ultimo_limite():
+    histograma = metricas.Histograma('prueba', 'Prueba', ('comando',), limites=(1.0, 30.0))
+    histograma.observar(0.5, 'x')
+    histograma.observar(100.0, 'x')
+
+    lineas = _lineas(histograma)
+    assert lineas['prueba_bucket{comando="x",le="1.0"}'] == '1'
+    assert lineas['prueba_bucket{comando="x",le="30.0"}'] == '1'
+    assert lineas['prueba_bucket{comando="x",le="+Inf"}'] == '2'
+    assert float(lineas['prueba_sum{comando="x"}']) == 100.5
+    assert lineas['prueba_count{comando="x"}'] == '2'
+
+
+def test_histograma_valor_en_el_limite():
+    histograma = metricas.Histograma('prueba', 'Prueba', limites=(1.0, 30.0))
+    histograma.observar(30.0)
+
+    lineas = _lineas(histograma)
+    assert lineas['prueba_bucket{le="1.0"}'] == '0'
+    assert lineas['prueba_bucket{le="30.0"}'] == '1'
+    assert float(lineas['prueba_sum']) == 30.0
+
+
+def test_comando_que_responde_a_su_error_cuenta_como_fallo():
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.default())
+    metricas.registrar(bot)
+    ctx = SimpleNamespace(command=SimpleNamespace(qualified_name='prueba-fallo'), message=SimpleNamespace(created_at=discord.utils.utcnow()))
+
+    metricas.fallo(ctx, ValueError('x'))
+    for listener in bot.extra_events['on_command_completion']:
+        asyncio.run(listener(ctx))
+
+    lineas = dict(linea.rsplit(' ', 1) for linea in metricas.comandos.exponer() if 'prueba-fallo' in linea)
+    assert lineas == {'bot_comandos_total{comando="prueba-fallo",tipo="prefijo",resultado="error",error="ValueError"}': '1'}
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+import discord
+from dotenv import load_dotenv
+
+import asistencia
+import bitacora
+import metricas
+from buzon import Buzon
+from cola import ColaTrabajos, ErrorTrabajo, Trabajador
+from historial import ImportadorHistorial
+from sanciones import RegistroSanciones
+
+log = logging.getLogger('trabajador')
+
+# Modos del proceso del bot (MODO_PROCESO)
+COMPLETO = 'completo'  # Un solo proceso hace todo
+GATEWAY = 'gateway'    # Solo gateway e interacciones; el trabajo REST pesado lo hacen los procesos de trabajos
+
+# Tipos de trabajo que el proceso del gateway deja en la cola
+ACTIVIDAD = 'actividad'
+HISTORIAL = 'historial'
+EDITAR_MIEMBRO = 'editar-miembro'
+
+# Segundos que se espera a los trabajos en curso al recibir SIGTERM
+ESPERA_DRENAJE = float(os.getenv('ESPERA_DRENAJE', '30'))
+# Cada cuánto se mira la bandeja de salida (los anuncios los encola otro proceso)
+SONDEO_BUZON = 1.0
+
+
+class ProcesoTrabajos:
+    """Proceso que hace el trabajo REST pesado fuera del proceso del gateway.
+
+    No abre conexión con el gateway: solo inicia sesión en la API REST,
+    publica los anuncios de la bandeja de salida y ejecuta los trabajos de
+    la cola (mensaje de actividad, importación del historial y ediciones de
+    miembros de los comandos masivos). Se pueden lanzar varios con
+    ``TRABAJADOR_ID``/``TRABAJADORES``: la cola de trabajos se reparte sola y
+    los anuncios se reparten por servidor.
+    """
+
+    def __init__(self, trabajador_id=0, trabajadores=1, concurrencia=4):
+        self.client = discord.Client(intents=discord.Intents.none(), http_trace=metricas.traza_http())
+        self.cola = ColaTrabajos()
+        self.importador = ImportadorHistorial(
+            registro_sanciones=RegistroSanciones(dias_caducidad=int(os.getenv('DIAS_CADUCIDAD_STRIKES', '0')))
+        )
+        self.asistencia = asistencia.RegistroAsistencia()
+        self.buzon = Buzon(
+            self.client,
+            trabajadores=int(os.getenv('TRABAJADORES_BUZON', '3')),
+            filtro=lambda guild_id: (guild_id or 0) % trabajadores == trabajador_id,
+            sondeo=SONDEO_BUZON,
+        )
+        self.trabajador = Trabajador(
+            self.cola,
+            {
+                ACTIVIDAD: self.enviar_actividad,
+                HISTORIAL: self.importar_historial,
+                EDITAR_MIEMBRO: self.editar_miembro,
+            },
+            concurrencia=concurrencia,
+        )
+        self._parando = asyncio.Event()
+
+    # --- Manejadores ---
+
+    async def enviar_actividad(self, datos):
+        """Publica el mensaje de actividad y le añade la reacción de asistencia"""
+        canal = self.client.get_partial_messageable(datos['canal_id'], guild_id=datos['guild_id'])
+        mensaje = await canal.send(content=datos['contenido'])
+        # Se guarda aquí y no solo en el gateway: si este dejó de esperar, la asistencia del día no se pierde
+        if 'dia' in datos:
+            self.asistencia.guardar_mensaje(datos['guild_id'], datos['canal_id'], mensaje.id, datos['dia'])
+        try:
+            await mensaje.add_reaction(asistencia.EMOJI_ASISTENCIA)
+        except discord.HTTPException as e:
+            log.warning("No se pudo añadir la reacción: %s", e, extra={'guild': datos['guild_id']})
+        return {'mensaje_id': mensaje.id}
+
+    async def importar_historial(self, datos):
+        """Importa el historial de los canales de uno en uno desde su punto de control"""
+        totales = {}
+        for canal_id in datos['canales']:
+            canal = await self.client.fetch_channel(canal_id)
+            totales[canal_id] = await self.importador.importar_canal(canal)
+            log.info("Historial de '%s' importado: %d registros nuevos", canal.name, totales[canal_id], extra={'guild': canal.guild.id, 'canal': canal.id})
+        return totales
+
+    async def editar_miembro(self, datos):
+        """Un único PATCH del miembro con los roles y el apodo ya calculados por el gateway (sin reintentos si lleva roles)"""
+        campos = {}
+        if 'roles' in datos:
+            campos['roles'] = [str(rol_id) for rol_id in datos['roles']]
+        if 'nick' in datos:
+            campos['nick'] = datos['nick']
+        if not campos:
+            raise ErrorTrabajo("Edición sin cambios")
+        try:
+            await self.client.http.edit_member(datos['guild_id'], datos['miembro_id'], reason=datos.get('reason'), **campos)
+        except (discord.Forbidden, discord.NotFound):
+            raise
+        except Exception as e:
+            # La lista de roles se calculó al encolar: aplicarla más tarde podría borrar cambios posteriores
+            raise ErrorTrabajo(str(e), reintentable='roles' not in campos)
+        return True
+
+    # --- Ciclo de vida ---
+
+    def estado_salud(self):
+        ok = self.trabajador.activo
+        return ok, {
+            'trabajos_pendientes': self.cola.pendientes(),
+            'buzon_pendientes': self.buzon.pendientes(),
+            'drenando': self._parando.is_set(),
+        }
+
+    async def ejecutar(self, token, puerto_metricas=None):
+        bucle = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            bucle.add_signal_handler(senal, self._parando.set)
+
+        servidor_metricas = metricas.ServidorMetricas(self.estado_salud, puerto_metricas) if puerto_metricas else None
+        metricas.indicador('trabajador_cola_pendientes', 'Trabajos pendientes o en curso en la cola', self.cola.pendientes)
+
+        await self.client.login(token)
+        self.asistencia.crear_tablas()
+        try:
+            if servidor_metricas is not None:
+                await servidor_metricas.iniciar()
+            self.buzon.iniciar()
+            self.trabajador.iniciar()
+            log.info('Proceso de trabajos iniciado (%s)', self.trabajador.propietario)
+            await self._parando.wait()
+
+            # Drenaje: no se reclama nada nuevo y se espera a lo que está en curso
+            log.info('Drenando el proceso de trabajos (hasta %.0fs)', ESPERA_DRENAJE)
+            await asyncio.gather(self.trabajador.drenar(ESPERA_DRENAJE), self.buzon.drenar(ESPERA_DRENAJE))
+        finally:
+            if servidor_metricas is not None:
+                await servidor_metricas.detener()
+            await self.client.close()
+        log.info('Proceso de trabajos detenido')
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    bitacora.configurar()
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        log.critical("No se encontró el token de Discord en las variables de entorno")
+        bitacora.detener()
+        sys.exit(1)
+    proceso = ProcesoTrabajos(
+        trabajador_id=int(os.getenv('TRABAJADOR_ID', '0')),
+        trabajadores=int(os.getenv('TRABAJADORES', '1')),
+        concurrencia=int(os.getenv('CONCURRENCIA_TRABAJOS', '4')),
+    )
+    puerto = os.getenv('PUERTO_METRICAS')
+    try:
+        asyncio.run(proceso.ejecutar(token, int(puerto) if puerto else None))
+    finally:
+        bitacora.detener()
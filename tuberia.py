@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import discord
+
+import metricas
+
+log = logging.getLogger(__name__)
+
+
+class ErrorComando(Exception):
+    """Error con un mensaje listo para mostrar al moderador"""
+
+
+@dataclass
+class Trabajo:
+    """Ejecución en segundo plano de un comando, con el tiempo de cada etapa"""
+    comando: str
+    guild_id: int
+    usuario_id: int
+    etapas: list = field(default_factory=list)  # (nombre, milisegundos)
+    estado: str = 'en_curso'
+    resultado: str = ''
+    error: str = ''  # Tipo de la excepción si el estado es 'error'
+
+    def medir(self, nombre, inicio):
+        self.etapas.append((nombre, (time.perf_counter() - inicio) * 1000))
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms in self.etapas)
+
+    def tiempos(self):
+        return ' · '.join(f'{nombre} {ms:.0f}ms' for nombre, ms in self.etapas)
+
+
+@dataclass
+class Operacion:
+    """Ejecución de un comando registrada con su clave de idempotencia"""
+    trabajo: Trabajo
+    terminada: asyncio.Event = field(default_factory=asyncio.Event)
+    caduca: float = None  # Se fija al terminar bien
+
+
+# Trabajos en curso (se guardan referencias para que no los recoja el GC)
+trabajos_activos = set()
+# Últimos trabajos terminados, para consulta
+historial = deque(maxlen=200)
+# Operaciones en curso o terminadas hace poco, por clave de idempotencia
+operaciones = {}
+# Segundos durante los que repetir un comando devuelve el resultado del original
+VENTANA_DUPLICADOS = 120.0
+AVISO_DUPLICADO = "ℹ️ Este comando ya se había ejecutado con los mismos datos; no se ha repetido"
+AVISO_DUPLICADO_FALLIDO = "ℹ️ Este comando ya se estaba ejecutando con los mismos datos y no se aplicó; puedes volver a lanzarlo"
+
+
+def clave(comando, actor, objetivo, *argumentos):
+    """Clave de idempotencia de un comando.
+
+    Dos ejecuciones son la misma operación si las lanza el mismo moderador
+    sobre el mismo miembro con los mismos argumentos. Los textos se comparan
+    sin distinguir mayúsculas ni espacios, y los objetos de Discord por ID.
+    """
+    return (comando, _normalizar(actor), _normalizar(objetivo), *(_normalizar(argumento) for argumento in argumentos))
+
+
+def _normalizar(valor):
+    if isinstance(valor, str):
+        return ' '.join(valor.split()).casefold()
+    return getattr(valor, 'id', valor)
+
+
+def _purgar():
+    ahora = time.monotonic()
+    for caducada in [clave for clave, operacion in operaciones.items() if operacion.caduca is not None and operacion.caduca <= ahora]:
+        del operaciones[caducada]
+
+
+def _terminada(clave, operacion):
+    operacion.terminada.set()
+    # Solo se recuerdan las operaciones que se aplicaron: si falló, repetirla es un reintento legítimo
+    if operacion.trabajo.estado == 'ok':
+        operacion.caduca = time.monotonic() + VENTANA_DUPLICADOS
+    elif operaciones.get(clave) is operacion:
+        del operaciones[clave]
+
+
+def _respuesta_duplicado(trabajo):
+    """Resultado del original para un duplicado; si no se aplicó, su error y que se puede repetir"""
+    if trabajo.estado == 'ok':
+        return f"{trabajo.resultado}\n{AVISO_DUPLICADO}"
+    return f"{trabajo.resultado or '❌ El comando no llegó a completarse'}\n{AVISO_DUPLICADO_FALLIDO}"
+
+
+async def responder_duplicado(interaction, clave):
+    """Si ``clave`` ya está en curso o se aplicó hace poco, responde con su resultado.
+
+    Devuelve True si la interacción era un duplicado y ya se ha respondido.
+    Los comandos que comprueban el estado del miembro antes de ejecutar (p.
+    ej. si ya tiene el rol) lo llaman antes, para que el duplicado reciba el
+    resultado del original y no un error.
+    """
+    _purgar()
+    operacion = operaciones.get((interaction.guild_id, *clave))
+    if operacion is None:
+        return False
+
+    trabajo = operacion.trabajo
+    original = 'terminado' if operacion.terminada.is_set() else 'en_curso'
+    metricas.duplicado(trabajo.comando, original)
+    log.info("/%s duplicado (original %s), no se repite", trabajo.comando, original, extra=_campos(trabajo))
+    if operacion.terminada.is_set():
+        await interaction.response.send_message(_respuesta_duplicado(trabajo), ephemeral=True)
+        return True
+
+    # Se une al original: misma respuesta cuando termine, sin repetir cambios ni anuncios
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    task = asyncio.create_task(_esperar_original(interaction, operacion), name=f'duplicado:{trabajo.comando}')
+    trabajos_activos.add(task)
+    task.add_done_callback(trabajos_activos.discard)
+    return True
+
+
+async def _esperar_original(interaction, operacion):
+    await operacion.terminada.wait()
+    try:
+        await interaction.edit_original_response(content=_respuesta_duplicado(operacion.trabajo))
+    except discord.HTTPException as e:
+        log.error("Error al editar la respuesta de /%s: %s", operacion.trabajo.comando, e, extra=_campos(operacion.trabajo))
+
+
+async def ejecutar(interaction, comando, mutacion, *anuncios, mensaje_forbidden="❌ No tengo permisos para gestionar roles", clave=None):
+    """Difiere la interacción y ejecuta las etapas del comando en segundo plano.
+
+    Se responde a Discord de inmediato (``defer``) para no superar el plazo de
+    3 segundos; después se ejecuta ``mutacion`` (cambios sobre el miembro,
+    devuelve el mensaje de confirmación) y cada corrutina de ``anuncios``, y
+    al final se edita la respuesta diferida con el resultado.
+
+    Con ``clave`` (ver :func:`clave`), si la misma operación ya está en curso
+    o se aplicó hace menos de ``VENTANA_DUPLICADOS`` segundos, no se repite:
+    se responde con el resultado de la original.
+    """
+    if clave is not None and await responder_duplicado(interaction, clave):
+        return None
+
+    trabajo = Trabajo(comando, interaction.guild_id, interaction.user.id)
+    operacion = None
+    if clave is not None:
+        # Se registra antes del primer await: un duplicado que llegue mientras tanto ya la encuentra
+        clave = (interaction.guild_id, *clave)
+        operacion = operaciones[clave] = Operacion(trabajo)
+    inicio = time.perf_counter()
+    try:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+    except BaseException:
+        if operacion is not None:
+            _terminada(clave, operacion)
+        raise
+    trabajo.medir('diferir', inicio)
+    # El resultado real se conoce al terminar las etapas, no al diferir
+    metricas.en_segundo_plano(interaction)
+
+    task = asyncio.create_task(_ejecutar_etapas(interaction, trabajo, mutacion, anuncios, mensaje_forbidden), name=f'comando:{comando}')
+    trabajos_activos.add(task)
+    task.add_done_callback(trabajos_activos.discard)
+    if operacion is not None:
+        task.add_done_callback(lambda _: _terminada(clave, operacion))
+    return trabajo
+
+
+async def _ejecutar_etapas(interaction, trabajo, mutacion, anuncios, mensaje_forbidden):
+    inicio = time.perf_counter()
+    try:
+        trabajo.resultado = await mutacion()
+        trabajo.estado = 'ok'
+    except ErrorComando as e:
+        trabajo.resultado = str(e)
+        trabajo.estado = 'rechazado'
+    except discord.Forbidden as e:
+        trabajo.resultado = mensaje_forbidden
+        trabajo.estado = 'error'
+        trabajo.error = type(e).__name__
+    except Exception as e:
+        log.exception("Error en /%s: %s", trabajo.comando, e, extra=_campos(trabajo))
+        trabajo.resultado = f"❌ Error: {str(e)}"
+        trabajo.estado = 'error'
+        trabajo.error = type(e).__name__
+    trabajo.medir('mutacion', inicio)
+
+    # Los anuncios solo se publican si la mutación se aplicó
+    if trabajo.estado == 'ok':
+        for anuncio in anuncios:
+            inicio = time.perf_counter()
+            try:
+                await anuncio()
+            except Exception as e:
+                log.error("Error al enviar mensaje al canal: %s", e, extra=_campos(trabajo))
+                trabajo.resultado += "\n⚠️ No se pudo publicar el anuncio en el canal"
+            trabajo.medir('anuncio', inicio)
+
+    inicio = time.perf_counter()
+    try:
+        await interaction.edit_original_response(content=trabajo.resultado)
+    except discord.HTTPException as e:
+        log.error("Error al editar la respuesta de /%s: %s", trabajo.comando, e, extra=_campos(trabajo))
+    trabajo.medir('respuesta', inicio)
+
+    historial.append(trabajo)
+    metricas.trabajo(trabajo.comando, trabajo.estado, trabajo.total_ms / 1000)
+    metricas.comando(trabajo.comando, 'slash', interaction.created_at, trabajo.estado, trabajo.error)
+    log.info(
+        "/%s (%s) %.0fms: %s", trabajo.comando, trabajo.estado, trabajo.total_ms, trabajo.tiempos(),
+        extra={**_campos(trabajo), 'latencia_ms': round(trabajo.total_ms)},
+    )
+
+
+def _campos(trabajo):
+    return {'comando': trabajo.comando, 'guild': trabajo.guild_id, 'miembro': trabajo.usuario_id}
+
+
+async def esperar_trabajos(timeout=None):
+    """Espera a que terminen los trabajos en curso (p. ej. antes de apagar)"""
+    if trabajos_activos:
+        await asyncio.wait(list(trabajos_activos), timeout=timeout)